@@ -1,30 +1,71 @@
 import os
-import zipfile
 import time  # Import time module
 import json
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import math
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import numpy as np
 import requests
 import yt_dlp
-import zipstream
 from flask import Flask, request, jsonify, Response, stream_with_context
 
-# Optional heavy imports for key detection (loaded lazily in the endpoint)
-import sqlite3
-
 from lib.db import (
     get_db,
     init_db as init_db_lib,
+    connect as connect_db,
     close_db as close_db_lib,
+    writer as db_writer,
     MP3_DIR,
-    DB_PATH,
 )
 from lib.utils import sanitize_filename
-from lib.analysis import perform_full_analysis
+from lib.analysis import TIERS as ANALYSIS_TIERS, merge_analysis, normalize_features
+from lib.analysis_pool import analysis_pool
+from lib.cues import load_cues, store_analysis as store_video_analysis
+from lib.playlists import upsert_playlist as save_playlist
+from lib.audio_store import (
+    content_hash,
+    set_pinned,
+    start_maintenance as start_audio_store_maintenance,
+    store_mp3,
+    touch as touch_mp3,
+)
+from lib.file_index import reconciler as file_reconciler, resolve_mp3s
+from lib.async_proxy import async_proxy
+from lib.http_fetch import STREAM_SEGMENT_SIZE, RangedSource
+from lib.analysis_cache import (
+    lookup as lookup_cached_analysis,
+    store as store_cached_analysis,
+    reanalyzer,
+    replaceable_features,
+)
+from lib.video_query import (
+    VIDEO_COLUMNS,
+    build_video_query,
+    decode_cursor as decode_video_cursor,
+    encode_cursor as encode_video_cursor,
+)
+from lib.peaks import build_peaks, build_status, choose_level, ready_peaks
+from lib.file_serving import file_etag, send_bytes, send_file
+from lib.zip_archive import StoredZip, ZipStream, archive_entries, text_entry
+from lib.extract_cache import init_extract_cache, invalidate as invalidate_extraction
+from lib.transcode import ffmpeg_available, get_or_start as start_transcode
 from lib.youtube import (
+    describe_download_error,
     get_video_info,
+    get_stream_entry,
     download_audio as download_audio_lib,
+    info_pool,
+    download_pool,
+)
+from lib.ytdl_pool import warm_pools_async
+from lib.progress import ItemProgress, bus as progress_bus
+from lib.jobs import (
+    convert_item,
+    create_job,
+    get_job,
+    completed_files,
+    job_runner,
 )
 
 app = Flask(__name__)
@@ -47,7 +88,6 @@ app.json_encoder = NumpyEncoder
 
 
 app.teardown_appcontext(close_db_lib)
-init_db_lib()
 
 
 # Define the route for downloading audio
@@ -82,37 +122,39 @@ def download_audio():
             f"[Flask] Found format URL for {file_ext}, estimated size: {content_length_est}"
         )
 
-        req = requests.get(
-            download_url,
-            stream=True,
-            headers=headers,
-            allow_redirects=True,
-            timeout=120,
-        )
-        if req.status_code >= 400:
+        source = RangedSource(download_url, headers, STREAM_SEGMENT_SIZE)
+        if source.status in (403, 410):
+            # The signed URL (possibly from the extraction cache) was rejected.
             print(
-                f"[Flask] First attempt failed: {req.status_code} {req.reason}. Retrying without Range header..."
+                f"[Flask] Stream URL rejected ({source.status}). Re-extracting {video_id}..."
             )
-            headers.pop("Range", None)
-            req = requests.get(
+            source.close()
+            invalidate_extraction(video_id)
+            (
                 download_url,
-                stream=True,
-                headers=headers,
-                allow_redirects=True,
-                timeout=120,
-            )
-        req.raise_for_status()
+                file_ext,
+                content_type,
+                content_length_est,
+                headers,
+            ) = get_video_info(video_url, use_cache=False)
+            if not download_url:
+                return (
+                    jsonify({"error": "Could not find a suitable audio format URL."}),
+                    500,
+                )
+            source = RangedSource(download_url, headers, STREAM_SEGMENT_SIZE)
+        source.raise_for_status()
 
-        final_content_length = req.headers.get("Content-Length") or content_length_est
+        final_content_length = source.size or content_length_est
         print(
-            f"[Flask] Streaming {final_content_length} bytes... (status={req.status_code})"
+            f"[Flask] Streaming {final_content_length} bytes... (ranged={source.ranged})"
         )
 
         t_before_stream = time.time()
 
         def generate():
             bytes_yielded = 0
-            for chunk in req.iter_content(chunk_size=1024 * 1024):
+            for chunk in source.iter_bytes():
                 bytes_yielded += len(chunk)
                 yield chunk
             t_after_stream = time.time()
@@ -128,9 +170,7 @@ def download_audio():
             f'attachment; filename="audio.{file_ext}"'
         )
         if final_content_length and str(final_content_length) != "0":
-            response.headers["Content-Length"] = final_content_length
-        if req.headers.get("Accept-Ranges"):
-            response.headers["Accept-Ranges"] = req.headers.get("Accept-Ranges")
+            response.headers["Content-Length"] = str(final_content_length)
         response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
         response.headers["Pragma"] = "no-cache"
         response.headers["Expires"] = "0"
@@ -139,21 +179,7 @@ def download_audio():
 
     except yt_dlp.utils.DownloadError as e:
         print(f"[Flask] yt-dlp download error: {e}")
-        error_message = str(e)
-        status_code = 500
-        public_error_message = "yt-dlp download error"
-        if "video is unavailable" in error_message.lower():
-            status_code = 404
-            public_error_message = "Video unavailable."
-        elif "private video" in error_message.lower():
-            status_code = 403
-            public_error_message = "Video is private."
-        elif "age restricted" in error_message.lower():
-            status_code = 403
-            public_error_message = "Video is age-restricted and requires login."
-        elif "429" in error_message or "too many requests" in error_message.lower():
-            status_code = 429
-            public_error_message = "Rate limited by YouTube. Please try again later."
+        status_code, public_error_message = describe_download_error(e)
         return jsonify({"error": public_error_message}), status_code
 
     except requests.exceptions.RequestException as e:
@@ -180,144 +206,208 @@ def root():
 def list_playlists():
     db = get_db()
     rows = db.execute(
-        "SELECT id, url, title, channel, thumbnail, video_count, created_at, updated_at FROM playlists ORDER BY created_at DESC"
+        "SELECT id, url, title, channel, thumbnail, video_count, pinned, created_at, updated_at FROM playlists ORDER BY created_at DESC"
     ).fetchall()
     return jsonify({"playlists": [dict(r) for r in rows]})
 
 
 @app.route("/playlists", methods=["POST"])
 def upsert_playlist():
+    """
+    Save a playlist and its videos.
+    Body: {"id", "url", "title", "channel", "thumbnail", "videos": [...]}
+    Only videos that were added, changed or dropped from the playlist are
+    written. Returns {"ok": true, "inserted", "updated", "removed", "unchanged"}
+    """
     data = request.get_json(silent=True) or {}
     playlist_id = (data.get("id") or "").strip()
     url = (data.get("url") or "").strip()
-    title = (data.get("title") or "").strip()
-    channel = (data.get("channel") or "").strip()
-    videos = data.get("videos") or []
 
     if not playlist_id or not url:
         return jsonify({"error": "id and url are required"}), 400
 
-    db = get_db()
-    db.execute(
-        """
-        INSERT INTO playlists(id, url, title, channel, video_count, created_at, updated_at)
-        VALUES(?, ?, ?, ?, ?, datetime('now'), datetime('now'))
-        ON CONFLICT(id) DO UPDATE SET
-          url=excluded.url,
-          title=excluded.title,
-          channel=excluded.channel,
-          video_count=excluded.video_count,
-          updated_at=datetime('now')
-        """,
-        (playlist_id, url, title, channel, len(videos)),
-    )
-    # Update thumbnail separately to avoid altering existing schema ordering
-    thumb = (data.get("thumbnail") or "").strip()
-    if thumb:
-        db.execute(
-            "UPDATE playlists SET thumbnail=?, updated_at=datetime('now') WHERE id=?",
-            (thumb, playlist_id),
-        )
+    t_start = time.time()
+    counts = db_writer.run(lambda conn: save_playlist(conn, data))
+    print(f"[Playlists] Saved {playlist_id} in {time.time() - t_start:.3f}s: {counts}")
+    return jsonify({"ok": True, **counts})
+
+
+@app.route("/playlists/<playlist_id>/pin", methods=["POST"])
+def pin_playlist(playlist_id: str):
+    """
+    Body: {"pinned": bool}. Pinned playlists keep their MP3s when the audio
+    store evicts files to stay under its quota.
+    """
+    data = request.get_json(silent=True) or {}
+    pinned = bool(data.get("pinned", True))
+    if not set_pinned(playlist_id, pinned):
+        return jsonify({"error": "not found"}), 404
+    return jsonify({"ok": True, "pinned": pinned})
 
-    for idx, v in enumerate(videos):
-        vid = (v.get("id") or "").strip()
-        if not vid:
-            continue
-        vtitle = (v.get("title") or "").strip()
-        vcreator = (v.get("creator") or "").strip()
-        vviews = int(v.get("views") or 0)
-        vthumb = (v.get("thumbnail") or "").strip()
-        vmp3 = v.get("mp3_path") or None
-
-        # Handle analysis data - prefer `analysis` object, fallback to `key`
-        analysis_str = None
-        analysis_obj = v.get("analysis")
-        if isinstance(analysis_obj, dict):
-            analysis_str = json.dumps(analysis_obj)
-        else:
-            vkey = v.get("key")
-            if vkey:
-                analysis_str = json.dumps({"key": vkey})
-
-        db.execute(
-            """
-            INSERT INTO videos(video_id, playlist_id, position, title, creator, views, thumbnail, mp3_path, analysis, last_updated)
-            VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
-            ON CONFLICT(video_id) DO UPDATE SET
-              playlist_id=excluded.playlist_id,
-              position=excluded.position,
-              title=excluded.title,
-              creator=excluded.creator,
-              views=excluded.views,
-              thumbnail=excluded.thumbnail,
-              mp3_path=COALESCE(excluded.mp3_path, videos.mp3_path),
-              analysis=COALESCE(excluded.analysis, videos.analysis),
-              last_updated=datetime('now')
-            """,
-            (
-                vid,
-                playlist_id,
-                idx,
-                vtitle,
-                vcreator,
-                vviews,
-                vthumb,
-                vmp3,
-                analysis_str,
-            ),
-        )
 
-    db.commit()
-    return jsonify({"ok": True})
+# Rows per NDJSON write; the first batch is small so the UI can render early.
+NDJSON_FIRST_BATCH = 50
+NDJSON_BATCH = 500
 
 
 @app.route("/playlists/<playlist_id>", methods=["GET"])
 def get_playlist_with_videos(playlist_id: str):
+    """
+    A playlist and its videos in position order.
+    - ?limit=N[&cursor=...]: one page; pass `next_cursor` back for the next one
+    - ?format=ndjson (or Accept: application/x-ndjson): streamed as a
+      {"playlist": ...} line, one {"video": ...} line per row as it is read,
+      then {"done": true, "count": n, "next_cursor": ...}
+    Without either, the whole playlist in one JSON body.
+    """
     db = get_db()
     pl = db.execute(
-        "SELECT id, url, title, channel, thumbnail, video_count, created_at, updated_at FROM playlists WHERE id=?",
+        "SELECT id, url, title, channel, thumbnail, video_count, pinned, created_at, updated_at FROM playlists WHERE id=?",
         (playlist_id,),
     ).fetchone()
     if not pl:
         return jsonify({"error": "not found"}), 404
-    items = db.execute(
-        """
-        SELECT video_id as id, title, creator, views, thumbnail, analysis, mp3_path, position
-        FROM videos
-        WHERE playlist_id = ?
-        ORDER BY position ASC
-        """,
-        (playlist_id,),
-    ).fetchall()
+
+    try:
+        after = (
+            decode_video_cursor(request.args["cursor"])
+            if request.args.get("cursor")
+            else None
+        )
+        limit = int(request.args["limit"]) if request.args.get("limit") else None
+    except ValueError:
+        return jsonify({"error": "Invalid cursor or limit"}), 400
+    if limit is not None and limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
+
+    where = "playlist_id = ?"
+    params = [playlist_id]
+    if after:
+        # Keyset paging on the (playlist_id, position) index
+        where += " AND (position > ? OR (position = ? AND video_id > ?))"
+        params += [after[0], after[0], after[1]]
+    sql = f"SELECT {VIDEO_COLUMNS} FROM videos WHERE {where} ORDER BY position ASC, video_id ASC"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+
+    wants_ndjson = request.args.get(
+        "format"
+    ) == "ndjson" or "application/x-ndjson" in request.headers.get("Accept", "")
+    if wants_ndjson:
+
+        def generate():
+            conn = connect_db()
+            yield json.dumps({"playlist": dict(pl)}) + "\n"
+            lines, count, last, next_cursor = [], 0, None, None
+            batch = NDJSON_FIRST_BATCH
+            for row in conn.execute(sql, params):
+                if limit and count == limit:
+                    next_cursor = encode_video_cursor(last["position"], last["id"])
+                    break
+                lines.append(
+                    json.dumps({"video": video_row_to_dict(row)}, cls=NumpyEncoder)
+                )
+                count += 1
+                last = row
+                if len(lines) >= batch:
+                    yield "\n".join(lines) + "\n"
+                    lines, batch = [], NDJSON_BATCH
+            if lines:
+                yield "\n".join(lines) + "\n"
+            yield json.dumps(
+                {"done": True, "count": count, "next_cursor": next_cursor}
+            ) + "\n"
+
+        return Response(
+            stream_with_context(generate()), mimetype="application/x-ndjson"
+        )
+
+    items = db.execute(sql, params).fetchall()
+    body = {"playlist": dict(pl)}
+    if limit:
+        body["next_cursor"] = None
+        if len(items) > limit:
+            items = items[:limit]
+            body["next_cursor"] = encode_video_cursor(
+                items[-1]["position"], items[-1]["id"]
+            )
+    body["videos"] = [video_row_to_dict(r) for r in items]
+    return jsonify(body)
+
+
+def video_row_to_dict(row) -> dict:
+    video_dict = dict(row)
+    analysis_str = video_dict.get("analysis")
+    if analysis_str:
+        try:
+            video_dict["analysis"] = json.loads(analysis_str)
+        except json.JSONDecodeError:
+            video_dict["analysis"] = None  # or {}
+    else:
+        video_dict["analysis"] = None
+    return video_dict
+
+
+@app.route("/videos/query", methods=["GET"])
+def query_videos():
+    """
+    Filter and sort the library in SQLite using the indexed analysis columns.
+    Query params: playlist, q, creator, bpm_min, bpm_max, key or camelot,
+    compatible=1 (include harmonically compatible keys), energy_min, energy_max,
+    sort (position|title|views|bpm|key|energy), order (asc|desc),
+    limit (default 100, max 1000), offset or cursor (from `next_cursor`).
+    Returns {"videos": [...], "total": n, "next_cursor": str | null}
+    """
+    try:
+        sql, params, count_sql, count_params, limit = build_video_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    db = get_db()
+    rows = db.execute(sql, params).fetchall()
+    total = db.execute(count_sql, count_params).fetchone()[0]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_video_cursor(last["sort_value"], last["sort_id"])
 
     videos_list = []
-    for r in items:
-        video_dict = dict(r)
-        analysis_str = video_dict.get("analysis")
-        if analysis_str:
-            try:
-                video_dict["analysis"] = json.loads(analysis_str)
-            except json.JSONDecodeError:
-                video_dict["analysis"] = None  # or {}
-        else:
-            video_dict["analysis"] = None
+    for r in rows:
+        video_dict = video_row_to_dict(r)
+        video_dict.pop("sort_value", None)
+        video_dict.pop("sort_id", None)
         videos_list.append(video_dict)
+    return jsonify({"videos": videos_list, "total": total, "next_cursor": next_cursor})
 
-    return jsonify(
-        {
-            "playlist": dict(pl),
-            "videos": videos_list,
-        }
-    )
+
+@app.route("/videos/<video_id>/cues", methods=["GET"])
+def get_video_cues(video_id: str):
+    """Beat grid and cue markers of one video, fetched when its player opens.
+    Returns {"video_id", "beats": [seconds...], "markers": [{"time", "label"}]}
+    """
+    cues = load_cues(get_db(), video_id)
+    if cues is None:
+        return jsonify({"video_id": video_id, "beats": [], "markers": []})
+    return jsonify({"video_id": video_id, **cues})
 
 
 @app.route("/analyze", methods=["POST"])
 def analyze():
     """
     Analyze videos.
-    Body: {"ids": ["vid1", ...], "maxWorkers": optional}
-    - run full analysis (bpm, key, cue points) on existing MP3s
-    Returns {"results": {"vid": { ... } }}
+    Body: {"ids": ["vid1", ...], "features": optional, "tier": optional}
+    - features: any of bpm, key, energy, cue_points, segments
+      (default: bpm, key, energy, cue_points)
+    - tier: "full" (entire track, default) or "fast" (downsampled window)
+    - runs in the analysis process pool (sized by YTMP3_ANALYSIS_WORKERS /
+      physical cores); only the requested features are computed and merged
+      into the stored analysis
+    - results are cached by MP3 content hash and analyzer version, so repeat
+      requests and duplicate audio under other ids skip the analysis
+    Returns {"results": {"vid": { ... } }} with the merged analysis per video
     """
     try:
         data = request.get_json(silent=True) or {}
@@ -330,94 +420,109 @@ def analyze():
                 400,
             )
 
-        print(f"[Analyze] Received request for {len(ids)} video(s): {ids}")
+        tier = data.get("tier") or "full"
+        if tier not in ANALYSIS_TIERS:
+            return (
+                jsonify({"error": f"tier must be one of {list(ANALYSIS_TIERS)}"}),
+                400,
+            )
+        try:
+            features = normalize_features(data.get("features"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        max_workers_req = int(data.get("maxWorkers") or 0)
-        max_workers_env = int(os.environ.get("YTMP3_MAX_WORKERS", "4"))
-        max_workers = max(1, min(8, max_workers_req or max_workers_env, len(ids) or 1))
-        print(f"[Analyze] Using {max_workers} worker(s)")
+        print(
+            f"[Analyze] Received {tier} request ({', '.join(features)}) for {len(ids)} video(s): {ids}"
+        )
 
         results: dict[str, dict] = {}
         if not ids:
             return jsonify({"results": results})
 
-        def analyze_one(vid: str):
-            t_start_one = time.time()
-            try:
-                with app.app_context():
-                    print(f"[Analyze] Starting analysis for video_id: {vid}")
-                    db = get_db()
-                    row = db.execute(
-                        "SELECT mp3_path FROM videos WHERE video_id = ?", (vid,)
-                    ).fetchone()
-                    if (
-                        not row
-                        or not row["mp3_path"]
-                        or not os.path.exists(row["mp3_path"])
-                    ):
-                        mp3_path_val = row["mp3_path"] if row else "N/A"
-                        exists_val = (
-                            os.path.exists(row["mp3_path"])
-                            if row and row["mp3_path"]
-                            else "N/A"
-                        )
-                        print(
-                            f"[Analyze] MP3 not found for {vid}. Path: {mp3_path_val}, Exists: {exists_val}"
-                        )
-                        return vid, {"error": "mp3_not_found"}
-
-                    mp3_path = row["mp3_path"]
-                    print(
-                        f"[Analyze] Found MP3 for {vid} at {mp3_path}. Starting full analysis..."
-                    )
-                    analysis = perform_full_analysis(row["mp3_path"])
-                    if analysis:
-                        print(
-                            f"[Analyze] Analysis complete for {vid}. Result: {analysis.get('key', 'N/A')}, {analysis.get('bpm', 'N/A')} BPM"
-                        )
-                    else:
-                        print(f"[Analyze] Analysis returned no data for {vid}")
-
-                    # Persist full analysis
-                    try:
-                        analysis_json = (
-                            json.dumps(analysis, cls=NumpyEncoder) if analysis else None
-                        )
-                        db.execute(
-                            """
-                            UPDATE videos
-                            SET analysis = ?, last_updated=datetime('now')
-                            WHERE video_id=?
-                            """,
-                            (analysis_json, vid),
-                        )
-                        db.commit()
-                        print(f"[Analyze] Successfully persisted analysis for {vid}")
-                    except Exception as e:
-                        print(f"[DB] failed to persist analysis for {vid}: {e}")
-                    t_end_one = time.time()
-                    print(
-                        f"[Analyze] Finished analysis for {vid} in {t_end_one - t_start_one:.2f}s"
-                    )
-                    return vid, (analysis or {})
-            except Exception as e:
-                t_end_one = time.time()
+        db = get_db()
+        paths: dict[str, str] = {}
+        stored: dict[str, dict] = {}
+        files = resolve_mp3s(db, ids)
+        for vid in ids:
+            file = files.get(vid)
+            if not file:
+                print(f"[Analyze] MP3 not found for {vid}")
+                results[vid] = {"error": "mp3_not_found"}
+            else:
+                paths[vid] = file["path"]
+                try:
+                    stored[vid] = json.loads(file["analysis"] or "{}") or {}
+                except json.JSONDecodeError:
+                    stored[vid] = {}
+
+        def finish(vid: str, analysis: dict):
+            if "error" in analysis:
+                print(f"[Analyze] FAILED analysis for {vid}: {analysis['error']}")
+                results[vid] = analysis
+                return
+            if analysis:
                 print(
-                    f"[Analyze] FAILED analysis for {vid} in {t_end_one - t_start_one:.2f}s. Error: {e}"
+                    f"[Analyze] Analysis complete for {vid}. Result: {analysis.get('key', 'N/A')}, {analysis.get('bpm', 'N/A')} BPM"
+                )
+            else:
+                # Keep whatever was stored rather than wiping it with nothing
+                print(f"[Analyze] Analysis returned no data for {vid}")
+                results[vid] = stored.get(vid) or {}
+                return
+
+            # Persist, replacing only the features that were just computed and
+            # are not already held at a higher tier (a "fast" run never
+            # overwrites "full" results). Beat grids go to cue_grids; the
+            # response still carries them.
+            applicable = replaceable_features(stored.get(vid), features, tier)
+            if not applicable:
+                results[vid] = stored.get(vid) or {}
+                return
+            analysis = merge_analysis(stored.get(vid), analysis, applicable, tier)
+            writes[vid] = db_writer.submit(
+                lambda conn, vid=vid, analysis=analysis: store_video_analysis(
+                    conn, vid, analysis, encoder=NumpyEncoder
                 )
-                return vid, {"error": str(e)}
+            )
+            results[vid] = analysis or {}
+
+        # Queued writes; the writer commits them in batches
+        writes = {}
+        t_start = time.time()
+        # Identical audio (by content hash) is analyzed once and shared
+        by_hash: dict[str, list[str]] = {}
+        for vid, path in paths.items():
+            by_hash.setdefault(content_hash(path, db), []).append(vid)
+
+        pending: dict[str, str] = {}
+        for digest, vids in by_hash.items():
+            cached = lookup_cached_analysis(db, digest, features, tier)
+            if cached is None:
+                pending[digest] = paths[vids[0]]
+                continue
+            print(f"[Analyze] Cache hit for {', '.join(vids)}")
+            for vid in vids:
+                finish(vid, cached)
+
+        for digest, analysis in analysis_pool.analyze_many(pending, features, tier):
+            if analysis and "error" not in analysis:
+                db_writer.submit(
+                    lambda conn, digest=digest, analysis=analysis: store_cached_analysis(
+                        conn, digest, analysis, features, tier
+                    )
+                )
+            for vid in by_hash[digest]:
+                finish(vid, analysis)
+
+        for vid, write in writes.items():
+            try:
+                write.result()
+                print(f"[Analyze] Successfully persisted analysis for {vid}")
+            except Exception as e:
+                print(f"[DB] failed to persist analysis for {vid}: {e}")
 
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_id = {executor.submit(analyze_one, vid): vid for vid in ids}
-            for future in as_completed(future_to_id):
-                vid = future_to_id[future]
-                try:
-                    _vid, res = future.result()
-                    results[vid] = res
-                except Exception as e:
-                    results[vid] = {"error": str(e)}
         print(
-            f"[Analyze] Completed all analysis. Returning results for {len(results)} videos."
+            f"[Analyze] Completed all analysis in {time.time() - t_start:.2f}s. Returning results for {len(results)} videos."
         )
         json_string = json.dumps({"results": results}, cls=NumpyEncoder)
         return Response(json_string, mimetype="application/json")
@@ -426,6 +531,62 @@ def analyze():
         return jsonify({"error": str(e)}), 500
 
 
+def stream_transcoded_mp3(video_id: str, on_event=None):
+    """Tee an ffmpeg transcode to the client and to MP3_DIR.
+
+    Returns None when ffmpeg produced no output in time, so the caller can
+    fall back to the regular download path; the stalled transcode is stopped
+    first so the two never write the same file.
+    """
+    t_start = time.time()
+    entry = get_stream_entry(f"https://www.youtube.com/watch?v={video_id}")
+    if not entry:
+        return None
+    title = sanitize_filename(entry.get("title") or video_id)
+    final_mp3_path = os.path.join(MP3_DIR, f"{video_id}.mp3")
+
+    transcode = start_transcode(
+        video_id,
+        lambda: (entry["download_url"], entry["headers"]),
+        final_mp3_path,
+        # The DB row only points at the file once it is complete.
+        on_complete=lambda path: store_mp3(video_id, title, path),
+        on_event=on_event,
+    )
+    if not transcode.wait_for_data():
+        transcode.stop()
+        return None
+    print(
+        f"[Single] Streaming transcode for {video_id}, first bytes after {time.time() - t_start:.1f}s"
+    )
+
+    response = Response(
+        stream_with_context(transcode.iter_bytes()), mimetype="audio/mpeg"
+    )
+    response.headers["Content-Disposition"] = f'attachment; filename="{title}.mp3"'
+    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+    response.headers["Pragma"] = "no-cache"
+    response.headers["Expires"] = "0"
+    return response
+
+
+def single_progress(progress_id, video_id: str):
+    """Progress callback for one /download-mp3 conversion; ends the channel
+    when the item is done or failed."""
+    if not progress_id:
+        return None
+    item = ItemProgress(progress_id, video_id)
+
+    def on_event(stage: str, **fields):
+        item(stage, **fields)
+        if stage in ("done", "failed"):
+            progress_bus.end(
+                progress_id, status="completed" if stage == "done" else "failed"
+            )
+
+    return on_event
+
+
 @app.route("/download-mp3", methods=["GET"])
 def download_mp3():
     t_start = time.time()
@@ -434,189 +595,163 @@ def download_mp3():
         return jsonify({"error": "Missing videoId parameter"}), 400
 
     # Check if we already have this file
-    db = get_db()
-    video_info = db.execute(
-        "SELECT title, mp3_path FROM videos WHERE video_id = ?", (video_id,)
-    ).fetchone()
-    if video_info and video_info["mp3_path"] and os.path.exists(video_info["mp3_path"]):
-        print(f"[Single] Serving existing file: {video_info['mp3_path']}")
-        file_path = video_info["mp3_path"]
+    video_info = resolve_mp3s(get_db(), [video_id]).get(video_id)
+    if video_info:
+        print(f"[Single] Serving existing file: {video_info['path']}")
+        file_path = video_info["path"]
+        touch_mp3(file_path)
         title = sanitize_filename(video_info["title"] or video_id)
-        size_bytes = os.path.getsize(file_path)
-        arcname = f"{title}.mp3"
-
-        # Support HTTP Range for seeking
-        range_header = request.headers.get("Range", None)
-        if range_header:
-            try:
-                # Example: Range: bytes=START-END
-                bytes_unit, range_spec = range_header.split("=", 1)
-                if bytes_unit.strip().lower() != "bytes":
-                    raise ValueError("Unsupported range unit")
-                start_str, end_str = (range_spec or "").split("-", 1)
-                start = int(start_str) if start_str else 0
-                end = int(end_str) if end_str else size_bytes - 1
-                start = max(0, min(start, size_bytes - 1))
-                end = max(start, min(end, size_bytes - 1))
-
-                length = end - start + 1
-                print(
-                    f"[Single] Range request {start}-{end}/{size_bytes} (len={length})"
-                )
-
-                def generate_part():
-                    with open(file_path, "rb") as f:
-                        f.seek(start)
-                        remaining = length
-                        chunk_size = 1024 * 1024
-                        while remaining > 0:
-                            read_size = min(chunk_size, remaining)
-                            data = f.read(read_size)
-                            if not data:
-                                break
-                            remaining -= len(data)
-                            yield data
-
-                response = Response(
-                    stream_with_context(generate_part()),
-                    status=206,
-                    mimetype="audio/mpeg",
-                )
-                response.headers["Content-Range"] = f"bytes {start}-{end}/{size_bytes}"
-                response.headers["Accept-Ranges"] = "bytes"
-                response.headers["Content-Length"] = str(length)
-                response.headers["Content-Disposition"] = (
-                    f'attachment; filename="{arcname}"'
-                )
-                # Cache headers (same as below)
-                response.headers["Cache-Control"] = (
-                    "no-cache, no-store, must-revalidate"
-                )
-                response.headers["Pragma"] = "no-cache"
-                response.headers["Expires"] = "0"
+        return send_file(file_path, "audio/mpeg", download_name=f"{title}.mp3")
+
+    # Optional channel for GET /progress/<id>: transcoding/downloading events
+    progress_id = (request.args.get("progressId") or "").strip() or None
+    on_event = single_progress(progress_id, video_id)
+    report = on_event or (lambda stage, **fields: None)
+
+    # Stream-through mode: pipe the source through ffmpeg and send MP3 frames
+    # as they are produced, instead of waiting for the full download + convert.
+    stream_mode = (
+        request.args.get("stream") == "1"
+        or os.environ.get("YTMP3_STREAM_TRANSCODE") == "1"
+    )
+    if stream_mode and ffmpeg_available():
+        try:
+            response = stream_transcoded_mp3(video_id, on_event=on_event)
+            if response is not None:
                 return response
-            except Exception as e:
-                print(f"[Single] Failed to handle Range header: {e}. Sending full file")
-
-        def generate_existing_file_stream():
-            with open(file_path, "rb") as f:
-                yield from f
-
-        response = Response(
-            stream_with_context(generate_existing_file_stream()),
-            mimetype="audio/mpeg",
-        )
-        response.headers["Content-Disposition"] = f'attachment; filename="{arcname}"'
-        response.headers["Content-Length"] = str(size_bytes)
-        response.headers["Accept-Ranges"] = "bytes"
-        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "0"
-        return response
+        except Exception as e:
+            print(f"[Single] Stream-through transcode failed to start: {e}")
+        print("[Single] Falling back to download + convert")
 
     print(f"[Single] Start download-mp3 for {video_id}")
 
     try:
-        final_mp3_path, title = download_audio_lib(video_id, MP3_DIR)
+        final_mp3_path, title = download_audio_lib(video_id, MP3_DIR, on_event=on_event)
 
         if not final_mp3_path:
+            report("failed", error="MP3 output not found after conversion")
             return jsonify({"error": "MP3 output not found after conversion"}), 500
 
-        # Persist to DB
-        db = get_db()
-        db.execute(
-            """
-            INSERT INTO videos(video_id, title, mp3_path, last_updated)
-            VALUES(?, ?, ?, datetime('now'))
-            ON CONFLICT(video_id) DO UPDATE SET
-              title=excluded.title,
-              mp3_path=excluded.mp3_path,
-              last_updated=datetime('now')
-            """,
-            (video_id, title, final_mp3_path),
-        )
-        db.commit()
-
-        size_bytes = os.path.getsize(final_mp3_path)
-        arcname = f"{title}.mp3"
-
-        def generate_file_stream():
-            try:
-                with open(final_mp3_path, "rb") as f:
-                    yield from f
-            finally:
-                print(
-                    f"[Single] Stream finished. Total time={time.time() - t_start:.1f}s"
-                )
-
-        # Support Range for newly created file as well
-        range_header = request.headers.get("Range", None)
-        if range_header:
-            try:
-                bytes_unit, range_spec = range_header.split("=", 1)
-                if bytes_unit.strip().lower() != "bytes":
-                    raise ValueError("Unsupported range unit")
-                start_str, end_str = (range_spec or "").split("-", 1)
-                start = int(start_str) if start_str else 0
-                end = int(end_str) if end_str else size_bytes - 1
-                start = max(0, min(start, size_bytes - 1))
-                end = max(start, min(end, size_bytes - 1))
-                length = end - start + 1
-                print(
-                    f"[Single] Range request (new) {start}-{end}/{size_bytes} (len={length})"
-                )
-
-                def generate_part():
-                    with open(final_mp3_path, "rb") as f:
-                        f.seek(start)
-                        remaining = length
-                        chunk_size = 1024 * 1024
-                        while remaining > 0:
-                            read_size = min(chunk_size, remaining)
-                            data = f.read(read_size)
-                            if not data:
-                                break
-                            remaining -= len(data)
-                            yield data
-
-                response = Response(
-                    stream_with_context(generate_part()),
-                    status=206,
-                    mimetype="audio/mpeg",
-                )
-                response.headers["Content-Range"] = f"bytes {start}-{end}/{size_bytes}"
-                response.headers["Accept-Ranges"] = "bytes"
-                response.headers["Content-Length"] = str(length)
-                response.headers["Content-Disposition"] = (
-                    f'attachment; filename="{arcname}"'
-                )
-                response.headers["Cache-Control"] = (
-                    "no-cache, no-store, must-revalidate"
-                )
-                response.headers["Pragma"] = "no-cache"
-                response.headers["Expires"] = "0"
-                return response
-            finally:
-                pass
+        # Move into the audio store and persist to DB
+        final_mp3_path = store_mp3(video_id, title, final_mp3_path)
+        report("done", size=os.path.getsize(final_mp3_path))
 
-        response = Response(
-            stream_with_context(generate_file_stream()), mimetype="audio/mpeg"
-        )
-        response.headers["Content-Disposition"] = f'attachment; filename="{arcname}"'
-        response.headers["Content-Length"] = str(size_bytes)
-        response.headers["Accept-Ranges"] = "bytes"
-        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "0"
-        return response
+        print(f"[Single] Converted {video_id} in {time.time() - t_start:.1f}s")
+        return send_file(final_mp3_path, "audio/mpeg", download_name=f"{title}.mp3")
     except yt_dlp.utils.DownloadError as e:
         print(f"[Single] yt-dlp error: {e}")
+        report("failed", error=str(e))
         return jsonify({"error": "yt-dlp download error"}), 500
     except Exception as e:
         print(f"[Single] Generic error: {e}")
+        report("failed", error=str(e))
         return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
 
 
+@app.route("/peaks/<video_id>", methods=["GET"])
+def waveform_peaks(video_id: str):
+    """
+    Min/max waveform peaks for a converted MP3, built once and stored beside it.
+    - no params: the whole peak file (header, level table, every level)
+    - ?level=N or ?pixels=N: the int8 (min, max) pairs of one level, the
+      coarsest with at least N peaks for `pixels`; X-Peaks-* headers describe it
+    Both support conditional requests and (multi-)range requests. 404 until
+    the MP3 is converted; 202 with Retry-After while its peaks are being built.
+    A failed build is reported once (500); until it is retried, 503 with Retry-After.
+    """
+    video_info = resolve_mp3s(get_db(), [video_id]).get(video_id)
+    if not video_info:
+        return jsonify({"error": "mp3_not_found"}), 404
+    mp3_path = video_info["path"]
+
+    ready = ready_peaks(mp3_path)
+    if ready is None:
+        error, retry_in = build_status(mp3_path)
+        if error is not None:
+            return jsonify({"error": f"Could not compute peaks: {error}"}), 500
+        if retry_in > 0:
+            # A build just failed; another starts once the backoff is over.
+            response = jsonify({"error": "Peaks unavailable, retrying shortly"})
+            response.status_code = 503
+            response.headers["Retry-After"] = str(math.ceil(retry_in))
+            return response
+        # Decoding takes a while; the client asks again shortly.
+        build_peaks(mp3_path)
+        response = jsonify({"status": "building"})
+        response.status_code = 202
+        response.headers["Retry-After"] = "1"
+        return response
+    path, header = ready
+
+    level = None
+    try:
+        if request.args.get("level") is not None:
+            level = header["levels"][int(request.args["level"])]
+        elif request.args.get("pixels") is not None:
+            level = choose_level(header, max(1, int(request.args["pixels"])))
+    except (ValueError, IndexError):
+        return jsonify({"error": "Invalid level or pixels parameter"}), 400
+
+    stat = os.stat(path)
+    response = send_file(
+        path,
+        "application/octet-stream",
+        window=(level["offset"], level["length"]) if level else None,
+        # Each level is its own representation
+        etag=file_etag(stat) + (f"-l{level['level']}" if level else ""),
+    )
+    response.headers["X-Peaks-Sample-Rate"] = str(header["sample_rate"])
+    response.headers["X-Peaks-Total-Samples"] = str(header["total_samples"])
+    if level:
+        response.headers["X-Peaks-Level"] = str(level["level"])
+        response.headers["X-Peaks-Samples-Per-Peak"] = str(level["samples_per_peak"])
+        response.headers["X-Peaks-Count"] = str(level["count"])
+    return response
+
+
+def archive_response(archive, filename: str, on_close=None):
+    """Serve a StoredZip with its exact length, an ETag and byte ranges, so an
+    interrupted download can resume where it stopped."""
+    response = send_bytes(
+        archive.size,
+        archive.iter_bytes,
+        "application/zip",
+        archive.etag,
+        download_name=filename,
+    )
+    if on_close:
+        response.call_on_close(on_close)
+    return response
+
+
+def normalize_batch_items(items: list) -> list:
+    """Turn request items into [{"id", "title"}], dropping entries without an id."""
+    tasks = []
+    for item in items:
+        vid = (item.get("id") or "").strip()
+        title = (item.get("title") or vid or "audio").strip()
+        if not vid:
+            continue
+        tasks.append({"id": vid, "title": title})
+    return tasks
+
+
+def requested_batch_workers(data: dict) -> int:
+    # Determine worker count: request body > env var > default
+    max_workers_env = int(os.environ.get("YTMP3_MAX_WORKERS", "4"))
+    try:
+        max_workers_req = int(data.get("maxWorkers"))
+    except Exception:
+        max_workers_req = 0
+    return max_workers_req if max_workers_req > 0 else max_workers_env
+
+
+# Seconds without a finished conversion before /batch-zip sends a keep-alive byte
+BATCH_ZIP_KEEPALIVE_SECONDS = 10
+# Archive entry listing the items that could not be converted
+BATCH_ZIP_FAILURE_MANIFEST = "FAILED.txt"
+
+
 @app.route("/batch-zip", methods=["POST"])
 def batch_zip():
     t_batch_start = time.time()
@@ -626,33 +761,32 @@ def batch_zip():
         if not items or not isinstance(items, list):
             return jsonify({"error": "Body must include items: [{id, title}]"}), 400
 
+        # Optional client-chosen channel for GET /progress/<id> (Server-Sent Events)
+        progress_id = (data.get("progressId") or "").strip() or None
+
         # Normalize items and check for existing files
         tasks_to_download = []
         mp3_files = []
         db = get_db()
-        all_tasks = []
-        for item in items:
-            vid = (item.get("id") or "").strip()
-            title = (item.get("title") or vid or "audio").strip()
-            if not vid:
-                continue
-            all_tasks.append({"id": vid, "title": title})
+        all_tasks = normalize_batch_items(items)
+        progress = {
+            task["id"]: ItemProgress(progress_id, task["id"], task["title"])
+            for task in all_tasks
+        }
 
+        existing = resolve_mp3s(db, [task["id"] for task in all_tasks])
         for task in all_tasks:
             vid = task["id"]
-            video_info = db.execute(
-                "SELECT mp3_path FROM videos WHERE video_id = ?", (vid,)
-            ).fetchone()
-            if (
-                video_info
-                and video_info["mp3_path"]
-                and os.path.exists(video_info["mp3_path"])
-            ):
+            if vid in existing:
                 print(f"[Batch] Found existing file for {vid}")
                 arcname = sanitize_filename(task["title"]) + ".mp3"
-                mp3_files.append((video_info["mp3_path"], arcname))
+                mp3_files.append((existing[vid]["path"], arcname))
+                progress[vid]("done", cached=True)
             else:
                 tasks_to_download.append(task)
+                progress[vid]("queued")
+        if existing:
+            touch_mp3(*(f["path"] for f in existing.values()))
 
         if not all_tasks:
             return jsonify({"error": "No valid items provided"}), 400
@@ -661,100 +795,109 @@ def batch_zip():
             f"[Batch] Starting batch for {len(all_tasks)} items ({len(tasks_to_download)} to download)"
         )
 
-        if tasks_to_download:
+        if not tasks_to_download:
+            # Everything is on disk: an exact-length archive. Browsers never
+            # resume a POST, so the UI downloads GET /jobs/<id>/archive instead;
+            # ranges here only serve scripted clients that retry the POST.
+            progress_bus.end(progress_id, status="completed")
+            archive = StoredZip(archive_entries(db, mp3_files))
+            print(
+                f"[Batch] Streaming stored ZIP: {len(archive.entries)} file(s), {archive.size / (1024 * 1024):.1f} MB"
+            )
 
-            def download_convert_one(task):
-                vid = task["id"]
-                title = task["title"]
-                print(f"[Batch] Downloading: {title} [{vid}]")
-                t_one_start = time.time()
-                try:
-                    (
-                        final_mp3_path,
-                        _title,
-                    ) = download_audio_lib(vid, MP3_DIR)
-                    if not final_mp3_path:
-                        raise FileNotFoundError("MP3 output not found after conversion")
-
-                    # Persist to DB in this thread with a new connection
-                    conn = sqlite3.connect(DB_PATH)
-                    try:
-                        conn.execute(
-                            """
-                            INSERT INTO videos(video_id, title, mp3_path, last_updated)
-                            VALUES(?, ?, ?, datetime('now'))
-                            ON CONFLICT(video_id) DO UPDATE SET
-                              title=excluded.title,
-                              mp3_path=excluded.mp3_path,
-                              last_updated=datetime('now')
-                            """,
-                            (vid, title, final_mp3_path),
-                        )
-                        conn.commit()
-                    finally:
-                        conn.close()
-
-                    arcname = sanitize_filename(title) + ".mp3"
-                    t_one_end = time.time()
-                    size_mb = os.path.getsize(final_mp3_path) / (1024 * 1024)
-                    print(
-                        f"[Batch] Done: {title} in {t_one_end - t_one_start:.1f}s ({size_mb:.2f} MB)"
-                    )
-                    return (final_mp3_path, arcname)
-                except Exception as e:
-                    t_one_end = time.time()
-                    print(
-                        f"[Batch] FAILED: {title} [{vid}] after {t_one_end - t_one_start:.1f}s -> {e}"
-                    )
-                    return None
+            def on_close():
+                print(
+                    f"[Batch] ZIP streaming completed in {time.time() - t_batch_start:.1f}s"
+                )
+
+            response = archive_response(archive, "playlist.mp3.zip", on_close=on_close)
+            response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+            response.headers["Pragma"] = "no-cache"
+            response.headers["Expires"] = "0"
+            return response
+
+        failed = []
 
-            # Determine worker count: request body > env var > default
-            max_workers_env = int(os.environ.get("YTMP3_MAX_WORKERS", "4"))
-            max_workers_req_raw = data.get("maxWorkers")
+        def download_convert_one(task):
+            vid = task["id"]
+            title = task["title"]
+            print(f"[Batch] Downloading: {title} [{vid}]")
+            t_one_start = time.time()
             try:
-                max_workers_req = int(max_workers_req_raw)
-            except Exception:
-                max_workers_req = 0
-            requested_workers = (
-                max_workers_req if max_workers_req > 0 else max_workers_env
-            )
-            max_workers = max(1, min(requested_workers, 8, len(tasks_to_download)))
-            print(f"[Batch] Using up to {max_workers} parallel workers")
-
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                future_to_task = {
-                    executor.submit(download_convert_one, task): task
-                    for task in tasks_to_download
-                }
-                for future in as_completed(future_to_task):
-                    result = future.result()
-                    if result:
-                        mp3_files.append(result)
-
-        if not mp3_files:
-            return (
-                jsonify(
-                    {"error": "No items could be processed. Try again or check logs."}
-                ),
-                400,
-            )
+                final_mp3_path = convert_item(vid, title, on_event=progress[vid])
+                arcname = sanitize_filename(title) + ".mp3"
+                t_one_end = time.time()
+                size_mb = os.path.getsize(final_mp3_path) / (1024 * 1024)
+                print(
+                    f"[Batch] Done: {title} in {t_one_end - t_one_start:.1f}s ({size_mb:.2f} MB)"
+                )
+                progress[vid]("done", size=os.path.getsize(final_mp3_path))
+                return (final_mp3_path, arcname)
+            except Exception as e:
+                t_one_end = time.time()
+                progress[vid]("failed", error=str(e))
+                failed.append((task, str(e)))
+                print(
+                    f"[Batch] FAILED: {title} [{vid}] after {t_one_end - t_one_start:.1f}s -> {e}"
+                )
+                return None
 
-        # Prepare streaming ZIP
-        z = zipstream.ZipFile(mode="w", compression=zipfile.ZIP_DEFLATED)
-        for file_path, arcname in mp3_files:
-            print(f"[Batch] Adding to ZIP: {arcname}")
-            z.write(file_path, arcname)
+        max_workers = max(
+            1, min(requested_batch_workers(data), 8, len(tasks_to_download))
+        )
+        print(f"[Batch] Using up to {max_workers} parallel workers")
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        futures = [
+            executor.submit(download_convert_one, task) for task in tasks_to_download
+        ]
 
         def generate_zip_stream():
+            # Files on disk go out at once; each conversion is appended as it
+            # completes. Total size is unknown, so no Content-Length or ranges.
+            stream = ZipStream()
+            conn = connect_db()
+            written = 0
             try:
-                for chunk in z:
-                    yield chunk
+                for entry in archive_entries(conn, mp3_files):
+                    yield from stream.add(entry)
+                    written += 1
+                pending = set(futures)
+                while pending:
+                    done, pending = wait(
+                        pending,
+                        timeout=BATCH_ZIP_KEEPALIVE_SECONDS,
+                        return_when=FIRST_COMPLETED,
+                    )
+                    if not done:
+                        keepalive = stream.keepalive()
+                        if keepalive:
+                            yield keepalive
+                        continue
+                    for future in done:
+                        result = future.result()
+                        if not result:
+                            continue
+                        for entry in archive_entries(conn, [result]):
+                            yield from stream.add(entry)
+                            written += 1
+                if failed:
+                    lines = [
+                        f"{task['title']} [{task['id']}]: {error}"
+                        for task, error in failed
+                    ]
+                    yield from stream.add(
+                        text_entry(BATCH_ZIP_FAILURE_MANIFEST, "\n".join(lines) + "\n")
+                    )
+                yield stream.close()
             finally:
-                t_batch_end = time.time()
+                # Queued conversions are dropped if the client went away
+                executor.shutdown(wait=False, cancel_futures=True)
+                progress_bus.end(
+                    progress_id, status="completed" if written else "failed"
+                )
                 print(
-                    f"[Batch] ZIP streaming completed in {t_batch_end - t_batch_start:.1f}s"
+                    f"[Batch] ZIP streaming completed in {time.time() - t_batch_start:.1f}s: {written} file(s), {len(failed)} failed"
                 )
-                # No temp dir to clean up
 
         response = Response(
             stream_with_context(generate_zip_stream()),
@@ -766,12 +909,109 @@ def batch_zip():
         response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
         response.headers["Pragma"] = "no-cache"
         response.headers["Expires"] = "0"
+        response.headers["X-Accel-Buffering"] = "no"
         return response
     except Exception as e:
         print(f"[Batch] Generic error: {e}")
         return jsonify({"error": f"Batch failed: {e}"}), 500
 
 
+@app.route("/progress/<channel_id>", methods=["GET"])
+def progress_events(channel_id: str):
+    """
+    Server-Sent Events for a batch: a job id from POST /jobs, or the
+    `progressId` sent with POST /batch-zip or GET /download-mp3. Emits `item` events with a `stage`
+    (queued, extracting, downloading, transcoding, done, failed) and an `end` event.
+    """
+    response = Response(
+        stream_with_context(progress_bus.stream(channel_id)),
+        mimetype="text/event-stream",
+    )
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+# --------------------
+# Background batch jobs
+# --------------------
+
+
+@app.route("/jobs", methods=["POST"])
+def enqueue_job():
+    """
+    Enqueue a batch download.
+    Body: {"items": [{"id", "title"}], "maxWorkers": optional}
+    Returns 202 {"id": job_id, "status": "queued"}
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get("items")
+    if not items or not isinstance(items, list):
+        return jsonify({"error": "Body must include items: [{id, title}]"}), 400
+    tasks = normalize_batch_items(items)
+    if not tasks:
+        return jsonify({"error": "No valid items provided"}), 400
+
+    job_id = create_job(tasks, max(1, min(requested_batch_workers(data), 8)))
+    job_runner.notify()
+    print(f"[Jobs] Enqueued {job_id[:8]} with {len(tasks)} item(s)")
+    return jsonify({"id": job_id, "status": "queued"}), 202
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id: str):
+    summary = get_job(job_id)
+    if not summary:
+        return jsonify({"error": "not found"}), 404
+    return jsonify(summary)
+
+
+@app.route("/jobs/<job_id>/archive", methods=["GET"])
+def job_archive(job_id: str):
+    summary = get_job(job_id)
+    if not summary:
+        return jsonify({"error": "not found"}), 404
+    if summary["job"]["status"] != "completed":
+        return (
+            jsonify(
+                {"error": "Job is not finished", "status": summary["job"]["status"]}
+            ),
+            409,
+        )
+    files = completed_files(job_id)
+    if not files:
+        return jsonify({"error": "No finished files are available"}), 410
+
+    archive = StoredZip(
+        archive_entries(
+            get_db(),
+            [(path, sanitize_filename(title) + ".mp3") for path, title in files],
+        )
+    )
+    return archive_response(archive, f"playlist-{job_id[:8]}.mp3.zip")
+
+
+def _is_serving_process() -> bool:
+    # `app.run(debug=True)` imports this module in a watcher process that never
+    # serves requests, and spawned analysis workers re-import it as `__mp_main__`;
+    # schema setup and background workers only belong in the serving process.
+    if multiprocessing.current_process().name != "MainProcess":
+        return False
+    return __name__ != "__main__" or os.environ.get("WERKZEUG_RUN_MAIN") == "true"
+
+
+if _is_serving_process():
+    init_db_lib()
+    init_extract_cache()
+    warm_pools_async([info_pool(), download_pool(MP3_DIR)])
+    analysis_pool.warm_async()
+    job_runner.start()
+    reanalyzer.start()
+    start_audio_store_maintenance()
+    file_reconciler.start()
+    async_proxy.start()
+
+
 if __name__ == "__main__":
     # Get port from environment variable or default to 5328
     port = int(os.environ.get("PORT", 5328))
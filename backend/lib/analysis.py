@@ -1,176 +1,463 @@
 import os
+import shutil
+import subprocess
 import time
 
+from .keys import estimate_key
+
 
 def estimate_key_with_librosa(wav_path: str) -> str:
-    """Basic key estimation using chroma features and Krumhansl-Schmuckler profiles."""
+    """Basic key estimation using chroma features and Krumhansl-Schmuckler profiles.
+
+    Equivalent to a fast-tier, key-only analysis.
+    """
+    return perform_full_analysis(wav_path, features=("key",), tier="fast").get(
+        "key", "unknown"
+    )
+
+
+# Bump whenever a change to the analysis code changes its results; cached
+# results from older versions are then re-analyzed in the background.
+ANALYZER_VERSION = 1
+
+# Shared transform parameters: every feature is derived from one STFT.
+N_FFT = 2048
+HOP_LENGTH = 512
+
+# Selectable features and the `videos.analysis` keys each one owns.
+FEATURE_KEYS = {
+    "bpm": ("bpm", "danceability"),
+    "key": ("key", "camelot", "key_confidence", "chroma"),
+    "energy": ("energy",),
+    # beat_count/first_beat summarize cue_points once those move to cue_grids
+    "cue_points": ("cue_points", "beat_count", "first_beat"),
+    "segments": ("segments",),
+}
+# Segmentation is opt-in, its too inaccurate to run by default.
+DEFAULT_FEATURES = ("bpm", "key", "energy", "cue_points")
+
+# "fast": downsampled and limited to a window around the middle of the track.
+# "full": the entire track at librosa's default rate.
+TIERS = {
+    "fast": {"sr": 11025, "window": 60.0},
+    "full": {"sr": 22050, "window": None},
+}
+
+
+# Tracks longer than this are analyzed block by block instead of being decoded
+# into memory whole (a 2-hour mix is ~600 MB of float32 samples at 22.05 kHz).
+STREAMING_MIN_SECONDS = float(os.environ.get("YTMP3_STREAMING_ANALYSIS_SECONDS", "900"))
+# Audio decoded per block in streaming mode, in STFT frames (~47s at 22.05 kHz).
+STREAM_BLOCK_FRAMES = 2048
+# onset_strength() delays its envelope by the lag plus half a window of frames.
+ONSET_DELAY_FRAMES = 1 + N_FFT // (2 * HOP_LENGTH)
+
+
+def normalize_features(features) -> tuple:
+    """Validate a requested feature list; None/empty means the defaults."""
+    if not features:
+        return DEFAULT_FEATURES
+    unknown = [f for f in features if f not in FEATURE_KEYS]
+    if unknown:
+        raise ValueError(f"Unknown analysis feature(s): {', '.join(unknown)}")
+    return tuple(f for f in FEATURE_KEYS if f in features)
+
+
+def merge_analysis(existing: dict, result: dict, features, tier: str) -> dict:
+    """Replace only the keys owned by `features` in a stored analysis dict."""
+    merged = dict(existing or {})
+    tiers = dict(merged.get("tiers") or {})
+    for feature in features:
+        for key in FEATURE_KEYS[feature]:
+            merged.pop(key, None)
+            if key in result:
+                merged[key] = result[key]
+        tiers[feature] = tier
+    merged["tiers"] = tiers
+    return merged
+
+
+def compute_intermediates(y, sr, features=DEFAULT_FEATURES) -> dict:
+    """Decode-side work shared by all features: one STFT and what derives from it.
+
+    Returns the onset envelope, per-frame RMS and the mean chroma vector, each only
+    when a requested feature needs it. These are small (one value or one 12-vector
+    per frame), unlike the audio and spectrogram.
+    """
     import numpy as _np
     import librosa as _librosa
 
-    # Use lower sample rate for speed
-    y, sr = _librosa.load(wav_path, sr=11025, mono=True)
-    if y.size == 0:
-        return "unknown"
-    # Use chroma_stft for speed
-    chroma = _librosa.feature.chroma_stft(y=y, sr=sr)
-    if chroma.size == 0:
-        return "unknown"
-    chroma_mean = chroma.mean(axis=1)
-    # Krumhansl-Kessler key profiles (major/minor)
-    major_profile = _np.array(
-        [6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88]
-    )
-    minor_profile = _np.array(
-        [6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17]
-    )
+    need_onset = any(f in features for f in ("bpm", "cue_points", "segments"))
+    need_rms = any(f in features for f in ("energy", "segments"))
+    need_chroma = "key" in features
+
+    inter = {
+        "sr": sr,
+        "duration": float(len(y)) / sr,
+        "onset_env": None,
+        "rms": None,
+        "chroma_mean": None,
+    }
+    if need_rms:
+        # Time-domain RMS keeps `energy` on its established scale; it is cheap.
+        inter["rms"] = _librosa.feature.rms(
+            y=y, frame_length=N_FFT, hop_length=HOP_LENGTH
+        )[0]
+    if not (need_onset or need_chroma):
+        return inter
+
+    S = _np.abs(_librosa.stft(y, n_fft=N_FFT, hop_length=HOP_LENGTH))
+    power = S**2
+    if need_onset:
+        # No top_db clipping: it depends on the loudest frame of the whole
+        # track, which the streaming path cannot know in advance.
+        mel = _librosa.feature.melspectrogram(S=power, sr=sr)
+        inter["onset_env"] = _librosa.onset.onset_strength(
+            S=_librosa.power_to_db(mel, top_db=None), sr=sr
+        )
+    if need_chroma:
+        chroma = _librosa.feature.chroma_stft(S=power, sr=sr)
+        if chroma.size > 0:
+            inter["chroma_mean"] = chroma.mean(axis=1)
+    return inter
+
+
+def iter_pcm_blocks(path: str, sr: int, block_samples: int):
+    """Yield mono float32 blocks of `path` resampled to `sr`, without loading it whole.
+
+    Uses soundfile with a streaming soxr resampler, or an ffmpeg PCM pipe for
+    formats libsndfile cannot open.
+    """
+    import numpy as _np
 
-    def best_key(profile: "_np.ndarray"):
-        scores = []
-        for i in range(12):
-            rotated = _np.roll(profile, i)
-            score = _np.corrcoef(chroma_mean, rotated)[0, 1]
-            scores.append(score)
-        best_index = int(_np.nanargmax(scores))
-        best_score = float(scores[best_index])
-        return best_index, best_score
-
-    maj_index, maj_score = best_key(major_profile)
-    min_index, min_score = best_key(minor_profile)
-
-    pitch_classes = [
-        "C",
-        "C#",
-        "D",
-        "D#",
-        "E",
-        "F",
-        "F#",
-        "G",
-        "G#",
-        "A",
-        "A#",
-        "B",
-    ]
-    if _np.isnan(maj_score) and _np.isnan(min_score):
-        return "unknown"
-    if maj_score >= min_score:
-        return f"{pitch_classes[maj_index]} major"
-    else:
-        return f"{pitch_classes[min_index]} minor"
-
-
-def perform_full_analysis(mp3_path: str) -> dict:
+    try:
+        import soundfile as _sf
+        import soxr as _soxr
+
+        f = _sf.SoundFile(path)
+    except (ImportError, RuntimeError) as e:
+        f = None
+        if not shutil.which("ffmpeg"):
+            raise
+        print(f"[Analysis] soundfile cannot stream {os.path.basename(path)}: {e}")
+
+    if f is not None:
+        with f:
+            resampler = None
+            if f.samplerate != sr:
+                resampler = _soxr.ResampleStream(f.samplerate, sr, 1, dtype="float32")
+            native_block = max(1, int(block_samples * f.samplerate / sr))
+            for block in f.blocks(
+                blocksize=native_block, dtype="float32", always_2d=True
+            ):
+                mono = block.mean(axis=1)
+                if resampler:
+                    mono = resampler.resample_chunk(mono)
+                if mono.size:
+                    yield mono
+            if resampler:
+                tail = resampler.resample_chunk(_np.zeros(0, _np.float32), last=True)
+                if tail.size:
+                    yield tail
+        return
+
+    proc = subprocess.Popen(
+        [
+            "ffmpeg",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-i",
+            path,
+            "-vn",
+            "-ac",
+            "1",
+            "-ar",
+            str(sr),
+            "-f",
+            "f32le",
+            "pipe:1",
+        ],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+    )
+    try:
+        block_bytes = block_samples * 4
+        while True:
+            data = proc.stdout.read(block_bytes)
+            if not data:
+                break
+            yield _np.frombuffer(data[: len(data) - len(data) % 4], dtype="<f4")
+    finally:
+        proc.stdout.close()
+        if proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg exited with {proc.returncode}")
+
+
+class StreamingIntermediates:
+    """Builds compute_intermediates()' output from audio fed in blocks.
+
+    Frames are cut exactly where a centered STFT over the whole signal would
+    cut them, so onset envelope and RMS match the in-memory path frame for
+    frame. Only the per-frame values and a window's worth of samples are held.
     """
-    Run analysis on a full MP3 file to find BPM and Key.
-    This is slower than the snippet-based key detection but more accurate
-    and provides more data.
+
+    def __init__(self, sr: int, features=DEFAULT_FEATURES):
+        import numpy as _np
+
+        self.sr = sr
+        self.need_onset = any(f in features for f in ("bpm", "cue_points", "segments"))
+        self.need_rms = any(f in features for f in ("energy", "segments"))
+        self.need_chroma = "key" in features
+        # Leading half-window of zeros, as librosa's centered framing pads.
+        self._buffer = _np.zeros(N_FFT // 2, dtype=_np.float32)
+        self._samples = 0
+        self._prev_log_mel = None
+        self._onset = [_np.zeros(ONSET_DELAY_FRAMES - 1, dtype=_np.float32)]
+        self._rms = []
+        self._chroma_sum = _np.zeros(12)
+        self._chroma_frames = 0
+        self._tuning = None
+
+    def feed(self, block):
+        import numpy as _np
+
+        self._samples += len(block)
+        self._buffer = _np.concatenate((self._buffer, block.astype(_np.float32)))
+        self._consume()
+
+    def finish(self) -> dict:
+        import numpy as _np
+
+        self._buffer = _np.concatenate(
+            (self._buffer, _np.zeros(N_FFT // 2, dtype=_np.float32))
+        )
+        self._consume()
+        n_frames = 1 + self._samples // HOP_LENGTH
+        inter = {
+            "sr": self.sr,
+            "duration": float(self._samples) / self.sr,
+            "onset_env": None,
+            "rms": None,
+            "chroma_mean": None,
+        }
+        if self.need_onset:
+            inter["onset_env"] = _np.concatenate(self._onset)[:n_frames]
+        if self.need_rms:
+            inter["rms"] = _np.concatenate(self._rms) if self._rms else _np.zeros(0)
+        if self.need_chroma and self._chroma_frames:
+            inter["chroma_mean"] = self._chroma_sum / self._chroma_frames
+        return inter
+
+    def _consume(self):
+        import numpy as _np
+        import librosa as _librosa
+
+        if len(self._buffer) < N_FFT:
+            return
+        n_frames = 1 + (len(self._buffer) - N_FFT) // HOP_LENGTH
+        signal = self._buffer[: (n_frames - 1) * HOP_LENGTH + N_FFT]
+        self._buffer = self._buffer[n_frames * HOP_LENGTH :]
+
+        if self.need_rms:
+            frames = _librosa.util.frame(
+                signal, frame_length=N_FFT, hop_length=HOP_LENGTH
+            )
+            self._rms.append(_np.sqrt(_np.mean(_np.abs(frames) ** 2, axis=0)))
+        if not (self.need_onset or self.need_chroma):
+            return
+
+        S = _np.abs(
+            _librosa.stft(signal, n_fft=N_FFT, hop_length=HOP_LENGTH, center=False)
+        )
+        power = S**2
+        if self.need_onset:
+            log_mel = _librosa.power_to_db(
+                _librosa.feature.melspectrogram(S=power, sr=self.sr), top_db=None
+            )
+            if self._prev_log_mel is None:
+                self._onset.append(_np.zeros(1, dtype=_np.float32))
+            else:
+                log_mel = _np.concatenate((self._prev_log_mel, log_mel), axis=1)
+            self._onset.append(_np.maximum(0.0, _np.diff(log_mel, axis=1)).mean(axis=0))
+            self._prev_log_mel = log_mel[:, -1:]
+        if self.need_chroma:
+            if self._tuning is None:
+                # Estimated once, from the first block, and reused for the rest.
+                self._tuning = _librosa.estimate_tuning(S=power, sr=self.sr)
+            chroma = _librosa.feature.chroma_stft(
+                S=power, sr=self.sr, tuning=self._tuning
+            )
+            self._chroma_sum += chroma.sum(axis=1)
+            self._chroma_frames += chroma.shape[1]
+
+
+def compute_intermediates_streaming(path: str, sr: int, features=DEFAULT_FEATURES):
+    """compute_intermediates() for a file, decoded and processed in fixed blocks."""
+    acc = StreamingIntermediates(sr, features)
+    for block in iter_pcm_blocks(path, sr, STREAM_BLOCK_FRAMES * HOP_LENGTH):
+        acc.feed(block)
+    return acc.finish()
+
+
+def derive_features(inter: dict, features=DEFAULT_FEATURES, offset: float = 0.0):
+    """Turn shared intermediates into the requested analysis fields.
+
+    `offset` shifts reported times when the intermediates cover a window that
+    does not start at 0 (fast tier).
     """
     import numpy as _np
     import librosa as _librosa
 
     analysis = {}
-    print(f"[Analysis] Starting full analysis for: {os.path.basename(mp3_path)}")
-    t_start = time.time()
-
-    try:
-        y, sr = _librosa.load(mp3_path, mono=True)
-
-        # Segmentation
-        # Turned off for now, its too inacurate
-        # analysis["segments"] = analyze_segments(y, sr)
-
-        # BPM detection
-        tempo, beats = _librosa.beat.beat_track(y=y, sr=sr, units="time")
-        if tempo:
-            analysis["bpm"] = round(float(tempo), 1)
-
-        # Energy detection (RMS)
-        rms = _librosa.feature.rms(y=y)[0]
-        if rms.size > 0:
-            analysis["energy"] = round(float(_np.mean(rms) * 100), 1)
-
-        # Danceability (more complex, using beat variance)
-        if tempo and beats.size > 2:
-            beat_intervals = _np.diff(beats)
-            # High variance in beat intervals can indicate less steady rhythm
-            # We map lower variance to higher danceability
-            variance = _np.var(beat_intervals)
-            # This is a heuristic mapping, not a scientific measure
-            danceability = max(0, 100 - variance * 1000)
-            analysis["danceability"] = round(danceability, 1)
+    sr = inter["sr"]
+    onset_env = inter["onset_env"]
+    rms = inter["rms"]
+
+    # Segmentation
+    if "segments" in features:
+        analysis["segments"] = analyze_segments(inter, offset=offset)
+
+    if "bpm" in features or "cue_points" in features:
+        # BPM detection (reuses the shared onset envelope)
+        tempo, beats = _librosa.beat.beat_track(
+            onset_envelope=onset_env, sr=sr, hop_length=HOP_LENGTH, units="time"
+        )
+        tempo = float(_np.atleast_1d(tempo)[0]) if _np.size(tempo) else 0.0
+        beats = beats + offset
+
+        if "bpm" in features:
+            if tempo:
+                analysis["bpm"] = round(tempo, 1)
+
+            # Danceability (more complex, using beat variance)
+            if tempo and beats.size > 2:
+                beat_intervals = _np.diff(beats)
+                # High variance in beat intervals can indicate less steady rhythm
+                # We map lower variance to higher danceability
+                variance = _np.var(beat_intervals)
+                # This is a heuristic mapping, not a scientific measure
+                danceability = max(0, 100 - variance * 1000)
+                analysis["danceability"] = round(float(danceability), 1)
 
         # Cue points from beats
-        if beats.size > 0:
+        if "cue_points" in features and beats.size > 0:
             analysis["cue_points"] = [
                 {"time": round(float(b), 2), "label": "beat"} for b in beats
             ]
             # Attempt to find "downbeats" for more musical cue points
             try:
-                # This is a simplified approach; more advanced methods exist
-                chroma = _librosa.feature.chroma_cqt(y=y, sr=sr)
-                # Find onsets (beginnings of notes)
-                onset_env = _librosa.onset.onset_detect(y=y, sr=sr, units="time")
-                # Find beats that are close to onsets - likely downbeats
-                downbeats = []
-                for beat_time in beats:
-                    # Find the closest onset to this beat
-                    closest_onset_idx = _np.argmin(_np.abs(onset_env - beat_time))
-                    if (
-                        _np.abs(onset_env[closest_onset_idx] - beat_time) < 0.05
-                    ):  # 50ms tolerance
-                        downbeats.append(beat_time)
-
-                if downbeats:
-                    analysis["cue_points"].append(
-                        {"time": round(float(downbeats[0]), 2), "label": "first_beat"}
+                # Onsets (beginnings of notes) from the same onset envelope
+                onsets = (
+                    _librosa.onset.onset_detect(
+                        onset_envelope=onset_env,
+                        sr=sr,
+                        hop_length=HOP_LENGTH,
+                        units="time",
+                    )
+                    + offset
+                )
+                # Beats within 50ms of an onset are likely downbeats
+                if onsets.size > 0:
+                    idx = _np.clip(_np.searchsorted(onsets, beats), 1, onsets.size - 1)
+                    nearest = _np.minimum(
+                        _np.abs(onsets[idx] - beats), _np.abs(onsets[idx - 1] - beats)
                     )
+                    downbeats = beats[nearest < 0.05]
+                    if downbeats.size > 0:
+                        analysis["cue_points"].append(
+                            {
+                                "time": round(float(downbeats[0]), 2),
+                                "label": "first_beat",
+                            }
+                        )
             except Exception as e:
                 print(f"[Analysis] Downbeat detection failed: {e}")
 
-        # Key detection (more accurate with full track)
-        chroma = _librosa.feature.chroma_stft(y=y, sr=sr)
-        if chroma.size > 0:
-            # Same logic as _estimate_key_with_librosa, just on the full track
-            chroma_mean = chroma.mean(axis=1)
-            major_profile = _np.array(
-                [6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88]
-            )
-            minor_profile = _np.array(
-                [6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17]
-            )
+    # Energy detection (RMS)
+    if "energy" in features and rms is not None and rms.size > 0:
+        analysis["energy"] = round(float(_np.mean(rms) * 100), 1)
+
+    # Key detection (more accurate with full track)
+    chroma_mean = inter["chroma_mean"]
+    if "key" in features and chroma_mean is not None:
+        estimate = estimate_key(chroma_mean)
+        if estimate["key"] != "unknown":
+            analysis["key"] = estimate["key"]
+            analysis["camelot"] = estimate["camelot"]
+            analysis["key_confidence"] = estimate["confidence"]
+        # Kept so the library can be re-keyed in one estimate_keys() call
+        analysis["chroma"] = [round(float(c), 4) for c in chroma_mean]
 
-            def best_key(profile: "_np.ndarray"):
-                scores = []
-                for i in range(12):
-                    rotated = _np.roll(profile, i)
-                    score = _np.corrcoef(chroma_mean, rotated)[0, 1]
-                    scores.append(score)
-                best_index = int(_np.nanargmax(scores))
-                return best_index, float(scores[best_index])
-
-            maj_index, maj_score = best_key(major_profile)
-            min_index, min_score = best_key(minor_profile)
-
-            pitch_classes = [
-                "C",
-                "C#",
-                "D",
-                "D#",
-                "E",
-                "F",
-                "F#",
-                "G",
-                "G#",
-                "A",
-                "A#",
-                "B",
-            ]
-            if not _np.isnan(maj_score) or not _np.isnan(min_score):
-                if maj_score >= min_score:
-                    analysis["key"] = f"{pitch_classes[maj_index]} major"
-                else:
-                    analysis["key"] = f"{pitch_classes[min_index]} minor"
+    return analysis
+
+
+def load_for_tier(mp3_path: str, tier: str):
+    """Decode audio for a tier. Returns (y, sr, offset_seconds)."""
+    import librosa as _librosa
+
+    params = TIERS[tier]
+    offset = 0.0
+    duration = None
+    if params["window"]:
+        try:
+            total = _librosa.get_duration(path=mp3_path)
+        except Exception:
+            total = None
+        if total and total > params["window"]:
+            offset = (total - params["window"]) / 2
+            duration = params["window"]
+        elif total is None:
+            duration = params["window"]
+    y, sr = _librosa.load(
+        mp3_path, sr=params["sr"], mono=True, offset=offset, duration=duration
+    )
+    return y, sr, offset
+
+
+def use_streaming(mp3_path: str, tier: str) -> bool:
+    """Whether a full-tier analysis of this file should run block by block."""
+    import librosa as _librosa
 
+    if TIERS[tier]["window"]:
+        return False
+    try:
+        return _librosa.get_duration(path=mp3_path) > STREAMING_MIN_SECONDS
+    except Exception:
+        return False
+
+
+def perform_full_analysis(
+    mp3_path: str, features=DEFAULT_FEATURES, tier: str = "full", streaming=None
+) -> dict:
+    """
+    Run analysis on an MP3 file to find BPM and Key.
+    The "full" tier covers the whole track; "fast" decodes a downsampled window.
+    The audio is decoded and transformed once; every requested feature derives
+    from those intermediates, and features that were not requested are skipped.
+    Long tracks (or `streaming=True`) are processed in fixed-size blocks so
+    memory stays flat regardless of length.
+    """
+    analysis = {}
+    features = normalize_features(features)
+    print(
+        f"[Analysis] Starting {tier} analysis ({', '.join(features)}) for: {os.path.basename(mp3_path)}"
+    )
+    t_start = time.time()
+
+    try:
+        if streaming is None:
+            streaming = use_streaming(mp3_path, tier)
+        if streaming and not TIERS[tier]["window"]:
+            offset = 0.0
+            inter = compute_intermediates_streaming(
+                mp3_path, TIERS[tier]["sr"], features
+            )
+        else:
+            y, sr, offset = load_for_tier(mp3_path, tier)
+            inter = compute_intermediates(y, sr, features)
+            del y
+        analysis = derive_features(inter, features, offset=offset)
     except Exception as e:
         print(f"[Analysis] Error during analysis for {os.path.basename(mp3_path)}: {e}")
 
@@ -179,7 +466,8 @@ def perform_full_analysis(mp3_path: str) -> dict:
     return analysis
 
 
-def analyze_segments(y, sr) -> list:
+def analyze_segments(inter: dict, offset: float = 0.0) -> list:
+    """Heuristic intro/verse/buildup/drop/outro labels from shared intermediates."""
     import numpy as _np
     import librosa as _librosa
     import scipy.signal
@@ -187,19 +475,20 @@ def analyze_segments(y, sr) -> list:
     segments = []
     try:
         # Get duration for percentage calculations
-        duration = _librosa.get_duration(y=y, sr=sr)
+        sr = inter["sr"]
+        duration = inter["duration"]
         if duration < 1:  # Need at least a second of audio
             return []
 
         # Get RMS energy to analyze dynamics
-        rms = _librosa.feature.rms(y=y)[0]
+        rms = inter["rms"]
         if rms.size == 0 or _np.max(rms) == _np.min(rms):
             return []
         rms_normalized = (rms - _np.min(rms)) / (_np.max(rms) - _np.min(rms))
 
         # --- Corrected Segmentation Logic ---
         # Create a novelty curve, smooth it, and find peaks for boundaries
-        onset_env = _librosa.onset.onset_strength(y=y, sr=sr)
+        onset_env = inter["onset_env"]
         # The kernel size for medfilt must be odd.
         onset_env_smooth = scipy.signal.medfilt(onset_env, kernel_size=5)
         boundaries_frames = _librosa.onset.onset_detect(
@@ -257,10 +546,10 @@ def analyze_segments(y, sr) -> list:
 
             segments.append(
                 {
-                    "start": round(start_time, 2),
-                    "end": round(end_time, 2),
+                    "start": round(float(start_time + offset), 2),
+                    "end": round(float(end_time + offset), 2),
                     "label": label,
-                    "energy": round(segment_energy, 2),
+                    "energy": round(float(segment_energy), 2),
                 }
             )
 
@@ -0,0 +1,204 @@
+import json
+import threading
+import time
+
+from .analysis import ANALYZER_VERSION, FEATURE_KEYS, TIERS, merge_analysis
+from .analysis_pool import analysis_pool
+from .audio_store import content_hash
+from .cues import store_analysis
+from .db import connect, writer
+
+# --------------------
+# Content-addressed analysis cache
+# --------------------
+# Results are stored per (MP3 content hash, feature, tier) together with the
+# analyzer version that produced them, so identical audio under different video
+# IDs shares one result and an algorithm change is detectable per row.
+
+# How long the background re-analyzer sleeps when nothing is stale.
+REANALYZE_IDLE_SECONDS = 60
+# TIERS is ordered from cheapest to most thorough.
+TIER_RANK = {name: rank for rank, name in enumerate(TIERS)}
+
+
+def lookup(conn, digest: str, features, tier: str):
+    """Return the combined cached result for `features`, or None unless every
+    feature has a current-version entry."""
+    placeholders = ",".join("?" for _ in features)
+    rows = conn.execute(
+        f"""
+        SELECT feature, result FROM analysis_cache
+        WHERE content_hash = ? AND tier = ? AND analyzer_version = ? AND stale = 0
+          AND feature IN ({placeholders})
+        """,
+        (digest, tier, ANALYZER_VERSION, *features),
+    ).fetchall()
+    if len(rows) != len(features):
+        return None
+    combined = {}
+    for row in rows:
+        combined.update(json.loads(row["result"]))
+    return combined
+
+
+def store(conn, digest: str, result: dict, features, tier: str):
+    """Cache `result` split into its per-feature parts (caller commits)."""
+    conn.executemany(
+        """
+        INSERT INTO analysis_cache(content_hash, feature, tier, analyzer_version, result, stale, created_at)
+        VALUES(?, ?, ?, ?, ?, 0, datetime('now'))
+        ON CONFLICT(content_hash, feature, tier) DO UPDATE SET
+          analyzer_version=excluded.analyzer_version,
+          result=excluded.result,
+          stale=0,
+          created_at=datetime('now')
+        """,
+        [
+            (
+                digest,
+                feature,
+                tier,
+                ANALYZER_VERSION,
+                json.dumps(
+                    {k: result[k] for k in FEATURE_KEYS[feature] if k in result}
+                ),
+            )
+            for feature in features
+        ],
+    )
+
+
+def mark_stale(conn) -> int:
+    """Flag rows written by another analyzer version. Returns how many changed."""
+    cur = conn.execute(
+        "UPDATE analysis_cache SET stale = 1 WHERE analyzer_version != ? AND stale = 0",
+        (ANALYZER_VERSION,),
+    )
+    return cur.rowcount
+
+
+def replaceable_features(stored: dict, features, tier: str) -> list:
+    """The `features` a `tier` result may replace in a stored analysis: those
+    missing or held at the same or a lower tier."""
+    held = (stored or {}).get("tiers") or {}
+    return [
+        f
+        for f in features
+        if f not in held or TIER_RANK.get(held[f], -1) <= TIER_RANK[tier]
+    ]
+
+
+def apply_to_videos(conn, digest: str, result: dict, features, tier: str) -> int:
+    """Merge a result into every video whose MP3 has this content hash (caller commits).
+
+    Per video, a feature is only replaced when it is missing or stored at the
+    same or a lower tier, so a re-analyzed "fast" entry never overwrites a
+    "full" result. Returns how many videos changed.
+    """
+    rows = conn.execute(
+        """
+        SELECT v.video_id, v.analysis FROM videos v
+        JOIN file_hashes f ON f.path = v.mp3_path
+        WHERE f.content_hash = ?
+        """,
+        (digest,),
+    ).fetchall()
+    updated = 0
+    for row in rows:
+        try:
+            stored = json.loads(row["analysis"] or "{}") or {}
+        except json.JSONDecodeError:
+            stored = {}
+        applicable = replaceable_features(stored, features, tier)
+        if applicable:
+            store_analysis(
+                conn, row["video_id"], merge_analysis(stored, result, applicable, tier)
+            )
+            updated += 1
+    return updated
+
+
+class Reanalyzer:
+    """Background thread that re-runs stale cache entries, one file at a time."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        marked = writer.run(mark_stale)
+        if marked:
+            print(
+                f"[AnalysisCache] Marked {marked} result(s) stale for analyzer v{ANALYZER_VERSION}"
+            )
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            try:
+                if self._run_next():
+                    continue
+            except Exception as e:
+                print(f"[AnalysisCache] Re-analysis error: {e}")
+            time.sleep(REANALYZE_IDLE_SECONDS)
+
+    def _run_next(self) -> bool:
+        """Re-analyze one stale (content hash, tier) group. False when idle."""
+        conn = connect()
+        group = conn.execute(
+            """
+            SELECT content_hash, tier, group_concat(feature) AS features
+            FROM analysis_cache WHERE stale = 1
+            GROUP BY content_hash, tier
+            LIMIT 1
+            """
+        ).fetchone()
+        if not group:
+            return False
+        digest, tier = group["content_hash"], group["tier"]
+        features = tuple(f for f in FEATURE_KEYS if f in group["features"].split(","))
+
+        path = None
+        for row in conn.execute(
+            """
+            SELECT f.path FROM file_hashes f
+            JOIN audio_files a ON a.path = f.path
+            WHERE f.content_hash = ?
+            """,
+            (digest,),
+        ).fetchall():
+            try:
+                if content_hash(row["path"], conn) == digest:
+                    path = row["path"]
+                    break
+            except OSError:
+                # Gone since the last reconcile
+                continue
+
+        result = None
+        if path:
+            for _key, result in self.pool.analyze_many({digest: path}, features, tier):
+                pass
+        if not result or "error" in result:
+            # Nothing left to re-analyze from; a later request recomputes it.
+            writer.execute(
+                "DELETE FROM analysis_cache WHERE content_hash = ? AND tier = ? AND stale = 1",
+                (digest, tier),
+            )
+            return True
+
+        def save(wconn):
+            store(wconn, digest, result, features, tier)
+            return apply_to_videos(wconn, digest, result, features, tier)
+
+        updated = writer.run(save)
+        print(
+            f"[AnalysisCache] Re-analyzed {digest[:12]} ({tier}: {', '.join(features)}); updated {updated} video(s)"
+        )
+        return True
+
+
+reanalyzer = Reanalyzer(analysis_pool)
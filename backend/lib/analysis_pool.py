@@ -0,0 +1,162 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+# --------------------
+# Analysis process pool
+# --------------------
+# librosa's beat tracking and feature code mostly holds the GIL, so analysis runs
+# in worker processes. Each worker imports numpy/librosa once and warms numba's
+# JIT caches, then serves tasks until it is recycled.
+TASKS_PER_WORKER = 50
+
+
+def physical_cores() -> int:
+    try:
+        import psutil
+
+        count = psutil.cpu_count(logical=False)
+        if count:
+            return count
+    except ImportError:
+        pass
+    try:
+        cores = set()
+        physical_id = None
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                key = key.strip()
+                if key == "physical id":
+                    physical_id = value.strip()
+                elif key == "core id":
+                    cores.add((physical_id, value.strip()))
+        if cores:
+            return len(cores)
+    except OSError:
+        pass
+    return os.cpu_count() or 1
+
+
+def default_pool_size() -> int:
+    return max(
+        1, int(os.environ.get("YTMP3_ANALYSIS_WORKERS", "0")) or physical_cores()
+    )
+
+
+def _warm_worker():
+    import numpy as _np
+    import librosa as _librosa
+
+    # Touch the lazily loaded submodules and compile the numba kernels once.
+    y = _np.random.default_rng(0).uniform(-0.1, 0.1, 22050 * 2).astype(_np.float32)
+    try:
+        _librosa.beat.beat_track(y=y, sr=22050)
+        _librosa.feature.chroma_stft(y=y, sr=22050)
+    except Exception as e:
+        print(f"[AnalysisPool] Worker warm-up failed: {e}")
+
+
+def _ping():
+    return os.getpid()
+
+
+def _analyze_task(mp3_path: str, features, tier: str) -> dict:
+    from .analysis import perform_full_analysis
+
+    return perform_full_analysis(mp3_path, features=features, tier=tier)
+
+
+class AnalysisPool:
+    """Process pool that survives crashing workers.
+
+    A worker dying (e.g. a decoder segfault on a bad file) breaks a
+    ProcessPoolExecutor; the pool is then replaced and the affected tasks are
+    retried one at a time so the offending file can be identified.
+    """
+
+    def __init__(self, size: int = None):
+        self.size = size or default_pool_size()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _current(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.size,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_warm_worker,
+                    max_tasks_per_child=TASKS_PER_WORKER,
+                )
+            return self._executor
+
+    def _recycle(self, broken):
+        with self._lock:
+            if self._executor is broken:
+                print("[AnalysisPool] Worker crashed; recycling the pool")
+                self._executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def warm(self):
+        t_start = time.time()
+        executor = self._current()
+        futures = [executor.submit(_ping) for _ in range(self.size)]
+        for future in futures:
+            future.result()
+        print(
+            f"[AnalysisPool] {self.size} worker(s) ready in {time.time() - t_start:.1f}s"
+        )
+
+    def warm_async(self):
+        def worker():
+            try:
+                self.warm()
+            except Exception as e:
+                print(f"[AnalysisPool] Warm-up failed: {e}")
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def analyze_many(self, paths: dict, features=None, tier: str = "full"):
+        """Analyze {key: mp3_path}; yields (key, analysis_dict) as results finish."""
+        executor = self._current()
+        futures = {}
+        for key, path in paths.items():
+            try:
+                futures[executor.submit(_analyze_task, path, features, tier)] = key
+            except BrokenProcessPool:
+                self._recycle(executor)
+                executor = self._current()
+                futures[executor.submit(_analyze_task, path, features, tier)] = key
+
+        crashed = []
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                yield key, future.result()
+            except BrokenProcessPool:
+                crashed.append(key)
+            except Exception as e:
+                yield key, {"error": str(e)}
+        if not crashed:
+            return
+
+        self._recycle(executor)
+        for key in crashed:
+            executor = self._current()
+            try:
+                yield key, executor.submit(
+                    _analyze_task, paths[key], features, tier
+                ).result()
+            except BrokenProcessPool:
+                self._recycle(executor)
+                print(f"[AnalysisPool] {paths[key]} crashed a worker twice")
+                yield key, {"error": "analysis worker crashed"}
+            except Exception as e:
+                yield key, {"error": str(e)}
+
+
+analysis_pool = AnalysisPool()
@@ -0,0 +1,390 @@
+import asyncio
+import os
+import threading
+import time
+
+try:
+    import aiohttp
+    from aiohttp import web
+except ImportError:  # optional: without it the audio routes stay on Flask
+    aiohttp = None
+    web = None
+import yt_dlp
+
+from . import extract_cache
+from .audio_store import touch
+from .db import connect
+from .file_index import resolve_mp3s
+from .file_serving import AUDIO_CACHE_CONTROL
+from .http_fetch import (
+    CONTENT_RANGE,
+    FATAL_STATUSES,
+    SEGMENT_RETRIES,
+    STREAM_SEGMENT_SIZE,
+)
+from .utils import sanitize_filename
+from .youtube import describe_download_error, get_video_info
+
+# --------------------
+# Async streaming proxy
+# --------------------
+# A WSGI thread is held for as long as a client listens, so relaying upstream
+# audio through Flask caps concurrent streams at the server's thread count.
+# This asyncio server (aiohttp, optional) handles the audio routes instead:
+# - /download relays the upstream stream, same format selection as Flask, with
+#   http_fetch's range and retry policy: segments resume from the last byte
+#   received, and one segment is fetched ahead of the client
+# - /download-mp3 serves stored MP3s with sendfile and relays everything else
+#   (conversions) to Flask, which still holds a worker thread per conversion
+# Each relay moves one small chunk at a time and awaits the client before
+# reading more, so a slow listener throttles its upstream connection rather
+# than buffering. Point the frontend at it with AUDIO_PROXY_URL.
+PORT = int(os.environ.get("YTMP3_ASYNC_PORT", "5329"))  # 0 disables
+HOST = os.environ.get("YTMP3_ASYNC_HOST", "127.0.0.1")
+FLASK_URL = f"http://127.0.0.1:{os.environ.get('PORT', 5328)}"
+RELAY_CHUNK_SIZE = 64 * 1024
+# Per-connection read buffer; reading from the socket pauses once it is full.
+READ_BUFFER_SIZE = 256 * 1024
+MAX_UPSTREAM_CONNECTIONS = 512
+# Retried with backoff when opening the upstream.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Request headers passed on to Flask, and response headers passed back.
+FORWARD_REQUEST_HEADERS = ("Range", "If-Range", "If-None-Match", "If-Modified-Since")
+FORWARD_RESPONSE_HEADERS = (
+    "Content-Type",
+    "Content-Length",
+    "Content-Range",
+    "Content-Disposition",
+    "Accept-Ranges",
+    "Cache-Control",
+    "ETag",
+    "Last-Modified",
+)
+NO_CACHE_HEADERS = {
+    "Cache-Control": "no-cache, no-store, must-revalidate",
+    "Pragma": "no-cache",
+    "Expires": "0",
+}
+
+
+def available() -> bool:
+    return aiohttp is not None and PORT > 0
+
+
+async def _blocking(fn, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(
+        None, lambda: fn(*args, **kwargs)
+    )
+
+
+async def _body(upstream):
+    """An aiohttp response's body in RELAY_CHUNK_SIZE chunks; releases it at the end."""
+    try:
+        async for chunk in upstream.content.iter_chunked(RELAY_CHUNK_SIZE):
+            yield chunk
+    finally:
+        upstream.release()
+
+
+async def _relay(request, chunks, status: int, headers: dict):
+    """Copy an async chunk iterator to the client, one chunk in flight at a time."""
+    response = web.StreamResponse(status=status, headers=headers)
+    try:
+        await response.prepare(request)
+        async for chunk in chunks:
+            # write() waits for the transport to drain: backpressure
+            await response.write(chunk)
+        await response.write_eof()
+    except ConnectionError:
+        # The client went away; dropping the upstream is all there is to do.
+        pass
+    finally:
+        await chunks.aclose()
+    return response
+
+
+class _Source:
+    """An upstream opened with a ranged GET for its first segment (the async
+    counterpart of http_fetch.RangedSource, with one segment of lookahead)."""
+
+    def __init__(self, session, url: str, headers: dict):
+        self.session = session
+        self.url = url
+        self.headers = {k: v for k, v in headers.items() if k.lower() != "range"}
+        self.response = None
+        self.status = None
+        self.size, self.first_stop, self.ranged = None, None, False
+
+    async def open(self):
+        attempt = 0
+        while True:
+            self.response = await self.session.get(
+                self.url,
+                headers={**self.headers, "Range": f"bytes=0-{STREAM_SEGMENT_SIZE - 1}"},
+            )
+            if self.response.status in RETRY_STATUSES and attempt < SEGMENT_RETRIES:
+                attempt += 1
+                self.response.release()
+                await asyncio.sleep(min(0.5 * 2 ** (attempt - 1), 8))
+                continue
+            break
+        if self.response.status >= 400 and self.response.status not in FATAL_STATUSES:
+            print(
+                f"[AsyncProxy] Ranged request failed ({self.response.status}); retrying without Range"
+            )
+            self.response.release()
+            self.response = await self.session.get(self.url, headers=self.headers)
+        self.status = self.response.status
+        match = CONTENT_RANGE.match(self.response.headers.get("Content-Range", ""))
+        if self.status == 206 and match and match.group(1) == "0":
+            if match.group(3) != "*":
+                self.ranged = True
+                self.first_stop = int(match.group(2)) + 1
+                self.size = int(match.group(3))
+        elif self.status == 200 and self.response.headers.get("Content-Length"):
+            self.size = int(self.response.headers["Content-Length"])
+        return self
+
+    def release(self):
+        if self.response is not None:
+            self.response.release()
+
+    async def fetch_range(self, start: int, stop: int) -> bytes:
+        """Bytes [start, stop), resumed from the last byte on errors (see http_fetch.fetch_range)."""
+        buf = bytearray()
+        attempt = 0
+        while start + len(buf) < stop:
+            pos = start + len(buf)
+            try:
+                async with self.session.get(
+                    self.url,
+                    headers={**self.headers, "Range": f"bytes={pos}-{stop - 1}"},
+                ) as r:
+                    if r.status in FATAL_STATUSES:
+                        r.raise_for_status()
+                    match = CONTENT_RANGE.match(r.headers.get("Content-Range", ""))
+                    if r.status != 206 or not match or int(match.group(1)) != pos:
+                        raise IOError(f"unexpected response {r.status} for a range")
+                    async for chunk in r.content.iter_chunked(RELAY_CHUNK_SIZE):
+                        buf += chunk[: stop - pos]
+                        pos += len(chunk)
+                        if pos >= stop:
+                            break
+                if start + len(buf) < stop:
+                    raise IOError("connection closed early")
+            except aiohttp.ClientResponseError:
+                raise
+            except (aiohttp.ClientError, OSError) as e:
+                attempt += 1
+                if attempt > SEGMENT_RETRIES:
+                    raise
+                print(
+                    f"[AsyncProxy] Segment {start}-{stop} retry {attempt}/{SEGMENT_RETRIES} at byte {start + len(buf)}: {e}"
+                )
+                await asyncio.sleep(min(0.5 * 2 ** (attempt - 1), 8))
+        return bytes(buf)
+
+    async def iter_bytes(self):
+        """Yield the body in order. The first response streams straight through
+        while the next segment (only one) is fetched."""
+        if not self.ranged:
+            async for chunk in _body(self.response):
+                yield chunk
+            return
+
+        segments = (
+            (s, min(s + STREAM_SEGMENT_SIZE, self.size))
+            for s in range(self.first_stop, self.size, STREAM_SEGMENT_SIZE)
+        )
+
+        def prefetch():
+            seg = next(segments, None)
+            return asyncio.ensure_future(self.fetch_range(*seg)) if seg else None
+
+        pending = prefetch()
+        try:
+            pos = 0
+            try:
+                async for chunk in _body(self.response):
+                    pos += len(chunk)
+                    yield chunk
+            except (aiohttp.ClientError, OSError) as e:
+                print(f"[AsyncProxy] First segment interrupted at byte {pos}: {e}")
+            if pos < self.first_stop:
+                yield await self.fetch_range(pos, self.first_stop)
+            while pending is not None:
+                data = await pending
+                pending = prefetch()
+                for i in range(0, len(data), RELAY_CHUNK_SIZE):
+                    yield data[i : i + RELAY_CHUNK_SIZE]
+        finally:
+            if pending is not None:
+                pending.cancel()
+            self.release()
+
+
+class AsyncProxy:
+    """aiohttp server on its own event loop thread."""
+
+    def __init__(self, host: str = HOST, port: int = PORT):
+        self.host = host
+        self.port = port
+        self._thread = None
+        self._session = None
+
+    def start(self):
+        if not available():
+            if aiohttp is None:
+                print(
+                    "[AsyncProxy] aiohttp not installed; set YTMP3_ASYNC_PORT=0 to serve audio routes from Flask"
+                )
+            return
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(
+            target=lambda: asyncio.run(self._serve()), daemon=True
+        )
+        self._thread.start()
+
+    async def _serve(self):
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=MAX_UPSTREAM_CONNECTIONS, ttl_dns_cache=300
+            ),
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=120),
+            read_bufsize=READ_BUFFER_SIZE,
+            auto_decompress=False,
+        )
+        app = web.Application()
+        app.router.add_get("/download", self.download)
+        app.router.add_get("/download-mp3", self.download_mp3)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, self.host, self.port).start()
+        except OSError as e:
+            print(f"[AsyncProxy] Could not listen on {self.host}:{self.port}: {e}")
+            await self._session.close()
+            return
+        print(f"[AsyncProxy] Serving audio routes on {self.host}:{self.port}")
+        await asyncio.Event().wait()
+
+    async def _open_source(self, video_id: str):
+        """Open the upstream audio, with the same fallbacks as Flask's /download."""
+        video_url = f"https://www.youtube.com/watch?v={video_id}"
+        info = await _blocking(get_video_info, video_url)
+        if not info[0]:
+            return None, info
+        source = await _Source(self._session, info[0], info[4]).open()
+        if source.status in (403, 410):
+            # The signed URL (possibly from the extraction cache) was rejected.
+            print(
+                f"[AsyncProxy] Stream URL rejected ({source.status}). Re-extracting {video_id}..."
+            )
+            source.release()
+            await _blocking(extract_cache.invalidate, video_id)
+            info = await _blocking(get_video_info, video_url, use_cache=False)
+            if not info[0]:
+                return None, info
+            source = await _Source(self._session, info[0], info[4]).open()
+        if source.status >= 400:
+            source.release()
+            source.response.raise_for_status()
+        return source, info
+
+    async def download(self, request):
+        t_start = time.time()
+        video_id = request.query.get("videoId")
+        if not video_id:
+            return web.json_response({"error": "Missing videoId parameter"}, status=400)
+
+        try:
+            source, info = await self._open_source(video_id)
+        except yt_dlp.utils.DownloadError as e:
+            print(f"[AsyncProxy] yt-dlp download error: {e}")
+            status, message = describe_download_error(e)
+            return web.json_response({"error": message}, status=status)
+        except aiohttp.ClientError as e:
+            print(f"[AsyncProxy] Request error fetching audio stream: {e}")
+            return web.json_response(
+                {"error": f"Failed to fetch audio stream from source: {e}"}, status=502
+            )
+        except Exception as e:
+            print(f"[AsyncProxy] Generic error: {e}")
+            return web.json_response(
+                {"error": f"An unexpected error occurred: {e}"}, status=500
+            )
+        if source is None:
+            return web.json_response(
+                {"error": "Could not find a suitable audio format URL."}, status=500
+            )
+
+        _url, file_ext, content_type, content_length_est, _headers = info
+        headers = {
+            **NO_CACHE_HEADERS,
+            "Content-Type": content_type or "application/octet-stream",
+            "Content-Disposition": f'attachment; filename="audio.{file_ext}"',
+        }
+        length = source.size or content_length_est
+        if length and str(length) != "0":
+            headers["Content-Length"] = str(length)
+
+        print(
+            f"[AsyncProxy] Streaming {length} bytes for {video_id} (ranged={source.ranged})"
+        )
+        try:
+            response = await _relay(request, source.iter_bytes(), 200, headers)
+        finally:
+            # The generator only releases it once started
+            source.release()
+        print(f"[AsyncProxy] Finished {video_id} in {time.time() - t_start:.2f}s")
+        return response
+
+    async def download_mp3(self, request):
+        video_id = request.query.get("videoId")
+        if video_id:
+            stored = await _blocking(lambda: resolve_mp3s(connect(), [video_id]))
+            info = stored.get(video_id)
+            if info:
+                touch(info["path"])
+                title = sanitize_filename(info["title"] or video_id)
+                return web.FileResponse(
+                    info["path"],
+                    chunk_size=RELAY_CHUNK_SIZE,
+                    headers={
+                        "Content-Type": "audio/mpeg",
+                        "Content-Disposition": f'attachment; filename="{title}.mp3"',
+                        "Cache-Control": AUDIO_CACHE_CONTROL,
+                    },
+                )
+
+        # Not stored yet: Flask converts (or stream-transcodes) it.
+        try:
+            upstream = await self._session.get(
+                f"{FLASK_URL}/download-mp3",
+                params=request.query,
+                headers={
+                    k: request.headers[k]
+                    for k in FORWARD_REQUEST_HEADERS
+                    if k in request.headers
+                },
+                # Conversion can take a while before the first byte arrives.
+                timeout=aiohttp.ClientTimeout(
+                    total=None, sock_connect=30, sock_read=None
+                ),
+            )
+        except aiohttp.ClientError as e:
+            print(f"[AsyncProxy] Flask unreachable: {e}")
+            return web.json_response({"error": f"Backend unavailable: {e}"}, status=502)
+        headers = {
+            k: upstream.headers[k]
+            for k in FORWARD_RESPONSE_HEADERS
+            if k in upstream.headers
+        }
+        try:
+            return await _relay(request, _body(upstream), upstream.status, headers)
+        finally:
+            upstream.release()
+
+
+async_proxy = AsyncProxy()
@@ -0,0 +1,289 @@
+import hashlib
+import os
+import threading
+import time
+import zlib
+
+from .db import MP3_DIR, connect, record_mp3, writer
+from .peaks import build_peaks
+
+# --------------------
+# Content-addressed MP3 store
+# --------------------
+# Converted MP3s are moved to `MP3_DIR/store/<aa>/<sha256>.mp3`, so identical
+# audio under different video IDs is kept once. `audio_files` tracks size and
+# last access per file; when the store outgrows its quota the least recently
+# used files are deleted, except those belonging to a pinned playlist. Eviction
+# clears `videos.mp3_path`, which makes the usual download paths fetch the file
+# again on next use.
+STORE_DIR = os.path.join(MP3_DIR, "store")
+HASH_CHUNK_SIZE = 1024 * 1024
+# 0 disables eviction.
+QUOTA_BYTES = int(os.environ.get("YTMP3_AUDIO_QUOTA_MB", "20480")) * 1024 * 1024
+# Files used this recently are never evicted (they may still be streaming).
+EVICTION_GRACE_SECONDS = 10 * 60
+# Sidecar files that travel with an MP3 (see peaks.py).
+SIDECAR_SUFFIXES = (".peaks",)
+
+_evict_lock = threading.Lock()
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _fingerprint(path: str):
+    """(sha256 hex, crc32) of a file in one read; the CRC feeds zip_archive."""
+    digest, crc = hashlib.sha256(), 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+            crc = zlib.crc32(chunk, crc)
+    return digest.hexdigest(), crc
+
+
+def _remember_hash(conn, path: str, st, value: str):
+    conn.execute(
+        """
+        INSERT INTO file_hashes(path, size, mtime, content_hash, hashed_at)
+        VALUES(?, ?, ?, ?, datetime('now'))
+        ON CONFLICT(path) DO UPDATE SET
+          size=excluded.size,
+          mtime=excluded.mtime,
+          content_hash=excluded.content_hash,
+          hashed_at=datetime('now')
+        """,
+        (path, st.st_size, st.st_mtime, value),
+    )
+
+
+def content_hash(path: str, conn) -> str:
+    """SHA-256 of a file, memoized in `file_hashes` by (path, size, mtime).
+
+    `conn` is only read from; the memo is written through the db writer.
+    """
+    st = os.stat(path)
+    row = conn.execute(
+        "SELECT content_hash FROM file_hashes WHERE path = ? AND size = ? AND mtime = ?",
+        (path, st.st_size, st.st_mtime),
+    ).fetchone()
+    if row:
+        return row["content_hash"]
+    value = hash_file(path)
+    writer.run(lambda wconn: _remember_hash(wconn, path, st, value))
+    return value
+
+
+def object_path(digest: str) -> str:
+    return os.path.join(STORE_DIR, digest[:2], f"{digest}.mp3")
+
+
+def _move_with_sidecars(src: str, dst: str):
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    os.replace(src, dst)
+    for suffix in SIDECAR_SUFFIXES:
+        if os.path.exists(src + suffix):
+            os.replace(src + suffix, dst + suffix)
+
+
+def _remove_with_sidecars(path: str):
+    for p in (path, *(path + s for s in SIDECAR_SUFFIXES)):
+        try:
+            os.remove(p)
+        except FileNotFoundError:
+            pass
+
+
+def ingest(path: str) -> str:
+    """Move an MP3 into the store and return its stored path.
+
+    When the store already holds the same audio, `path` is deleted instead.
+    """
+    digest, crc = _fingerprint(path)
+    stored = object_path(digest)
+    if os.path.abspath(path) != os.path.abspath(stored):
+        if os.path.exists(stored):
+            _remove_with_sidecars(path)
+            print(f"[AudioStore] {os.path.basename(path)} duplicates {digest[:12]}")
+        else:
+            _move_with_sidecars(path, stored)
+    st = os.stat(stored)
+
+    def save(conn):
+        conn.execute(
+            """
+            INSERT INTO audio_files(content_hash, path, size, mtime, crc32, created_at, last_access, access_count)
+            VALUES(?, ?, ?, ?, ?, ?, ?, 0)
+            ON CONFLICT(content_hash) DO UPDATE SET
+              path=excluded.path,
+              size=excluded.size,
+              mtime=excluded.mtime,
+              crc32=excluded.crc32,
+              last_access=excluded.last_access
+            """,
+            (
+                digest,
+                stored,
+                st.st_size,
+                st.st_mtime,
+                crc,
+                st.st_mtime,
+                time.time(),
+            ),
+        )
+        _remember_hash(conn, stored, st, digest)
+
+    writer.run(save)
+    return stored
+
+
+def store_mp3(video_id: str, title: str, mp3_path: str) -> str:
+    """Ingest a freshly converted MP3 and point the video at it. Returns the stored path.
+
+    Its waveform peaks are built in the background.
+    """
+    stored = ingest(mp3_path)
+    record_mp3(video_id, title, stored)
+    build_peaks(stored)
+    enforce_quota()
+    return stored
+
+
+def touch(*paths: str):
+    """Record a use of stored files (does not wait for the write)."""
+    now = time.time()
+    writer.submit(
+        lambda conn: conn.executemany(
+            "UPDATE audio_files SET last_access = ?, access_count = access_count + 1 WHERE path = ?",
+            [(now, path) for path in paths],
+        )
+    )
+
+
+def set_pinned(playlist_id: str, pinned: bool) -> bool:
+    """Pin or unpin a playlist. Returns False when it does not exist."""
+    return (
+        writer.execute(
+            "UPDATE playlists SET pinned = ? WHERE id = ?", (int(pinned), playlist_id)
+        )
+        == 1
+    )
+
+
+def _evict(row):
+    def forget(conn):
+        conn.execute(
+            "DELETE FROM audio_files WHERE content_hash = ?", (row["content_hash"],)
+        )
+        conn.execute("DELETE FROM file_hashes WHERE path = ?", (row["path"],))
+        return conn.execute(
+            "UPDATE videos SET mp3_path = NULL, last_updated=datetime('now') WHERE mp3_path = ?",
+            (row["path"],),
+        ).rowcount
+
+    # Drop the references first so nothing resolves to a file that is going away.
+    videos = writer.run(forget)
+    _remove_with_sidecars(row["path"])
+    return videos
+
+
+def enforce_quota(quota: int = QUOTA_BYTES) -> int:
+    """Evict least recently used, unpinned files until the store fits `quota`.
+
+    Returns the number of bytes freed.
+    """
+    if quota <= 0:
+        return 0
+    with _evict_lock:
+        conn = connect()
+        total = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM audio_files"
+        ).fetchone()[0]
+        if total <= quota:
+            return 0
+        candidates = conn.execute(
+            """
+            SELECT a.content_hash, a.path, a.size FROM audio_files a
+            WHERE a.last_access < ?
+              AND NOT EXISTS (
+                SELECT 1 FROM videos v JOIN playlists p ON p.id = v.playlist_id
+                WHERE v.mp3_path = a.path AND p.pinned = 1
+              )
+            ORDER BY a.last_access ASC
+            """,
+            (time.time() - EVICTION_GRACE_SECONDS,),
+        ).fetchall()
+
+        freed, files, videos = 0, 0, 0
+        for row in candidates:
+            if total - freed <= quota:
+                break
+            videos += _evict(row)
+            freed += row["size"]
+            files += 1
+        if files:
+            print(
+                f"[AudioStore] Evicted {files} file(s), {freed / (1024 * 1024):.1f} MB, cleared {videos} video(s)"
+            )
+        if total - freed > quota:
+            print(
+                f"[AudioStore] Still {(total - freed) / (1024 * 1024):.1f} MB over a {quota / (1024 * 1024):.0f} MB quota (pinned or recently used)"
+            )
+        return freed
+
+
+def adopt_existing() -> int:
+    """Move MP3s recorded before the store existed into it. Returns how many."""
+    rows = (
+        connect()
+        .execute(
+            """
+            SELECT DISTINCT mp3_path FROM videos
+            WHERE mp3_path IS NOT NULL
+              AND mp3_path NOT IN (SELECT path FROM audio_files)
+            """
+        )
+        .fetchall()
+    )
+    adopted = 0
+    for row in rows:
+        old = row["mp3_path"]
+        if not os.path.exists(old):
+            continue
+        try:
+            stored = ingest(old)
+        except OSError as e:
+            print(f"[AudioStore] Could not adopt {old}: {e}")
+            continue
+
+        def repoint(conn, old=old, stored=stored):
+            conn.execute(
+                "UPDATE videos SET mp3_path = ? WHERE mp3_path = ?", (stored, old)
+            )
+            conn.execute(
+                "UPDATE job_items SET mp3_path = ? WHERE mp3_path = ?", (stored, old)
+            )
+            conn.execute("DELETE FROM file_hashes WHERE path = ?", (old,))
+
+        writer.run(repoint)
+        adopted += 1
+    if adopted:
+        print(f"[AudioStore] Adopted {adopted} existing file(s)")
+    return adopted
+
+
+def start_maintenance():
+    """Adopt legacy files and apply the quota in the background."""
+
+    def run():
+        try:
+            adopt_existing()
+            enforce_quota()
+        except Exception as e:
+            print(f"[AudioStore] Maintenance error: {e}")
+
+    threading.Thread(target=run, daemon=True).start()
@@ -0,0 +1,116 @@
+import json
+
+# --------------------
+# Beat grid / cue point storage
+# --------------------
+# Beat times are kept out of `videos.analysis` as packed little-endian float32
+# blobs in `cue_grids`; the analysis JSON only carries a summary (beat count and
+# first beat). Other cue markers (e.g. "first_beat") are few and stay JSON.
+
+
+def pack_times(times) -> bytes:
+    import numpy as _np
+
+    return _np.asarray(times, dtype="<f4").tobytes()
+
+
+def unpack_times(blob) -> list:
+    import numpy as _np
+
+    if not blob:
+        return []
+    return [round(float(t), 3) for t in _np.frombuffer(blob, dtype="<f4")]
+
+
+def split_cues(analysis: dict):
+    """Return (analysis without `cue_points`, cue_points or None).
+
+    The returned analysis gains `beat_count` and `first_beat` summary fields
+    when cue points were present.
+    """
+    if not analysis or "cue_points" not in analysis:
+        return analysis, None
+    analysis = dict(analysis)
+    cue_points = analysis.pop("cue_points") or []
+    beats = [c["time"] for c in cue_points if c.get("label") == "beat"]
+    first = next(
+        (c["time"] for c in cue_points if c.get("label") == "first_beat"),
+        beats[0] if beats else None,
+    )
+    analysis["beat_count"] = len(beats)
+    analysis["first_beat"] = first
+    return analysis, cue_points
+
+
+def cue_row(cue_points: list) -> tuple:
+    """(beats blob, beat_count, markers JSON) as stored in `cue_grids`."""
+    beats = [c["time"] for c in cue_points if c.get("label") == "beat"]
+    markers = [c for c in cue_points if c.get("label") != "beat"]
+    return pack_times(beats), len(beats), json.dumps(markers)
+
+
+def save_cue_rows(conn, rows):
+    """Upsert (video_id, beats, beat_count, markers) rows (caller commits)."""
+    conn.executemany(
+        """
+        INSERT INTO cue_grids(video_id, beats, beat_count, markers, updated_at)
+        VALUES(?, ?, ?, ?, datetime('now'))
+        ON CONFLICT(video_id) DO UPDATE SET
+          beats=excluded.beats,
+          beat_count=excluded.beat_count,
+          markers=excluded.markers,
+          updated_at=datetime('now')
+        """,
+        rows,
+    )
+
+
+def save_cues(conn, video_id: str, cue_points: list):
+    """Replace the stored beat grid and markers of one video (caller commits)."""
+    save_cue_rows(conn, [(video_id, *cue_row(cue_points))])
+
+
+def load_cues(conn, video_id: str):
+    """Return {"beats": [...], "markers": [...]} for a video, or None."""
+    row = conn.execute(
+        "SELECT beats, markers FROM cue_grids WHERE video_id = ?", (video_id,)
+    ).fetchone()
+    if not row:
+        return None
+    return {
+        "beats": unpack_times(row["beats"]),
+        "markers": json.loads(row["markers"] or "[]"),
+    }
+
+
+def store_analysis(conn, video_id: str, analysis: dict, encoder=None):
+    """Write a video's analysis, moving any cue points into `cue_grids`.
+
+    Does not commit.
+    """
+    summary, cue_points = split_cues(analysis)
+    if cue_points is not None:
+        save_cues(conn, video_id, cue_points)
+    conn.execute(
+        "UPDATE videos SET analysis = ?, last_updated=datetime('now') WHERE video_id = ?",
+        (json.dumps(summary, cls=encoder) if summary else None, video_id),
+    )
+
+
+def migrate_inline_cues(conn) -> int:
+    """Move cue points still embedded in `videos.analysis` into `cue_grids`."""
+    rows = conn.execute(
+        "SELECT video_id, analysis FROM videos WHERE analysis LIKE '%\"cue_points\"%'"
+    ).fetchall()
+    moved = 0
+    for video_id, analysis_str in rows:
+        try:
+            analysis = json.loads(analysis_str)
+        except json.JSONDecodeError:
+            continue
+        if not isinstance(analysis, dict) or "cue_points" not in analysis:
+            continue
+        store_analysis(conn, video_id, analysis)
+        moved += 1
+    conn.commit()
+    return moved
@@ -1,6 +1,10 @@
 import os
+import queue
 import sqlite3
-from flask import g
+import threading
+from concurrent.futures import Future
+
+from .cues import migrate_inline_cues
 
 # --------------------
 # SQLite Initialization
@@ -14,24 +18,186 @@ DB_PATH = os.path.join(DATA_DIR, "app.db")
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(MP3_DIR, exist_ok=True)
 
+# --------------------
+# Connections
+# --------------------
+# The database runs in WAL mode, so readers never wait for the writer. Each
+# thread reads through its own long-lived connection; all writes go through
+# one writer thread that commits whatever is queued together.
+BUSY_TIMEOUT_MS = 30_000
+# Upper bound on writes folded into one commit.
+WRITE_BATCH_MAX = 256
+
+
+def configure(conn):
+    """Apply the per-connection settings every connection should have."""
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    # Durable at each checkpoint; safe against corruption in WAL mode.
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+def open_connection(path: str = DB_PATH):
+    return configure(sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000))
+
+
+_local = threading.local()
+
+
+def connect(path: str = DB_PATH):
+    """This thread's pooled connection to `path`, opened on first use. Do not close it."""
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        conn = conns[path] = open_connection(path)
+    return conn
+
 
 def get_db():
-    if "db" not in g:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        g.db = conn
-    return g.db
+    return connect()
 
 
 def close_db(exception):
-    db = g.pop("db", None)
-    if db is not None:
-        db.close()
+    # The connection stays open for the thread's next request; just make sure
+    # nothing left a transaction (and its locks) behind.
+    for conn in getattr(_local, "conns", {}).values():
+        if conn.in_transaction:
+            conn.rollback()
+
+
+class DBWriter:
+    """Single writer thread with group commit.
+
+    `submit(fn)` queues `fn(conn)` and returns a Future. The writer takes
+    everything queued at that moment, runs each function in its own savepoint
+    (a failing one is rolled back alone) and commits the batch once. Functions
+    must not commit themselves.
+    """
+
+    def __init__(self, path: str = DB_PATH):
+        self.path = path
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, daemon=True)
+                self._thread.start()
+
+    def submit(self, fn) -> Future:
+        future = Future()
+        self._queue.put((fn, future))
+        self._ensure_started()
+        return future
+
+    def run(self, fn):
+        """Queue `fn(conn)` and wait for its committed result."""
+        return self.submit(fn).result()
+
+    def execute(self, sql: str, params=()) -> int:
+        """Run one statement; returns its rowcount once committed."""
+        return self.run(lambda conn: conn.execute(sql, params).rowcount)
+
+    def _loop(self):
+        conn = open_connection(self.path)
+        # Transactions are managed explicitly below.
+        conn.isolation_level = None
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < WRITE_BATCH_MAX:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            outcomes = []
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for fn, future in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    conn.execute("SAVEPOINT write_item")
+                    try:
+                        result = fn(conn)
+                        conn.execute("RELEASE write_item")
+                        outcomes.append((future, result, None))
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO write_item")
+                        conn.execute("RELEASE write_item")
+                        outcomes.append((future, None, e))
+                conn.execute("COMMIT")
+            except Exception as e:
+                print(f"[DB] Write batch of {len(batch)} failed: {e}")
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                for fn, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for future, result, error in outcomes:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+
+writer = DBWriter()
+
+
+def record_mp3(video_id: str, title: str, mp3_path: str):
+    """Upsert a video's converted MP3 path."""
+    writer.execute(
+        """
+        INSERT INTO videos(video_id, title, mp3_path, last_updated)
+        VALUES(?, ?, ?, datetime('now'))
+        ON CONFLICT(video_id) DO UPDATE SET
+          title=excluded.title,
+          mp3_path=excluded.mp3_path,
+          last_updated=datetime('now')
+        """,
+        (video_id, title, mp3_path),
+    )
+
+
+# Analysis fields promoted from the `videos.analysis` JSON to typed, indexed
+# columns: column -> (type, JSON path). Triggers keep them in sync on every write.
+ANALYSIS_COLUMNS = {
+    "bpm": ("REAL", "$.bpm"),
+    "musical_key": ("TEXT", "$.key"),
+    "camelot": ("TEXT", "$.camelot"),
+    "energy": ("REAL", "$.energy"),
+}
+
+
+def add_missing_columns(cur, table: str, columns: dict) -> list:
+    """ALTER TABLE ADD COLUMN for each {name: declaration} not yet present."""
+    existing = {row[1] for row in cur.execute(f"PRAGMA table_info({table})")}
+    added = []
+    for name, declaration in columns.items():
+        if name not in existing:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {name} {declaration}")
+            added.append(name)
+    return added
+
+
+def _analysis_columns_sql(source: str) -> str:
+    return ", ".join(
+        f"{column} = json_extract({source}, '{path}')"
+        for column, (_type, path) in ANALYSIS_COLUMNS.items()
+    )
 
 
 def init_db():
-    db = sqlite3.connect(DB_PATH)
+    db = open_connection()
     try:
+        # Persistent: recorded in the database file itself.
+        db.execute("PRAGMA journal_mode = WAL")
         cur = db.cursor()
         cur.execute(
             """
@@ -64,9 +230,139 @@ def init_db():
             )
             """
         )
+        # (playlist_id, position, video_id) serves playlist filters and keyset paging;
+        # it supersedes the old single-column playlist_id index.
         cur.execute(
-            "CREATE INDEX IF NOT EXISTS idx_videos_playlist_id ON videos(playlist_id)"
+            "CREATE INDEX IF NOT EXISTS idx_videos_playlist_position ON videos(playlist_id, position, video_id)"
+        )
+        cur.execute("DROP INDEX IF EXISTS idx_videos_playlist_id")
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+              id TEXT PRIMARY KEY,
+              kind TEXT NOT NULL DEFAULT 'batch',
+              status TEXT NOT NULL DEFAULT 'queued', -- queued | running | completed | failed
+              max_workers INTEGER,
+              error TEXT,
+              created_at TEXT DEFAULT (datetime('now')),
+              updated_at TEXT DEFAULT (datetime('now'))
+            )
+            """
         )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS job_items (
+              job_id TEXT NOT NULL,
+              position INTEGER NOT NULL,
+              video_id TEXT NOT NULL,
+              title TEXT,
+              status TEXT NOT NULL DEFAULT 'queued', -- queued | running | done | failed
+              mp3_path TEXT,
+              error TEXT,
+              started_at TEXT,
+              finished_at TEXT,
+              PRIMARY KEY (job_id, position),
+              FOREIGN KEY (job_id) REFERENCES jobs (id)
+            )
+            """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)")
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS file_hashes (
+              path TEXT PRIMARY KEY,
+              size INTEGER NOT NULL,
+              mtime REAL NOT NULL,
+              content_hash TEXT NOT NULL,
+              hashed_at TEXT DEFAULT (datetime('now'))
+            )
+            """
+        )
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_file_hashes_hash ON file_hashes(content_hash)"
+        )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS analysis_cache (
+              content_hash TEXT NOT NULL,
+              feature TEXT NOT NULL,
+              tier TEXT NOT NULL,
+              analyzer_version INTEGER NOT NULL,
+              result TEXT NOT NULL, -- JSON with the keys this feature owns
+              stale INTEGER NOT NULL DEFAULT 0,
+              created_at TEXT DEFAULT (datetime('now')),
+              PRIMARY KEY (content_hash, feature, tier)
+            )
+            """
+        )
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_analysis_cache_stale ON analysis_cache(stale)"
+        )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS audio_files (
+              content_hash TEXT PRIMARY KEY,
+              path TEXT NOT NULL UNIQUE,
+              size INTEGER NOT NULL,
+              created_at REAL NOT NULL,
+              last_access REAL NOT NULL, -- unix time, drives LRU eviction
+              access_count INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        # File index (see file_index.py) and cached CRC32 for zip_archive.py
+        add_missing_columns(cur, "audio_files", {"mtime": "REAL", "crc32": "INTEGER"})
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_audio_files_last_access ON audio_files(last_access)"
+        )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cue_grids (
+              video_id TEXT PRIMARY KEY,
+              beats BLOB, -- packed little-endian float32 beat times (seconds)
+              beat_count INTEGER NOT NULL DEFAULT 0,
+              markers TEXT, -- JSON list of non-beat cue points
+              updated_at TEXT DEFAULT (datetime('now')),
+              FOREIGN KEY (video_id) REFERENCES videos (video_id)
+            )
+            """
+        )
+
+        # Pinned playlists keep their MP3s through quota eviction
+        add_missing_columns(cur, "playlists", {"pinned": "INTEGER NOT NULL DEFAULT 0"})
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_videos_mp3_path ON videos(mp3_path)"
+        )
+        added = add_missing_columns(
+            cur,
+            "videos",
+            {column: ctype for column, (ctype, _path) in ANALYSIS_COLUMNS.items()},
+        )
+        for event in ("INSERT", "UPDATE OF analysis"):
+            name = "videos_analysis_" + event.split()[0].lower()
+            cur.execute(
+                f"""
+                CREATE TRIGGER IF NOT EXISTS {name}
+                AFTER {event} ON videos
+                BEGIN
+                  UPDATE videos SET {_analysis_columns_sql("NEW.analysis")}
+                  WHERE video_id = NEW.video_id AND json_valid(NEW.analysis);
+                  UPDATE videos SET {", ".join(f"{c} = NULL" for c in ANALYSIS_COLUMNS)}
+                  WHERE video_id = NEW.video_id AND NEW.analysis IS NULL;
+                END
+                """
+            )
+        if added:
+            cur.execute(
+                f"UPDATE videos SET {_analysis_columns_sql('analysis')} WHERE json_valid(analysis)"
+            )
+            print(f"[DB] Added and backfilled videos columns: {', '.join(added)}")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_videos_bpm ON videos(bpm)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_videos_camelot ON videos(camelot)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_videos_energy ON videos(energy)")
         db.commit()
+        moved = migrate_inline_cues(db)
+        if moved:
+            print(f"[DB] Moved cue points of {moved} video(s) into cue_grids")
     finally:
         db.close()
@@ -0,0 +1,164 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+from .db import DATA_DIR, connect
+
+# --------------------
+# yt-dlp extraction cache
+# --------------------
+# Signed googlevideo URLs carry their own expiry (`expire=<unix ts>`), so we can
+# hand them out again until shortly before that moment without touching yt-dlp.
+CACHE_DB_PATH = os.path.join(DATA_DIR, "extract_cache.db")
+
+# Used when the stream URL does not expose an expiry.
+DEFAULT_TTL_SECONDS = int(os.environ.get("YTMP3_EXTRACT_CACHE_TTL", "3600"))
+# Entries closer than this to expiry are treated as misses (a stream must finish).
+EXPIRY_SAFETY_SECONDS = 120
+# Entries closer than this to expiry are served but refreshed in the background.
+REFRESH_AHEAD_SECONDS = 15 * 60
+
+_refreshing: set[str] = set()
+_refreshing_lock = threading.Lock()
+
+
+def _connect():
+    """This thread's connection to the cache database (see db.connect)."""
+    return connect(CACHE_DB_PATH)
+
+
+def init_extract_cache():
+    db = _connect()
+    # Persistent, like the main database: readers never wait for a writer.
+    db.execute("PRAGMA journal_mode = WAL")
+    db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS extractions (
+          video_id TEXT PRIMARY KEY,
+          title TEXT,
+          download_url TEXT NOT NULL,
+          file_ext TEXT,
+          content_type TEXT,
+          content_length_est TEXT,
+          headers TEXT, -- JSON object of request headers
+          format_id TEXT,
+          expires_at REAL NOT NULL,
+          created_at REAL NOT NULL
+        )
+        """
+    )
+    db.commit()
+
+
+def url_expiry(download_url: str):
+    """Return the unix expiry embedded in a signed googlevideo URL, if any."""
+    try:
+        query = parse_qs(urlparse(download_url).query)
+        expire = query.get("expire")
+        if expire:
+            return float(expire[0])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def get_entry(video_id: str):
+    """Return a cached stream entry dict, or None when missing or about to expire."""
+    try:
+        row = (
+            _connect()
+            .execute("SELECT * FROM extractions WHERE video_id = ?", (video_id,))
+            .fetchone()
+        )
+    except sqlite3.Error as e:
+        print(f"[ExtractCache] Lookup failed for {video_id}: {e}")
+        return None
+
+    if not row:
+        return None
+    remaining = row["expires_at"] - time.time()
+    if remaining < EXPIRY_SAFETY_SECONDS:
+        return None
+
+    entry = dict(row)
+    entry["headers"] = json.loads(entry["headers"] or "{}")
+    entry["expires_in"] = remaining
+    return entry
+
+
+def put_entry(video_id: str, entry: dict):
+    now = time.time()
+    expires_at = url_expiry(entry["download_url"]) or now + DEFAULT_TTL_SECONDS
+    db = _connect()
+    try:
+        db.execute(
+            """
+            INSERT INTO extractions(video_id, title, download_url, file_ext, content_type,
+                                    content_length_est, headers, format_id, expires_at, created_at)
+            VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(video_id) DO UPDATE SET
+              title=excluded.title,
+              download_url=excluded.download_url,
+              file_ext=excluded.file_ext,
+              content_type=excluded.content_type,
+              content_length_est=excluded.content_length_est,
+              headers=excluded.headers,
+              format_id=excluded.format_id,
+              expires_at=excluded.expires_at,
+              created_at=excluded.created_at
+            """,
+            (
+                video_id,
+                entry.get("title"),
+                entry["download_url"],
+                entry.get("file_ext"),
+                entry.get("content_type"),
+                entry.get("content_length_est"),
+                json.dumps(entry.get("headers") or {}),
+                entry.get("format_id"),
+                expires_at,
+                now,
+            ),
+        )
+        db.commit()
+    except sqlite3.Error as e:
+        print(f"[ExtractCache] Store failed for {video_id}: {e}")
+        db.rollback()
+
+
+def invalidate(video_id: str):
+    db = _connect()
+    try:
+        db.execute("DELETE FROM extractions WHERE video_id = ?", (video_id,))
+        db.commit()
+    except sqlite3.Error:
+        db.rollback()
+        raise
+
+
+def refresh_in_background(video_id: str, resolve):
+    """Re-run `resolve(video_id)` on a daemon thread, at most once per video at a time."""
+    with _refreshing_lock:
+        if video_id in _refreshing:
+            return
+        _refreshing.add(video_id)
+
+    def worker():
+        t_start = time.time()
+        try:
+            entry = resolve(video_id)
+            if entry:
+                put_entry(video_id, entry)
+                print(
+                    f"[ExtractCache] Refreshed {video_id} in {time.time() - t_start:.1f}s"
+                )
+        except Exception as e:
+            print(f"[ExtractCache] Background refresh failed for {video_id}: {e}")
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(video_id)
+
+    threading.Thread(target=worker, daemon=True).start()
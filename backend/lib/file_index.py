@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+
+from .audio_store import STORE_DIR, SIDECAR_SUFFIXES
+from .db import connect, writer
+
+# --------------------
+# Stored MP3 index
+# --------------------
+# `audio_files` doubles as an index of what is on disk: size and mtime per
+# stored file, so request handlers resolve a whole batch of video IDs with one
+# query instead of a SELECT and two stats per ID. The reconciler keeps it
+# honest: a full scan at startup and then every YTMP3_FILE_RECONCILE_SECONDS.
+RECONCILE_INTERVAL_SECONDS = int(os.environ.get("YTMP3_FILE_RECONCILE_SECONDS", "300"))
+# SQLite's default limit on host parameters is 999.
+ID_CHUNK_SIZE = 500
+
+
+def resolve_mp3s(conn, video_ids) -> dict:
+    """Map each video ID that has a stored MP3 to {path, size, title, analysis}."""
+    video_ids = list(dict.fromkeys(video_ids))
+    found = {}
+    for i in range(0, len(video_ids), ID_CHUNK_SIZE):
+        chunk = video_ids[i : i + ID_CHUNK_SIZE]
+        for row in conn.execute(
+            f"""
+            SELECT v.video_id, v.title, v.analysis, a.path, a.size
+            FROM videos v JOIN audio_files a ON a.path = v.mp3_path
+            WHERE v.video_id IN ({','.join('?' for _ in chunk)})
+            """,
+            chunk,
+        ):
+            found[row["video_id"]] = {
+                "path": row["path"],
+                "size": row["size"],
+                "title": row["title"],
+                "analysis": row["analysis"],
+            }
+    return found
+
+
+def _scan_store() -> dict:
+    """{path: (size, mtime)} for every MP3 under STORE_DIR."""
+    files = {}
+    if not os.path.isdir(STORE_DIR):
+        return files
+    for bucket in os.scandir(STORE_DIR):
+        if not bucket.is_dir():
+            continue
+        for entry in os.scandir(bucket.path):
+            if entry.name.endswith(".mp3") and entry.is_file():
+                st = entry.stat()
+                files[entry.path] = (st.st_size, st.st_mtime)
+    return files
+
+
+def reconcile() -> dict:
+    """Bring `audio_files` in line with STORE_DIR. Returns change counts."""
+    # Index first, disk second: a file stored in between then shows up as
+    # untracked (harmless) rather than as missing.
+    indexed = {
+        r["path"]: r
+        for r in connect().execute(
+            "SELECT content_hash, path, size, mtime FROM audio_files"
+        )
+    }
+    on_disk = _scan_store()
+
+    missing = [
+        path for path in indexed if path not in on_disk and not os.path.exists(path)
+    ]
+    changed = [
+        (size, mtime, path)
+        for path, (size, mtime) in on_disk.items()
+        if path in indexed
+        and (indexed[path]["size"], indexed[path]["mtime"]) != (size, mtime)
+    ]
+    # Left behind by a crash between moving a file and recording it; the
+    # file name is its content hash.
+    untracked = [
+        (os.path.basename(path)[:-4], path, size, mtime, mtime, mtime)
+        for path, (size, mtime) in on_disk.items()
+        if path not in indexed
+    ]
+
+    if missing or changed or untracked:
+
+        def apply(conn):
+            conn.executemany(
+                "UPDATE audio_files SET size = ?, mtime = ?, crc32 = NULL WHERE path = ?",
+                changed,
+            )
+            conn.executemany(
+                "DELETE FROM file_hashes WHERE path = ?",
+                [(path,) for path in missing]
+                + [(path,) for _size, _mtime, path in changed],
+            )
+            conn.executemany(
+                "DELETE FROM audio_files WHERE path = ?", [(p,) for p in missing]
+            )
+            # Vanished files are handled like evictions: the next use re-downloads.
+            conn.executemany(
+                "UPDATE videos SET mp3_path = NULL, last_updated=datetime('now') WHERE mp3_path = ?",
+                [(p,) for p in missing],
+            )
+            conn.executemany(
+                """
+                INSERT INTO audio_files(content_hash, path, size, mtime, created_at, last_access)
+                VALUES(?, ?, ?, ?, ?, ?)
+                ON CONFLICT(content_hash) DO UPDATE SET
+                  path=excluded.path,
+                  size=excluded.size,
+                  mtime=excluded.mtime
+                """,
+                untracked,
+            )
+
+        writer.run(apply)
+        for path in missing:
+            for suffix in SIDECAR_SUFFIXES:
+                try:
+                    os.remove(path + suffix)
+                except FileNotFoundError:
+                    pass
+
+    counts = {
+        "files": len(on_disk),
+        "missing": len(missing),
+        "changed": len(changed),
+        "untracked": len(untracked),
+    }
+    if missing or changed or untracked:
+        print(f"[FileIndex] Reconciled: {counts}")
+    return counts
+
+
+class Reconciler:
+    """Background thread that rescans the store periodically."""
+
+    def __init__(self, interval: int = RECONCILE_INTERVAL_SECONDS):
+        self.interval = interval
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        """Rescan now instead of waiting for the next interval."""
+        self._wake.set()
+
+    def _loop(self):
+        first = True
+        while True:
+            t_start = time.time()
+            try:
+                counts = reconcile()
+                if first:
+                    print(
+                        f"[FileIndex] Startup scan: {counts['files']} file(s) in {time.time() - t_start:.2f}s"
+                    )
+                first = False
+            except Exception as e:
+                print(f"[FileIndex] Reconcile error: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+
+reconciler = Reconciler()
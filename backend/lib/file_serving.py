@@ -0,0 +1,214 @@
+import os
+import uuid
+
+from flask import Response, request
+from werkzeug.http import http_date
+
+# --------------------
+# File serving
+# --------------------
+# One implementation of validators, conditional requests and byte ranges for
+# everything that sends stored bytes: MP3s, peak files and ZIP archives.
+# - strong ETags from file identity (inode, size, mtime), plus Last-Modified
+# - If-None-Match / If-Modified-Since -> 304
+# - Range (single -> 206, several -> multipart/byteranges), guarded by If-Range
+# - bodies that run to the end of the file (whole files, `bytes=N-` seeks) go
+#   through the server's wsgi.file_wrapper when it has one, which gunicorn and
+#   waitress turn into os.sendfile
+READ_CHUNK_SIZE = 1024 * 1024
+# More ranges than this get the whole representation instead (RFC 9110 14.2).
+MAX_RANGES = 32
+# Stored MP3s and peaks only change when a file is evicted and re-downloaded;
+# the ETag catches that when the client revalidates.
+AUDIO_CACHE_CONTROL = "public, max-age=604800"
+
+
+def file_etag(st) -> str:
+    return f"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"
+
+
+def _read_window(path: str, start: int, stop: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            chunk = f.read(min(READ_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def parse_ranges(header: str, size: int):
+    """Parse a `bytes=` Range header into merged, sorted [(start, stop)].
+
+    Returns None when the header is absent or malformed (it is then ignored)
+    and [] when no range is satisfiable. Unlike werkzeug's parser this accepts
+    overlapping and unordered ranges, which clients may send.
+    """
+    if not header:
+        return None
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+    spans = []
+    for spec in specs.split(","):
+        first, sep, last = spec.strip().partition("-")
+        try:
+            if not sep:
+                return None
+            if not first:  # suffix range: the last N bytes
+                length = int(last)
+                start, stop = max(0, size - length), size
+            else:
+                start = int(first)
+                stop = size if not last else min(int(last) + 1, size)
+                if last and int(last) < start:
+                    return None
+        except ValueError:
+            return None
+        if start < stop:
+            spans.append((start, stop))
+    spans.sort()
+    merged = []
+    for start, stop in spans:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def _if_range_allows(etag: str, last_modified) -> bool:
+    if_range = request.if_range
+    if if_range.etag is None and if_range.date is None:
+        return True
+    if if_range.etag is not None:
+        # Strong comparison only; a weak validator never matches
+        return if_range.etag == etag and not request.headers.get(
+            "If-Range", ""
+        ).startswith("W/")
+    return last_modified is not None and int(last_modified) == int(
+        if_range.date.timestamp()
+    )
+
+
+def _not_modified(etag: str, last_modified) -> bool:
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified is not None:
+        return int(last_modified) <= request.if_modified_since.timestamp()
+    return False
+
+
+def send_bytes(
+    size: int,
+    read,
+    mimetype: str,
+    etag: str,
+    last_modified=None,
+    download_name: str = None,
+    cache_control: str = "no-cache",
+    open_at=None,
+):
+    """Serve a representation of `size` bytes.
+
+    `read(start, stop)` yields its bytes in [start, stop). `open_at(start)`,
+    when given, returns a file object positioned at `start` whose end is the
+    end of the representation, used for zero-copy transfer.
+    """
+    headers = {"Accept-Ranges": "bytes", "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    if download_name:
+        headers["Content-Disposition"] = f'attachment; filename="{download_name}"'
+
+    if request.method in ("GET", "HEAD") and _not_modified(etag, last_modified):
+        response = Response(status=304, headers=headers)
+        response.set_etag(etag)
+        return response
+
+    spans = [(0, size)]
+    status = 200
+    requested = parse_ranges(request.headers.get("Range"), size)
+    if requested is not None and _if_range_allows(etag, last_modified):
+        if not requested:
+            response = Response(status=416, headers=headers)
+            response.headers["Content-Range"] = f"bytes */{size}"
+            return response
+        if len(requested) <= MAX_RANGES:
+            spans, status = requested, 206
+
+    if len(spans) == 1:
+        start, stop = spans[0]
+        file_wrapper = request.environ.get("wsgi.file_wrapper")
+        if open_at and file_wrapper and start < stop == size:
+            body = file_wrapper(open_at(start), READ_CHUNK_SIZE)
+        else:
+            body = read(start, stop)
+        response = Response(body, status=status, mimetype=mimetype, headers=headers)
+        response.direct_passthrough = True
+        response.headers["Content-Length"] = str(stop - start)
+        if status == 206:
+            response.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+    else:
+        boundary = uuid.uuid4().hex
+        part_headers = [
+            (
+                f"--{boundary}\r\nContent-Type: {mimetype}\r\n"
+                f"Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n"
+            ).encode("latin-1")
+            for start, stop in spans
+        ]
+        closing = f"--{boundary}--\r\n".encode("latin-1")
+        length = sum(
+            len(h) + (stop - start) + 2 for h, (start, stop) in zip(part_headers, spans)
+        )
+
+        def multipart():
+            for head, (start, stop) in zip(part_headers, spans):
+                yield head
+                yield from read(start, stop)
+                yield b"\r\n"
+            yield closing
+
+        response = Response(
+            multipart(),
+            status=206,
+            mimetype=f"multipart/byteranges; boundary={boundary}",
+            headers=headers,
+        )
+        response.direct_passthrough = True
+        response.headers["Content-Length"] = str(length + len(closing))
+    response.set_etag(etag)
+    return response
+
+
+def send_file(
+    path: str,
+    mimetype: str,
+    download_name: str = None,
+    cache_control: str = AUDIO_CACHE_CONTROL,
+    window=None,
+    etag: str = None,
+):
+    """Serve a file, or the (offset, length) `window` of it as if it were whole."""
+    st = os.stat(path)
+    base, size = window or (0, st.st_size)
+
+    def open_at(start: int):
+        f = open(path, "rb")
+        f.seek(base + start)
+        return f
+
+    return send_bytes(
+        size,
+        lambda start, stop: _read_window(path, base + start, base + stop),
+        mimetype,
+        etag or file_etag(st),
+        last_modified=st.st_mtime,
+        download_name=download_name,
+        cache_control=cache_control,
+        # A window that ends before EOF cannot be handed to file_wrapper
+        open_at=open_at if base + size == st.st_size else None,
+    )
@@ -0,0 +1,278 @@
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# --------------------
+# Pooled HTTP and parallel range fetching
+# --------------------
+# Every upstream audio request goes through one keep-alive Session, with a
+# retry policy for connection errors and transient statuses. Large files are
+# fetched as parallel byte-range segments, each retried on its own and resumed
+# from the last byte received, so download speed no longer depends on aria2c
+# being installed. The first ranged GET doubles as the probe: a 206 reports the
+# total size, a 200 means the server ignores ranges and is read in one piece.
+SEGMENT_SIZE = 4 * 1024 * 1024
+SEGMENT_WORKERS = int(os.environ.get("YTMP3_SEGMENT_WORKERS", "8"))
+SEGMENT_RETRIES = 5
+# When relaying to a client, only this many segments are buffered ahead of it.
+STREAM_SEGMENT_SIZE = 1024 * 1024
+STREAM_LOOKAHEAD = 4
+READ_CHUNK_SIZE = 64 * 1024
+TIMEOUT = (10, 120)  # connect, read
+POOL_SIZE = 64
+# Rejected or expired signed URLs; retrying them does not help.
+FATAL_STATUSES = (401, 403, 404, 410)
+CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def session() -> requests.Session:
+    """The shared Session (thread-safe for concurrent requests)."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=3,
+                backoff_factor=0.5,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset({"GET", "HEAD"}),
+                respect_retry_after_header=True,
+                # Hand the last response back instead of raising
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(
+                pool_connections=16, pool_maxsize=POOL_SIZE, max_retries=retry
+            )
+            _session = requests.Session()
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def _segments(start: int, stop: int, segment_size: int) -> list:
+    return [(s, min(s + segment_size, stop)) for s in range(start, stop, segment_size)]
+
+
+def fetch_range(url: str, headers: dict, start: int, stop: int, write):
+    """GET bytes [start, stop), passing each chunk to `write(offset, chunk)`.
+
+    Interrupted transfers are retried with backoff from the last byte written;
+    a status in FATAL_STATUSES raises HTTPError at once.
+    """
+    pos, attempt = start, 0
+    while pos < stop:
+        try:
+            with session().get(
+                url,
+                headers={**headers, "Range": f"bytes={pos}-{stop - 1}"},
+                stream=True,
+                timeout=TIMEOUT,
+            ) as r:
+                if r.status_code in FATAL_STATUSES:
+                    r.raise_for_status()
+                match = CONTENT_RANGE.match(r.headers.get("Content-Range", ""))
+                if r.status_code != 206 or not match or int(match.group(1)) != pos:
+                    raise IOError(f"unexpected response {r.status_code} for a range")
+                for chunk in r.iter_content(READ_CHUNK_SIZE):
+                    chunk = chunk[: stop - pos]
+                    write(pos, chunk)
+                    pos += len(chunk)
+                    if pos >= stop:
+                        break
+            if pos < stop:
+                raise IOError("connection closed early")
+        except requests.HTTPError:
+            raise
+        except IOError as e:
+            attempt += 1
+            if attempt > SEGMENT_RETRIES:
+                raise
+            print(
+                f"[Fetch] Segment {start}-{stop} retry {attempt}/{SEGMENT_RETRIES} at byte {pos}: {e}"
+            )
+            time.sleep(min(0.5 * 2 ** (attempt - 1), 8))
+
+
+class _Progress:
+    def __init__(self, total, on_progress):
+        self.total = total
+        self.done = 0
+        self._on_progress = on_progress
+        self._t_start = time.time()
+        self._lock = threading.Lock()
+
+    def add(self, n: int):
+        if not self._on_progress:
+            return
+        with self._lock:
+            self.done += n
+            elapsed = time.time() - self._t_start
+            self._on_progress(
+                self.done, self.total, self.done / elapsed if elapsed else None
+            )
+
+
+class RangedSource:
+    """A remote file opened with a ranged GET for its first segment."""
+
+    def __init__(self, url: str, headers: dict, first_segment: int = SEGMENT_SIZE):
+        self.url = url
+        self.headers = {k: v for k, v in headers.items() if k.lower() != "range"}
+        self.response = session().get(
+            url,
+            headers={**self.headers, "Range": f"bytes=0-{first_segment - 1}"},
+            stream=True,
+            timeout=TIMEOUT,
+        )
+        if 400 <= self.response.status_code and (
+            self.response.status_code not in FATAL_STATUSES
+        ):
+            print(
+                f"[Fetch] Ranged request failed ({self.response.status_code}); retrying without Range"
+            )
+            self.response.close()
+            self.response = session().get(
+                url, headers=self.headers, stream=True, timeout=TIMEOUT
+            )
+        self.status = self.response.status_code
+        self.size, self.first_stop, self.ranged = None, None, False
+        match = CONTENT_RANGE.match(self.response.headers.get("Content-Range", ""))
+        if self.status == 206 and match and match.group(1) == "0":
+            if match.group(3) != "*":
+                self.ranged = True
+                self.first_stop = int(match.group(2)) + 1
+                self.size = int(match.group(3))
+        elif self.status == 200 and self.response.headers.get("Content-Length"):
+            self.size = int(self.response.headers["Content-Length"])
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            self.close()
+            self.response.raise_for_status()
+
+    def close(self):
+        self.response.close()
+
+    def _read_first(self, write) -> int:
+        """Pass the first response's body to `write`; returns where it ended."""
+        pos = 0
+        try:
+            with self.response:
+                for chunk in self.response.iter_content(READ_CHUNK_SIZE):
+                    write(pos, chunk)
+                    pos += len(chunk)
+        except requests.RequestException as e:
+            if not self.ranged:
+                raise
+            print(f"[Fetch] First segment interrupted at byte {pos}: {e}")
+        if self.ranged and pos < self.first_stop:
+            fetch_range(self.url, self.headers, pos, self.first_stop, write)
+            pos = self.first_stop
+        return pos
+
+    def _fetch_bytes(self, start: int, stop: int) -> bytes:
+        buf = bytearray(stop - start)
+
+        def write(offset, chunk):
+            buf[offset - start : offset - start + len(chunk)] = chunk
+
+        fetch_range(self.url, self.headers, start, stop, write)
+        return bytes(buf)
+
+    def iter_bytes(
+        self, lookahead: int = STREAM_LOOKAHEAD, segment_size: int = STREAM_SEGMENT_SIZE
+    ):
+        """Yield the body in order. The first segment streams straight through
+        while the next `lookahead` segments are fetched in parallel."""
+        if not self.ranged:
+            with self.response:
+                yield from self.response.iter_content(READ_CHUNK_SIZE)
+            return
+
+        segments = iter(_segments(self.first_stop, self.size, segment_size))
+        executor = ThreadPoolExecutor(max_workers=lookahead)
+        try:
+            pending = deque(
+                executor.submit(self._fetch_bytes, *seg)
+                for _, seg in zip(range(lookahead), segments)
+            )
+            pos = 0
+            try:
+                with self.response:
+                    for chunk in self.response.iter_content(READ_CHUNK_SIZE):
+                        pos += len(chunk)
+                        yield chunk
+            except requests.RequestException as e:
+                print(f"[Fetch] First segment interrupted at byte {pos}: {e}")
+            if pos < self.first_stop:
+                yield self._fetch_bytes(pos, self.first_stop)
+            while pending:
+                data = pending.popleft().result()
+                seg = next(segments, None)
+                if seg:
+                    pending.append(executor.submit(self._fetch_bytes, *seg))
+                yield data
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.close()
+
+    def save(
+        self,
+        path: str,
+        workers: int = SEGMENT_WORKERS,
+        segment_size: int = SEGMENT_SIZE,
+        on_progress=None,
+    ):
+        """Write the body to `path` (through `path.part`), segments in parallel.
+
+        `on_progress(downloaded, total, speed)` is called as bytes arrive.
+        """
+        part = path + ".part"
+        progress = _Progress(self.size, on_progress)
+        lock = threading.Lock()
+        try:
+            with open(part, "wb") as f:
+                if self.size:
+                    f.truncate(self.size)
+
+                def write(offset, chunk):
+                    with lock:
+                        f.seek(offset)
+                        f.write(chunk)
+                    progress.add(len(chunk))
+
+                if not self.ranged:
+                    self._read_first(write)
+                else:
+                    executor = ThreadPoolExecutor(max_workers=max(1, workers))
+                    try:
+                        futures = [executor.submit(self._read_first, write)] + [
+                            executor.submit(
+                                fetch_range, self.url, self.headers, start, stop, write
+                            )
+                            for start, stop in _segments(
+                                self.first_stop, self.size, segment_size
+                            )
+                        ]
+                        for future in as_completed(futures):
+                            future.result()
+                    finally:
+                        # On failure, queued segments are dropped
+                        executor.shutdown(cancel_futures=True)
+            os.replace(part, path)
+        except BaseException:
+            self.close()
+            try:
+                os.remove(part)
+            except FileNotFoundError:
+                pass
+            raise
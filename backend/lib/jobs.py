@@ -0,0 +1,237 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .audio_store import store_mp3, touch
+from .db import MP3_DIR, connect, writer
+from .file_index import resolve_mp3s
+from .progress import ItemProgress, bus
+from .youtube import download_audio
+
+# --------------------
+# Durable batch jobs
+# --------------------
+# Jobs and their items live in SQLite, so a job outlives the HTTP request that
+# created it and picks up where it stopped after a backend restart.
+POLL_INTERVAL_SECONDS = 5
+
+
+def convert_item(video_id: str, title: str, on_event=None):
+    """Download + convert one video and add it to the audio store. Returns the stored path."""
+    final_mp3_path, _title = download_audio(video_id, MP3_DIR, on_event=on_event)
+    if not final_mp3_path:
+        raise FileNotFoundError("MP3 output not found after conversion")
+
+    return store_mp3(video_id, title, final_mp3_path)
+
+
+def create_job(items: list, max_workers: int) -> str:
+    job_id = uuid.uuid4().hex
+
+    def insert(conn):
+        conn.execute(
+            "INSERT INTO jobs(id, kind, status, max_workers) VALUES(?, 'batch', 'queued', ?)",
+            (job_id, max_workers),
+        )
+        conn.executemany(
+            "INSERT INTO job_items(job_id, position, video_id, title) VALUES(?, ?, ?, ?)",
+            [
+                (job_id, idx, item["id"], item["title"])
+                for idx, item in enumerate(items)
+            ],
+        )
+
+    writer.run(insert)
+    for item in items:
+        ItemProgress(job_id, item["id"], item["title"])("queued")
+    return job_id
+
+
+def get_job(job_id: str):
+    """Return {"job": ..., "items": [...], "counts": {...}} or None."""
+    conn = connect()
+    job = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if not job:
+        return None
+    items = conn.execute(
+        """
+        SELECT position, video_id AS id, title, status, mp3_path, error, started_at, finished_at
+        FROM job_items
+        WHERE job_id = ?
+        ORDER BY position ASC
+        """,
+        (job_id,),
+    ).fetchall()
+
+    items = [dict(r) for r in items]
+    counts: dict[str, int] = {}
+    for item in items:
+        counts[item["status"]] = counts.get(item["status"], 0) + 1
+    counts["total"] = len(items)
+    return {"job": dict(job), "items": items, "counts": counts}
+
+
+def completed_files(job_id: str):
+    """Return [(mp3_path, title)] for the job's finished items that are still on disk
+    (per the `audio_files` index)."""
+    rows = (
+        connect()
+        .execute(
+            """
+            SELECT j.mp3_path, j.title FROM job_items j
+            JOIN audio_files a ON a.path = j.mp3_path
+            WHERE j.job_id = ? AND j.status = 'done'
+            ORDER BY j.position ASC
+            """,
+            (job_id,),
+        )
+        .fetchall()
+    )
+    return [(r["mp3_path"], r["title"]) for r in rows]
+
+
+class JobRunner:
+    """Background thread that drains queued jobs one at a time."""
+
+    def __init__(self):
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._recover()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        self._wake.set()
+
+    def _recover(self):
+        # Items that were mid-flight when the process died are simply retried.
+        requeued = writer.execute(
+            "UPDATE job_items SET status='queued', started_at=NULL WHERE status='running'"
+        )
+        if requeued:
+            print(f"[Jobs] Re-queued {requeued} interrupted item(s)")
+
+    def _next_job(self):
+        return (
+            connect()
+            .execute(
+                """
+                SELECT * FROM jobs
+                WHERE status IN ('queued', 'running')
+                ORDER BY created_at ASC
+                LIMIT 1
+                """
+            )
+            .fetchone()
+        )
+
+    def _loop(self):
+        while True:
+            try:
+                job = self._next_job()
+                if job:
+                    self._run_job(job)
+                    continue
+            except Exception as e:
+                print(f"[Jobs] Runner error: {e}")
+            self._wake.wait(POLL_INTERVAL_SECONDS)
+            self._wake.clear()
+
+    def _claim_item(self, job_id: str, position: int) -> bool:
+        claimed = writer.execute(
+            """
+            UPDATE job_items SET status='running', started_at=datetime('now')
+            WHERE job_id=? AND position=? AND status='queued'
+            """,
+            (job_id, position),
+        )
+        return claimed == 1
+
+    def _finish_item(self, job_id: str, position: int, mp3_path=None, error=None):
+        writer.execute(
+            """
+            UPDATE job_items
+            SET status=?, mp3_path=?, error=?, finished_at=datetime('now')
+            WHERE job_id=? AND position=?
+            """,
+            ("failed" if error else "done", mp3_path, error, job_id, position),
+        )
+
+    def _set_job_status(self, job_id: str, status: str, error=None):
+        writer.execute(
+            "UPDATE jobs SET status=?, error=?, updated_at=datetime('now') WHERE id=?",
+            (status, error, job_id),
+        )
+
+    def _process_item(self, job_id: str, item):
+        position, vid, title = item["position"], item["video_id"], item["title"]
+        if not self._claim_item(job_id, position):
+            return
+        t_start = time.time()
+        progress = ItemProgress(job_id, vid, title)
+        print(f"[Jobs] {job_id[:8]} downloading: {title} [{vid}]")
+        try:
+            existing = resolve_mp3s(connect(), [vid]).get(vid)
+            if existing:
+                mp3_path = existing["path"]
+                touch(mp3_path)
+            else:
+                mp3_path = convert_item(vid, title, on_event=progress)
+            self._finish_item(job_id, position, mp3_path=mp3_path)
+            progress("done", size=os.path.getsize(mp3_path))
+            print(f"[Jobs] {job_id[:8]} done: {title} in {time.time() - t_start:.1f}s")
+        except Exception as e:
+            self._finish_item(job_id, position, error=str(e))
+            progress("failed", error=str(e))
+            print(
+                f"[Jobs] {job_id[:8]} FAILED: {title} [{vid}] after {time.time() - t_start:.1f}s -> {e}"
+            )
+
+    def _run_job(self, job):
+        job_id = job["id"]
+        self._set_job_status(job_id, "running")
+        pending = (
+            connect()
+            .execute(
+                "SELECT position, video_id, title FROM job_items WHERE job_id=? AND status='queued'",
+                (job_id,),
+            )
+            .fetchall()
+        )
+
+        t_start = time.time()
+        if pending:
+            max_workers = max(1, min(job["max_workers"] or 4, 8, len(pending)))
+            print(
+                f"[Jobs] Running {job_id[:8]}: {len(pending)} item(s) with {max_workers} worker(s)"
+            )
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [
+                    executor.submit(self._process_item, job_id, item)
+                    for item in pending
+                ]
+                for future in as_completed(futures):
+                    future.result()
+
+        summary = get_job(job_id)
+        counts = summary["counts"] if summary else {}
+        if counts.get("queued") or counts.get("running"):
+            # Another runner holds some items; leave the job to be picked up again.
+            time.sleep(POLL_INTERVAL_SECONDS)
+            return
+        if counts.get("done"):
+            self._set_job_status(job_id, "completed")
+            bus.end(job_id, status="completed", counts=counts)
+        else:
+            self._set_job_status(job_id, "failed", "No items could be processed")
+            bus.end(job_id, status="failed", counts=counts)
+        print(f"[Jobs] Finished {job_id[:8]} in {time.time() - t_start:.1f}s: {counts}")
+
+
+job_runner = JobRunner()
@@ -0,0 +1,125 @@
+from functools import lru_cache
+
+# --------------------
+# Musical key estimation
+# --------------------
+# Krumhansl-Kessler profiles correlated against mean chroma vectors. All 24 keys
+# are scored at once against a precomputed matrix of rotated, standardized
+# profiles, for one track or a stacked (N_tracks x 12) chroma matrix.
+
+PITCH_CLASSES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+
+# Krumhansl-Kessler key profiles (major/minor)
+MAJOR_PROFILE = (6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88)
+MINOR_PROFILE = (6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17)
+
+# Camelot wheel codes (B = major, A = minor)
+CAMELOT = {
+    "C major": "8B",
+    "G major": "9B",
+    "D major": "10B",
+    "A major": "11B",
+    "E major": "12B",
+    "B major": "1B",
+    "F# major": "2B",
+    "C# major": "3B",
+    "G# major": "4B",
+    "D# major": "5B",
+    "A# major": "6B",
+    "F major": "7B",
+    "A minor": "8A",
+    "E minor": "9A",
+    "B minor": "10A",
+    "F# minor": "11A",
+    "C# minor": "12A",
+    "G# minor": "1A",
+    "D# minor": "2A",
+    "A# minor": "3A",
+    "F minor": "4A",
+    "C minor": "5A",
+    "G minor": "6A",
+    "D minor": "7A",
+}
+
+# Row order of the profile matrix: the 12 major keys, then the 12 minor keys.
+KEY_LABELS = [f"{pc} major" for pc in PITCH_CLASSES] + [
+    f"{pc} minor" for pc in PITCH_CLASSES
+]
+
+
+def _standardize(x, axis: int = -1):
+    import numpy as _np
+
+    x = _np.asarray(x, dtype=_np.float64)
+    centered = x - x.mean(axis=axis, keepdims=True)
+    std = centered.std(axis=axis, keepdims=True)
+    with _np.errstate(invalid="ignore", divide="ignore"):
+        return centered / std
+
+
+@lru_cache(maxsize=1)
+def _profile_matrix():
+    """(24, 12) standardized profiles; row i is KEY_LABELS[i] rotated to its tonic."""
+    import numpy as _np
+
+    rows = [_np.roll(MAJOR_PROFILE, i) for i in range(12)] + [
+        _np.roll(MINOR_PROFILE, i) for i in range(12)
+    ]
+    return _standardize(_np.vstack(rows))
+
+
+def key_scores(chroma):
+    """Pearson correlation of each chroma row with all 24 key profiles.
+
+    `chroma` is a 12-vector or an (N, 12) matrix; returns an (N, 24) array in
+    KEY_LABELS order. Rows with a flat chroma vector score NaN.
+    """
+    import numpy as _np
+
+    chroma = _np.atleast_2d(_np.asarray(chroma, dtype=_np.float64))
+    if chroma.shape[-1] != 12:
+        raise ValueError(f"chroma must have 12 bins, got shape {chroma.shape}")
+    return _standardize(chroma) @ _profile_matrix().T / 12.0
+
+
+def estimate_keys(chroma) -> list:
+    """Estimate keys for a stacked chroma matrix in one call.
+
+    Returns one dict per row: {"key", "camelot", "confidence"}, where confidence
+    is the winning correlation and "unknown" is used when no key scores.
+    """
+    import numpy as _np
+
+    scores = key_scores(chroma)
+    results = []
+    for row in scores:
+        if _np.all(_np.isnan(row)):
+            results.append({"key": "unknown", "camelot": None, "confidence": None})
+            continue
+        best = int(_np.nanargmax(row))
+        label = KEY_LABELS[best]
+        results.append(
+            {
+                "key": label,
+                "camelot": CAMELOT[label],
+                "confidence": round(float(row[best]), 3),
+            }
+        )
+    return results
+
+
+def estimate_key(chroma_mean) -> dict:
+    return estimate_keys(chroma_mean)[0]
+
+
+def compatible_camelot(code: str) -> list:
+    """Harmonically compatible Camelot codes: same, +/-1 on the wheel, relative."""
+    number, letter = int(code[:-1]), code[-1].upper()
+    if not 1 <= number <= 12 or letter not in "AB":
+        raise ValueError(f"Invalid Camelot code: {code}")
+    return [
+        f"{number}{letter}",
+        f"{number % 12 + 1}{letter}",
+        f"{(number - 2) % 12 + 1}{letter}",
+        f"{number}{'B' if letter == 'A' else 'A'}",
+    ]
@@ -0,0 +1,218 @@
+import os
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .analysis import iter_pcm_blocks
+
+# --------------------
+# Waveform peak pyramids
+# --------------------
+# Min/max peaks are computed once per MP3 and stored next to it as
+# `<name>.mp3.peaks`, so a waveform needs kilobytes instead of a full decode.
+#
+# File layout (little-endian):
+#   header      magic "YTPK", version u16, bits u16, sample_rate u32,
+#               total_samples u64, base_samples_per_peak u32, level_count u16,
+#               reserved u16
+#   level table level_count x (samples_per_peak u32, count u32, offset u64)
+#   level data  per level, `count` interleaved (min, max) int8 pairs
+# Level 0 is the finest; each following level halves the resolution.
+PEAKS_MAGIC = b"YTPK"
+PEAKS_VERSION = 1
+HEADER = struct.Struct("<4sHHIQIHH")
+LEVEL = struct.Struct("<IIQ")
+
+PEAKS_SAMPLE_RATE = 22050
+# ~86 peaks per second at level 0
+BASE_SAMPLES_PER_PEAK = 256
+# Levels stop once they are this small (or after MAX_LEVELS).
+MIN_LEVEL_PEAKS = 256
+MAX_LEVELS = 16
+DECODE_BLOCK_SAMPLES = PEAKS_SAMPLE_RATE * 30
+
+# Peak files are built off the request path: when an MP3 is stored, or on
+# first request. Only one build per file runs at a time; after a failure a new
+# build waits BUILD_RETRY_SECONDS.
+BUILD_WORKERS = 2
+BUILD_RETRY_SECONDS = 30
+
+_executor = ThreadPoolExecutor(max_workers=BUILD_WORKERS, thread_name_prefix="peaks")
+# In-flight builds, and the last failure per file until a build succeeds.
+_builds: dict = {}
+_failures: dict = {}
+_builds_lock = threading.Lock()
+
+
+def peaks_path(mp3_path: str) -> str:
+    return mp3_path + ".peaks"
+
+
+def _quantize(values):
+    import numpy as _np
+
+    return _np.round(_np.clip(values, -1.0, 1.0) * 127).astype(_np.int8)
+
+
+def compute_levels(mp3_path: str):
+    """Decode `mp3_path` block by block. Returns (total_samples, [(min, max), ...])."""
+    import numpy as _np
+
+    mins, maxs = [], []
+    carry = _np.zeros(0, dtype=_np.float32)
+    total = 0
+    for block in iter_pcm_blocks(mp3_path, PEAKS_SAMPLE_RATE, DECODE_BLOCK_SAMPLES):
+        total += len(block)
+        block = _np.concatenate((carry, block))
+        whole = len(block) // BASE_SAMPLES_PER_PEAK * BASE_SAMPLES_PER_PEAK
+        frames = block[:whole].reshape(-1, BASE_SAMPLES_PER_PEAK)
+        mins.append(frames.min(axis=1))
+        maxs.append(frames.max(axis=1))
+        carry = block[whole:]
+    if carry.size:
+        mins.append(carry.min(keepdims=True))
+        maxs.append(carry.max(keepdims=True))
+
+    lo = _np.concatenate(mins) if mins else _np.zeros(0, dtype=_np.float32)
+    hi = _np.concatenate(maxs) if maxs else _np.zeros(0, dtype=_np.float32)
+    levels = [(lo, hi)]
+    while len(levels) < MAX_LEVELS and lo.size > MIN_LEVEL_PEAKS:
+        if lo.size % 2:
+            lo = _np.append(lo, lo[-1])
+            hi = _np.append(hi, hi[-1])
+        lo = lo.reshape(-1, 2).min(axis=1)
+        hi = hi.reshape(-1, 2).max(axis=1)
+        levels.append((lo, hi))
+    return total, levels
+
+
+def write_peaks(mp3_path: str) -> str:
+    """Compute and atomically write the peak file for `mp3_path`."""
+    import numpy as _np
+
+    t_start = time.time()
+    total, levels = compute_levels(mp3_path)
+    table_size = HEADER.size + LEVEL.size * len(levels)
+    offset = table_size
+    table, data = [], []
+    for i, (lo, hi) in enumerate(levels):
+        pairs = _np.empty(lo.size * 2, dtype=_np.int8)
+        pairs[0::2] = _quantize(lo)
+        pairs[1::2] = _quantize(hi)
+        table.append(LEVEL.pack(BASE_SAMPLES_PER_PEAK << i, lo.size, offset))
+        data.append(pairs.tobytes())
+        offset += pairs.size
+
+    path = peaks_path(mp3_path)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(
+            HEADER.pack(
+                PEAKS_MAGIC,
+                PEAKS_VERSION,
+                8,
+                PEAKS_SAMPLE_RATE,
+                total,
+                BASE_SAMPLES_PER_PEAK,
+                len(levels),
+                0,
+            )
+        )
+        f.writelines(table)
+        f.writelines(data)
+    os.replace(tmp_path, path)
+    print(
+        f"[Peaks] {os.path.basename(mp3_path)}: {len(levels)} level(s), {offset} bytes in {time.time() - t_start:.2f}s"
+    )
+    return path
+
+
+def read_header(path: str) -> dict:
+    with open(path, "rb") as f:
+        head = f.read(HEADER.size)
+        magic, version, bits, sr, total, base, count, _ = HEADER.unpack(head)
+        if magic != PEAKS_MAGIC or version != PEAKS_VERSION:
+            raise ValueError(f"Unsupported peak file: {path}")
+        levels = []
+        for i in range(count):
+            spp, n, offset = LEVEL.unpack(f.read(LEVEL.size))
+            levels.append(
+                {
+                    "level": i,
+                    "samples_per_peak": spp,
+                    "count": n,
+                    "offset": offset,
+                    "length": n * 2,
+                }
+            )
+    return {
+        "bits": bits,
+        "sample_rate": sr,
+        "total_samples": total,
+        "size": os.path.getsize(path),
+        "levels": levels,
+    }
+
+
+def ready_peaks(mp3_path: str):
+    """(peaks_path, header) when an up-to-date peak file exists, else None."""
+    path = peaks_path(mp3_path)
+    try:
+        if os.path.getmtime(path) >= os.path.getmtime(mp3_path):
+            return path, read_header(path)
+    except (OSError, ValueError, struct.error):
+        pass
+    return None
+
+
+def _build(mp3_path: str):
+    try:
+        ready = ready_peaks(mp3_path)
+        if not ready:
+            write_peaks(mp3_path)
+            ready = peaks_path(mp3_path), read_header(peaks_path(mp3_path))
+    except Exception as e:
+        print(f"[Peaks] FAILED for {os.path.basename(mp3_path)}: {e}")
+        with _builds_lock:
+            _failures[mp3_path] = {"at": time.time(), "error": e, "reported": False}
+            _builds.pop(mp3_path, None)
+        raise
+    with _builds_lock:
+        _failures.pop(mp3_path, None)
+        _builds.pop(mp3_path, None)
+    return ready
+
+
+def build_peaks(mp3_path: str):
+    """Start building the peak file in the background (once). Returns its Future,
+    or None while a recent failure is backing off."""
+    with _builds_lock:
+        future = _builds.get(mp3_path)
+        if future is not None:
+            return future
+        failure = _failures.get(mp3_path)
+        if failure and time.time() - failure["at"] < BUILD_RETRY_SECONDS:
+            return None
+        future = _builds[mp3_path] = _executor.submit(_build, mp3_path)
+    return future
+
+
+def build_status(mp3_path: str):
+    """(error, retry_in) after a failed build of `mp3_path`: the error only for
+    the first caller to ask, and the seconds until a new build may start."""
+    with _builds_lock:
+        failure = _failures.get(mp3_path)
+        if not failure or mp3_path in _builds:
+            return None, 0
+        error = None if failure["reported"] else failure["error"]
+        failure["reported"] = True
+    return error, max(0.0, failure["at"] + BUILD_RETRY_SECONDS - time.time())
+
+
+def choose_level(header: dict, pixels: int) -> dict:
+    """The coarsest level with at least `pixels` peaks (level 0 if none has)."""
+    for level in reversed(header["levels"]):
+        if level["count"] >= pixels:
+            return level
+    return header["levels"][0]
@@ -0,0 +1,206 @@
+import json
+
+from .cues import cue_row, save_cue_rows, split_cues
+
+# --------------------
+# Playlist saving
+# --------------------
+# POST /playlists sends the whole playlist every time. Incoming videos are
+# diffed against the stored rows so only inserted, changed or removed entries
+# are written. Runs inside a db.writer transaction.
+ID_CHUNK_SIZE = 500
+
+VIDEO_FIELDS = ("playlist_id", "position", "title", "creator", "views", "thumbnail")
+
+
+def _normalize_video(playlist_id: str, idx: int, v: dict):
+    """Return (row dict, cue_points) for one incoming video, or None without an id."""
+    vid = (v.get("id") or "").strip()
+    if not vid:
+        return None
+
+    # Handle analysis data - prefer `analysis` object, fallback to `key`
+    analysis = None
+    cue_points = None
+    analysis_obj = v.get("analysis")
+    if isinstance(analysis_obj, dict):
+        analysis, cue_points = split_cues(analysis_obj)
+    elif v.get("key"):
+        analysis = {"key": v.get("key")}
+
+    row = {
+        "video_id": vid,
+        "playlist_id": playlist_id,
+        "position": idx,
+        "title": (v.get("title") or "").strip(),
+        "creator": (v.get("creator") or "").strip(),
+        "views": int(v.get("views") or 0),
+        "thumbnail": (v.get("thumbnail") or "").strip(),
+        "mp3_path": v.get("mp3_path") or None,
+        "analysis": analysis,
+    }
+    return row, cue_points
+
+
+def _stored_videos(conn, playlist_id: str, video_ids) -> dict:
+    columns = "video_id, playlist_id, position, title, creator, views, thumbnail, mp3_path, analysis"
+    stored = {
+        r["video_id"]: r
+        for r in conn.execute(
+            f"SELECT {columns} FROM videos WHERE playlist_id = ?", (playlist_id,)
+        )
+    }
+    # Videos that currently belong to another playlist (or none)
+    missing = [vid for vid in video_ids if vid not in stored]
+    for i in range(0, len(missing), ID_CHUNK_SIZE):
+        chunk = missing[i : i + ID_CHUNK_SIZE]
+        for r in conn.execute(
+            f"SELECT {columns} FROM videos WHERE video_id IN ({','.join('?' for _ in chunk)})",
+            chunk,
+        ):
+            stored[r["video_id"]] = r
+    return stored
+
+
+def _stored_cues(conn, video_ids) -> dict:
+    """{video_id: (beats blob, beat_count, markers JSON)} from `cue_grids`."""
+    stored = {}
+    for i in range(0, len(video_ids), ID_CHUNK_SIZE):
+        chunk = video_ids[i : i + ID_CHUNK_SIZE]
+        for r in conn.execute(
+            f"""
+            SELECT video_id, beats, beat_count, markers FROM cue_grids
+            WHERE video_id IN ({','.join('?' for _ in chunk)})
+            """,
+            chunk,
+        ):
+            stored[r["video_id"]] = (r["beats"], r["beat_count"], r["markers"])
+    return stored
+
+
+def _analysis_changed(incoming, stored_str) -> bool:
+    if incoming is None:
+        return False  # keeps the stored analysis
+    if stored_str is None:
+        return True
+    try:
+        return json.loads(stored_str) != incoming
+    except json.JSONDecodeError:
+        return True
+
+
+def _row_changed(row: dict, stored) -> bool:
+    if any(row[f] != stored[f] for f in VIDEO_FIELDS):
+        return True
+    if row["mp3_path"] is not None and row["mp3_path"] != stored["mp3_path"]:
+        return True
+    return _analysis_changed(row["analysis"], stored["analysis"])
+
+
+def upsert_playlist(conn, data: dict) -> dict:
+    """Save a playlist and its videos; returns change counts. Does not commit."""
+    playlist_id = (data.get("id") or "").strip()
+    videos = data.get("videos") or []
+    thumb = (data.get("thumbnail") or "").strip()
+    counts = {"inserted": 0, "updated": 0, "removed": 0, "unchanged": 0}
+
+    incoming: dict[str, tuple] = {}
+    for idx, v in enumerate(videos):
+        normalized = _normalize_video(playlist_id, idx, v)
+        if normalized:
+            incoming[normalized[0]["video_id"]] = normalized
+
+    playlist = (
+        playlist_id,
+        (data.get("url") or "").strip(),
+        (data.get("title") or "").strip(),
+        (data.get("channel") or "").strip(),
+        len(videos),
+    )
+    current = conn.execute(
+        "SELECT id, url, title, channel, video_count, thumbnail FROM playlists WHERE id = ?",
+        (playlist_id,),
+    ).fetchone()
+    if current is None or tuple(current)[:5] != playlist:
+        conn.execute(
+            """
+            INSERT INTO playlists(id, url, title, channel, video_count, created_at, updated_at)
+            VALUES(?, ?, ?, ?, ?, datetime('now'), datetime('now'))
+            ON CONFLICT(id) DO UPDATE SET
+              url=excluded.url,
+              title=excluded.title,
+              channel=excluded.channel,
+              video_count=excluded.video_count,
+              updated_at=datetime('now')
+            """,
+            playlist,
+        )
+    if thumb and (current is None or current["thumbnail"] != thumb):
+        conn.execute(
+            "UPDATE playlists SET thumbnail=?, updated_at=datetime('now') WHERE id=?",
+            (thumb, playlist_id),
+        )
+
+    stored = _stored_videos(conn, playlist_id, list(incoming))
+    writes, cue_writes = [], []
+    with_cues = [vid for vid, (_row, cues) in incoming.items() if cues is not None]
+    stored_cues = _stored_cues(conn, with_cues)
+    for vid, (row, cue_points) in incoming.items():
+        if cue_points is not None:
+            cues = cue_row(cue_points)
+            if stored_cues.get(vid) != cues:
+                cue_writes.append((vid, *cues))
+        previous = stored.get(vid)
+        if previous is not None and not _row_changed(row, previous):
+            counts["unchanged"] += 1
+            continue
+        counts["inserted" if previous is None else "updated"] += 1
+        writes.append(
+            (
+                vid,
+                row["playlist_id"],
+                row["position"],
+                row["title"],
+                row["creator"],
+                row["views"],
+                row["thumbnail"],
+                row["mp3_path"],
+                (json.dumps(row["analysis"]) if row["analysis"] is not None else None),
+            )
+        )
+    # Videos no longer in the playlist are detached, keeping their MP3 and
+    # analysis for when they come back.
+    removed = [
+        (vid,)
+        for vid, r in stored.items()
+        if r["playlist_id"] == playlist_id and vid not in incoming
+    ]
+    counts["removed"] = len(removed)
+
+    conn.executemany(
+        """
+        INSERT INTO videos(video_id, playlist_id, position, title, creator, views, thumbnail, mp3_path, analysis, last_updated)
+        VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+        ON CONFLICT(video_id) DO UPDATE SET
+          playlist_id=excluded.playlist_id,
+          position=excluded.position,
+          title=excluded.title,
+          creator=excluded.creator,
+          views=excluded.views,
+          thumbnail=excluded.thumbnail,
+          mp3_path=COALESCE(excluded.mp3_path, videos.mp3_path),
+          analysis=COALESCE(excluded.analysis, videos.analysis),
+          last_updated=datetime('now')
+        """,
+        writes,
+    )
+    conn.executemany(
+        """
+        UPDATE videos SET playlist_id=NULL, position=NULL, last_updated=datetime('now')
+        WHERE video_id=?
+        """,
+        removed,
+    )
+    # Beat grids are compared too: re-saving a playlist rewrites none of them
+    save_cue_rows(conn, cue_writes)
+    return counts
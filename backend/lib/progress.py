@@ -0,0 +1,141 @@
+import json
+import queue
+import threading
+import time
+
+# --------------------
+# In-process progress events
+# --------------------
+# Batch conversions publish per-item events on a channel (a job id or a client
+# supplied progress id); SSE subscribers each get their own queue.
+CHANNEL_RETENTION_SECONDS = 10 * 60
+KEEPALIVE_SECONDS = 15
+# Minimum spacing of "downloading" byte-count events per item.
+DOWNLOAD_EVENT_INTERVAL = 0.25
+
+
+class _Channel:
+    def __init__(self):
+        self.subscribers: list[queue.Queue] = []
+        # Latest event per item, replayed to late subscribers.
+        self.latest: dict[str, dict] = {}
+        self.ended = None
+        self.touched = time.time()
+
+
+class ProgressBus:
+    def __init__(self):
+        self._channels: dict[str, _Channel] = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float):
+        stale = [
+            name
+            for name, ch in self._channels.items()
+            if not ch.subscribers and now - ch.touched > CHANNEL_RETENTION_SECONDS
+        ]
+        for name in stale:
+            del self._channels[name]
+
+    def publish(self, channel: str, event: dict):
+        if not channel:
+            return
+        now = time.time()
+        event = {**event, "ts": round(now, 3)}
+        with self._lock:
+            self._prune(now)
+            ch = self._channels.setdefault(channel, _Channel())
+            ch.touched = now
+            if event.get("type") == "end":
+                ch.ended = event
+            elif event.get("id"):
+                ch.latest[event["id"]] = event
+            subscribers = list(ch.subscribers)
+        for q in subscribers:
+            q.put(event)
+
+    def end(self, channel: str, **fields):
+        self.publish(channel, {"type": "end", **fields})
+
+    def subscribe(self, channel: str) -> queue.Queue:
+        q = queue.Queue()
+        with self._lock:
+            ch = self._channels.setdefault(channel, _Channel())
+            ch.touched = time.time()
+            for event in ch.latest.values():
+                q.put(event)
+            if ch.ended:
+                q.put(ch.ended)
+            ch.subscribers.append(q)
+        return q
+
+    def unsubscribe(self, channel: str, q: queue.Queue):
+        with self._lock:
+            ch = self._channels.get(channel)
+            if ch and q in ch.subscribers:
+                ch.subscribers.remove(q)
+
+    def stream(self, channel: str):
+        """Yield `text/event-stream` chunks until the channel ends."""
+        q = self.subscribe(channel)
+        try:
+            yield "retry: 2000\n\n"
+            while True:
+                try:
+                    event = q.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event.get('type', 'item')}\ndata: {json.dumps(event)}\n\n"
+                if event.get("type") == "end":
+                    return
+        finally:
+            self.unsubscribe(channel, q)
+
+
+bus = ProgressBus()
+
+
+class ItemProgress:
+    """Per-item stage tracker; call it as `on_event(stage, **fields)`.
+
+    Stages: queued, extracting, downloading, transcoding, done, failed. The time
+    spent in each stage is reported in `durations` (seconds).
+    """
+
+    def __init__(self, channel: str, video_id: str, title: str = None):
+        self.channel = channel
+        self.video_id = video_id
+        self.title = title
+        self.stage = None
+        self.stage_started = time.time()
+        self.durations: dict[str, float] = {}
+        self._last_download_event = 0.0
+
+    def __call__(self, stage: str, **fields):
+        now = time.time()
+        if stage != self.stage:
+            if self.stage and self.stage != "queued":
+                self.durations[self.stage] = round(
+                    self.durations.get(self.stage, 0.0) + now - self.stage_started, 3
+                )
+            self.stage = stage
+            self.stage_started = now
+        elif stage == "downloading":
+            if now - self._last_download_event < DOWNLOAD_EVENT_INTERVAL:
+                return
+        if stage == "downloading":
+            self._last_download_event = now
+        if not self.channel:
+            return
+        bus.publish(
+            self.channel,
+            {
+                "type": "item",
+                "id": self.video_id,
+                "title": self.title,
+                "stage": stage,
+                "durations": dict(self.durations),
+                **fields,
+            },
+        )
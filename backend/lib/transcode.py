@@ -0,0 +1,262 @@
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+# --------------------
+# Stream-through MP3 transcoding
+# --------------------
+# ffmpeg reads the upstream audio URL and writes MP3 frames to a `.part` file as
+# it produces them. Any number of HTTP responses tail that file, so playback can
+# start with the first frames while the finished file still lands in MP3_DIR.
+# ffmpeg's `-progress` output is reported to every listener as "transcoding"
+# events (seconds of audio encoded), then "done" or "failed".
+READ_CHUNK_SIZE = 64 * 1024
+# How long a request waits for the first MP3 bytes before giving up on streaming.
+FIRST_BYTES_TIMEOUT = 30
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which("ffmpeg") is not None
+
+
+def ffmpeg_headers_arg(headers: dict) -> str:
+    return "".join(
+        f"{k}: {v}\r\n" for k, v in (headers or {}).items() if k.lower() != "range"
+    )
+
+
+class StreamingTranscode:
+    """One ffmpeg process converting `source_url` into `final_path`."""
+
+    def __init__(
+        self,
+        video_id: str,
+        source_url: str,
+        headers: dict,
+        final_path: str,
+        on_complete=None,
+        on_event=None,
+    ):
+        self.video_id = video_id
+        self.source_url = source_url
+        self.headers = headers
+        self.final_path = final_path
+        self.part_path = final_path + ".part"
+        self.on_complete = on_complete
+        self._listeners = [on_event] if on_event else []
+        # Where the finished MP3 ended up (on_complete may move it).
+        self.result_path = None
+        self.bytes_written = 0
+        self.done = False
+        self.failed = None
+        self.stopped = False
+        self._proc = None
+        self._thread = None
+        self._cond = threading.Condition()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add_listener(self, on_event):
+        if on_event:
+            self._listeners.append(on_event)
+
+    def on_event(self, stage: str, **fields):
+        for listener in list(self._listeners):
+            try:
+                listener(stage, **fields)
+            except Exception as e:
+                print(f"[Transcode] Progress listener error: {e}")
+
+    def stop(self, timeout: float = 10):
+        """Kill ffmpeg and wait until the transcode has cleaned up and unregistered."""
+        self.stopped = True
+        proc = self._proc
+        if proc and proc.poll() is None:
+            proc.kill()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _command(self):
+        return [
+            "ffmpeg",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-nostats",
+            "-progress",
+            "pipe:2",
+            "-headers",
+            ffmpeg_headers_arg(self.headers),
+            "-i",
+            self.source_url,
+            "-vn",
+            "-codec:a",
+            "libmp3lame",
+            "-q:a",
+            "0",
+            "-f",
+            "mp3",
+            "pipe:1",
+        ]
+
+    def _watch_progress(self, stderr):
+        errors = []
+        for raw in stderr:
+            line = raw.decode("utf-8", "replace").strip()
+            key, sep, value = line.partition("=")
+            if not sep:
+                errors.append(line)
+            elif key == "out_time_us" and value.isdigit():
+                self.on_event("transcoding", seconds=int(value) / 1_000_000)
+        self._stderr_tail = errors[-5:]
+
+    def _run(self):
+        t_start = time.time()
+        self._stderr_tail = []
+        self.on_event("transcoding", seconds=0)
+        try:
+            proc = subprocess.Popen(
+                self._command(),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+            self._proc = proc
+            if self.stopped:
+                proc.kill()
+            watcher = threading.Thread(
+                target=self._watch_progress, args=(proc.stderr,), daemon=True
+            )
+            watcher.start()
+            with open(self.part_path, "wb") as out:
+                while True:
+                    chunk = proc.stdout.read1(READ_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+                    out.flush()
+                    with self._cond:
+                        self.bytes_written += len(chunk)
+                        self._cond.notify_all()
+            returncode = proc.wait()
+            watcher.join(timeout=5)
+            if self.stopped:
+                raise RuntimeError("stopped")
+            if returncode != 0 or self.bytes_written == 0:
+                raise RuntimeError(
+                    f"ffmpeg exited with {returncode}: {' | '.join(self._stderr_tail)}"
+                )
+            os.replace(self.part_path, self.final_path)
+            print(
+                f"[Transcode] {self.video_id}: {self.bytes_written / (1024 * 1024):.2f} MB in {time.time() - t_start:.1f}s"
+            )
+            self.result_path = self.final_path
+            if self.on_complete:
+                self.result_path = self.on_complete(self.final_path) or self.final_path
+            self.on_event("done", size=self.bytes_written)
+        except Exception as e:
+            self.failed = str(e)
+            print(f"[Transcode] FAILED {self.video_id}: {e}")
+            try:
+                os.remove(self.part_path)
+            except OSError:
+                pass
+            if not self.stopped:  # the caller falls back and reports itself
+                self.on_event("failed", error=str(e))
+        finally:
+            with self._cond:
+                self.done = True
+                self._cond.notify_all()
+            _unregister(self.video_id, self)
+
+    def wait_for_data(self, timeout: float = FIRST_BYTES_TIMEOUT) -> bool:
+        """Block until the first bytes exist (True) or the transcode failed/timed out."""
+        deadline = time.time() + timeout
+        with self._cond:
+            while self.bytes_written == 0 and not self.done:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return self.bytes_written > 0
+
+    def _open(self):
+        # The open handle stays valid after the `.part` file is renamed.
+        try:
+            return open(self.part_path, "rb")
+        except FileNotFoundError:
+            pass
+        # Already renamed, and possibly being moved by on_complete: wait for
+        # the file to settle where it ends up.
+        with self._cond:
+            while not self.done:
+                self._cond.wait(1.0)
+        if self.failed:
+            raise RuntimeError(f"Transcode failed: {self.failed}")
+        return open(self.result_path, "rb")
+
+    def iter_bytes(self):
+        """Yield the MP3 from the start, following the file until ffmpeg finishes."""
+        with self._open() as f:
+            sent = 0
+            while True:
+                data = f.read(READ_CHUNK_SIZE)
+                if data:
+                    sent += len(data)
+                    yield data
+                    continue
+                with self._cond:
+                    while self.bytes_written <= sent and not self.done:
+                        self._cond.wait(1.0)
+                    if self.bytes_written <= sent and self.done:
+                        return
+
+
+_active: dict[str, StreamingTranscode] = {}
+_active_lock = threading.Lock()
+
+
+def _unregister(video_id: str, transcode: StreamingTranscode):
+    with _active_lock:
+        if _active.get(video_id) is transcode:
+            del _active[video_id]
+
+
+def get_or_start(
+    video_id: str, resolve_source, final_path: str, on_complete=None, on_event=None
+):
+    """Join the running transcode for `video_id`, or start one.
+
+    `resolve_source()` returns `(url, headers)` and is only called when no
+    ffmpeg process is running for this video yet. `on_complete(path)` may
+    return the path the file was moved to. `on_event` is added as a progress
+    listener either way.
+    """
+    with _active_lock:
+        transcode = _active.get(video_id)
+    if transcode:
+        transcode.add_listener(on_event)
+        return transcode
+
+    source_url, headers = resolve_source()
+    with _active_lock:
+        # Another request may have started one while we were resolving.
+        transcode = _active.get(video_id)
+        if transcode:
+            transcode.add_listener(on_event)
+            return transcode
+        transcode = StreamingTranscode(
+            video_id,
+            source_url,
+            headers,
+            final_path,
+            on_complete=on_complete,
+            on_event=on_event,
+        )
+        _active[video_id] = transcode
+    transcode.start()
+    return transcode
@@ -0,0 +1,153 @@
+import base64
+import json
+
+from .keys import CAMELOT, compatible_camelot
+
+# --------------------
+# Library queries over the indexed analysis columns
+# --------------------
+# Filters and sorting run in SQLite against bpm/musical_key/camelot/energy
+# (see ANALYSIS_COLUMNS in db.py). Paging is by limit/offset or by an opaque
+# keyset cursor; rows without a value for the sort column come last.
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+# Camelot codes (1A..12B) sort by number, then letter: 1A, 1B, 2A, ... 12B.
+# One integer per code keeps the keyset cursor a single value; NULL stays NULL.
+CAMELOT_ORDER = (
+    "(CAST(substr(camelot, 1, length(camelot) - 1) AS INTEGER) * 2"
+    " + (substr(camelot, -1) = 'B'))"
+)
+
+# Column or expression per sort; the cursor carries its value.
+SORT_COLUMNS = {
+    "position": "position",
+    "title": "title",
+    "views": "views",
+    "bpm": "bpm",
+    "key": CAMELOT_ORDER,
+    "energy": "energy",
+}
+
+VIDEO_COLUMNS = (
+    "video_id AS id, title, creator, views, thumbnail, analysis, mp3_path, position"
+)
+
+
+def encode_cursor(value, video_id: str) -> str:
+    raw = json.dumps([value, video_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str):
+    try:
+        value, video_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return value, video_id
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def _number(args, name: str):
+    value = args.get(name)
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
+
+
+def build_video_query(args):
+    """Translate query parameters into (sql, params, count_sql, count_params, limit).
+
+    Parameters: playlist, q, creator, bpm_min, bpm_max, key, camelot,
+    compatible (1 = also harmonic neighbours), energy_min, energy_max,
+    sort (position|title|views|bpm|key|energy), order (asc|desc),
+    limit, offset, cursor. Raises ValueError for invalid values.
+    """
+    where, params = [], []
+
+    if args.get("playlist"):
+        where.append("playlist_id = ?")
+        params.append(args["playlist"])
+    if args.get("q"):
+        where.append("title LIKE ?")
+        params.append(f"%{args['q']}%")
+    if args.get("creator"):
+        where.append("creator = ?")
+        params.append(args["creator"])
+
+    for column, low, high in (
+        ("bpm", "bpm_min", "bpm_max"),
+        ("energy", "energy_min", "energy_max"),
+    ):
+        low_value, high_value = _number(args, low), _number(args, high)
+        if low_value is not None:
+            where.append(f"{column} >= ?")
+            params.append(low_value)
+        if high_value is not None:
+            where.append(f"{column} <= ?")
+            params.append(high_value)
+
+    camelot = args.get("camelot")
+    key = args.get("key")
+    if key and not camelot:
+        if key not in CAMELOT:
+            raise ValueError(f"Unknown key: {key}")
+        camelot = CAMELOT[key]
+    if camelot:
+        camelot = camelot.upper()
+        codes = (
+            compatible_camelot(camelot)
+            if str(args.get("compatible", "")).lower() in ("1", "true", "yes")
+            else [compatible_camelot(camelot)[0]]
+        )
+        where.append(f"camelot IN ({','.join('?' for _ in codes)})")
+        params.extend(codes)
+
+    sort = args.get("sort") or "position"
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f"sort must be one of {list(SORT_COLUMNS)}")
+    column = SORT_COLUMNS[sort]
+    order = (args.get("order") or "asc").lower()
+    if order not in ("asc", "desc"):
+        raise ValueError("order must be asc or desc")
+
+    try:
+        limit = int(args.get("limit") or DEFAULT_LIMIT)
+        offset = int(args.get("offset") or 0)
+    except ValueError:
+        raise ValueError("limit and offset must be integers")
+    limit = max(1, min(limit, MAX_LIMIT))
+    offset = max(0, offset)
+
+    count_where = list(where)
+    count_params = list(params)
+
+    if args.get("cursor"):
+        value, after_id = decode_cursor(args["cursor"])
+        cmp = ">" if order == "asc" else "<"
+        if value is None:
+            where.append(f"({column} IS NULL AND video_id {cmp} ?)")
+            params.append(after_id)
+        else:
+            where.append(
+                f"({column} {cmp} ? OR ({column} = ? AND video_id {cmp} ?) OR {column} IS NULL)"
+            )
+            params.extend([value, value, after_id])
+        offset = 0
+
+    clause = f"WHERE {' AND '.join(where)}" if where else ""
+    direction = order.upper()
+    sql = f"""
+        SELECT {VIDEO_COLUMNS}, {column} AS sort_value, video_id AS sort_id
+        FROM videos
+        {clause}
+        ORDER BY {column} IS NULL, {column} {direction}, video_id {direction}
+        LIMIT ? OFFSET ?
+    """
+    # One extra row tells whether there is a next page
+    params.extend([limit + 1, offset])
+    count_clause = f"WHERE {' AND '.join(count_where)}" if count_where else ""
+    count_sql = f"SELECT COUNT(*) FROM videos {count_clause}"
+    return sql, params, count_sql, count_params, limit
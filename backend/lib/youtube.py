@@ -1,19 +1,78 @@
 import shutil
 import os
 import time
-import yt_dlp
+from urllib.parse import parse_qs, urlparse
 
+from . import extract_cache
+from .http_fetch import RangedSource
 from .utils import sanitize_filename
+from .ytdl_pool import get_pool
 
+INFO_OPTS = {
+    "format": "bestaudio/best",
+    "quiet": True,
+}
 
-def get_video_info(video_url: str):
-    ydl_opts = {
+PLAYLIST_OPTS = {
+    "quiet": True,
+    "extract_flat": True,
+    "force_generic_extractor": True,
+}
+
+
+def download_opts(output_dir: str) -> dict:
+    opts = {
         "format": "bestaudio/best",
         "quiet": True,
+        "noprogress": True,
+        "outtmpl": os.path.join(output_dir, "%(id)s.%(ext)s"),
+        "paths": {"home": output_dir},
+        "http_chunk_size": 5_000_000,
+        "retries": 3,
+        "fragment_retries": 10,
+        "postprocessors": [
+            {
+                "key": "FFmpegExtractAudio",
+                "preferredcodec": "mp3",
+                "preferredquality": "0",
+            }
+        ],
     }
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info_dict = ydl.extract_info(video_url, download=False)
+    # Only used for what fetch_source leaves to yt-dlp.
+    if shutil.which("aria2c"):
+        opts["external_downloader"] = "aria2c"
+        opts["external_downloader_args"] = {
+            "http": ["-x16", "-k1M", "--summary-interval=5"],
+            "https": ["-x16", "-k1M", "--summary-interval=5"],
+        }
+    return opts
+
+
+def info_pool():
+    return get_pool("info", INFO_OPTS)
+
+
+def download_pool(output_dir: str):
+    return get_pool(f"download:{output_dir}", download_opts(output_dir))
+
+
+def playlist_pool():
+    return get_pool("playlist", PLAYLIST_OPTS, size=1)
+
+
+def video_id_from_url(video_url: str):
+    parsed = urlparse(video_url)
+    if parsed.hostname and parsed.hostname.endswith("youtu.be"):
+        return parsed.path.lstrip("/") or None
+    ids = parse_qs(parsed.query).get("v")
+    return ids[0] if ids else None
 
+
+def select_stream(info_dict: dict):
+    """Pick the best audio-only format from an info dict and build request headers.
+
+    Returns a stream entry dict (as stored in the extraction cache) or None.
+    """
     chosen_format = None
     if "requested_formats" in info_dict:
         chosen_format = info_dict["requested_formats"][0]
@@ -42,7 +101,7 @@ def get_video_info(video_url: str):
         chosen_format = info_dict
 
     if not chosen_format or not chosen_format.get("url"):
-        return None, None, None, None, None
+        return None
 
     download_url = chosen_format["url"]
     file_ext = chosen_format.get("ext", "mp3")
@@ -76,55 +135,141 @@ def get_video_info(video_url: str):
 
     merged_headers.setdefault("Range", "bytes=0-")
 
+    return {
+        "title": info_dict.get("title"),
+        "download_url": download_url,
+        "file_ext": file_ext,
+        "content_type": content_type,
+        "content_length_est": content_length_est,
+        "headers": merged_headers,
+        "format_id": chosen_format.get("format_id"),
+    }
+
+
+def resolve_stream(video_url: str):
+    with info_pool().checkout() as ydl:
+        info_dict = ydl.extract_info(video_url, download=False)
+    return select_stream(info_dict)
+
+
+def get_stream_entry(video_url: str, use_cache: bool = True):
+    """Return the stream entry for a video, served from the extraction cache when fresh."""
+    video_id = video_id_from_url(video_url)
+    if use_cache and video_id:
+        entry = extract_cache.get_entry(video_id)
+        if entry:
+            print(
+                f"[YouTube] Extraction cache hit for {video_id} (expires in {entry['expires_in']:.0f}s)"
+            )
+            if entry["expires_in"] < extract_cache.REFRESH_AHEAD_SECONDS:
+                extract_cache.refresh_in_background(
+                    video_id,
+                    lambda vid: resolve_stream(
+                        f"https://www.youtube.com/watch?v={vid}"
+                    ),
+                )
+            return entry
+
+    entry = resolve_stream(video_url)
+    if entry and video_id:
+        extract_cache.put_entry(video_id, entry)
+    return entry
+
+
+def get_video_info(video_url: str, use_cache: bool = True):
+    entry = get_stream_entry(video_url, use_cache=use_cache)
+    if not entry:
+        return None, None, None, None, None
     return (
-        download_url,
-        file_ext,
-        content_type,
-        content_length_est,
-        merged_headers,
+        entry["download_url"],
+        entry["file_ext"],
+        entry["content_type"],
+        entry["content_length_est"],
+        dict(entry["headers"]),
     )
 
 
-def download_audio(video_id: str, output_dir: str):
-    url = f"https://www.youtube.com/watch?v={video_id}"
-    title = video_id
+def describe_download_error(e) -> tuple:
+    """(HTTP status, public message) for a yt-dlp DownloadError."""
+    error_message = str(e).lower()
+    if "video is unavailable" in error_message:
+        return 404, "Video unavailable."
+    if "private video" in error_message:
+        return 403, "Video is private."
+    if "age restricted" in error_message:
+        return 403, "Video is age-restricted and requires login."
+    if "429" in error_message or "too many requests" in error_message:
+        return 429, "Rate limited by YouTube. Please try again later."
+    return 500, "yt-dlp download error"
+
+
+def _hook_listener(on_event):
+    """Translate yt-dlp hook dicts into `on_event(stage, **fields)` calls."""
+
+    def listener(kind: str, d: dict):
+        status = d.get("status")
+        if kind == "download" and status == "downloading":
+            on_event(
+                "downloading",
+                bytes=d.get("downloaded_bytes"),
+                total=d.get("total_bytes") or d.get("total_bytes_estimate"),
+                speed=d.get("speed"),
+            )
+        elif kind == "postprocess" and status == "started":
+            on_event("transcoding", postprocessor=d.get("postprocessor"))
+
+    return listener
+
+
+def fetch_source(info: dict, path: str, on_event) -> bool:
+    """Download the selected format to `path` in parallel range segments.
+
+    Returns False, leaving the download to yt-dlp, for formats that are not a
+    single HTTP(S) file (HLS, DASH, merged formats) or when the fetch fails.
+    """
+    if info.get("protocol") not in ("http", "https") or info.get("requested_formats"):
+        return False
     try:
-        with yt_dlp.YoutubeDL({"quiet": True}) as ydl:
-            info = ydl.extract_info(url, download=False)
-            raw_title = info.get("title") or video_id
-            title = sanitize_filename(raw_title)
+        source = RangedSource(info["url"], info.get("http_headers") or {})
+        source.raise_for_status()
+        source.save(
+            path,
+            on_progress=lambda done, total, speed: on_event(
+                "downloading", bytes=done, total=total, speed=speed
+            ),
+        )
+        return True
     except Exception as e:
-        print(f"[YouTube] Title extract failed: {e}")
+        print(f"[YouTube] Segmented download failed, falling back to yt-dlp: {e}")
+        return False
+
 
+def download_audio(video_id: str, output_dir: str, info: dict = None, on_event=None):
+    """Download a video's best audio and convert it to `{video_id}.mp3`.
+
+    The video is extracted once and that single info dict drives format
+    selection, the download and post-processing. Pass `info` to reuse a dict
+    that was already resolved (a full extraction or a flat playlist entry).
+    `on_event(stage, **fields)` is told about extracting, downloading and
+    transcoding as they happen.
+    """
+    url = f"https://www.youtube.com/watch?v={video_id}"
     final_mp3_path = os.path.join(output_dir, f"{video_id}.mp3")
-    ydl_opts = {
-        "format": "bestaudio/best",
-        "quiet": True,
-        "noprogress": True,
-        "outtmpl": os.path.join(output_dir, "%(id)s.%(ext)s"),
-        "paths": {"home": output_dir},
-        "http_chunk_size": 5_000_000,
-        "retries": 3,
-        "fragment_retries": 10,
-        "postprocessors": [
-            {
-                "key": "FFmpegExtractAudio",
-                "preferredcodec": "mp3",
-                "preferredquality": "0",
-            }
-        ],
-    }
-    if shutil.which("aria2c"):
-        ydl_opts["external_downloader"] = "aria2c"
-        ydl_opts["external_downloader_args"] = {
-            "http": ["-x16", "-k1M", "--summary-interval=5"],
-            "https": ["-x16", "-k1M", "--summary-interval=5"],
-        }
+    on_event = on_event or (lambda stage, **fields: None)
 
     t_dl_start = time.time()
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        ydl.download([url])
+    with download_pool(output_dir).checkout(_hook_listener(on_event)) as ydl:
+        if info is None:
+            on_event("extracting")
+            # Unprocessed extraction: format selection happens once, below.
+            info = ydl.extract_info(url, download=False, process=False)
+        info = ydl.process_ie_result(info, download=False)
+        # yt-dlp skips downloading a file that is already there and goes
+        # straight to post-processing.
+        fetch_source(info, ydl.prepare_filename(info), on_event)
+        ydl.process_info(info)
 
+    title = sanitize_filename((info or {}).get("title") or video_id)
     if not os.path.exists(final_mp3_path):
         return None, None
 
@@ -133,11 +278,6 @@ def download_audio(video_id: str, output_dir: str):
 
 
 def get_playlist_info(playlist_url: str):
-    ydl_opts = {
-        "quiet": True,
-        "extract_flat": True,
-        "force_generic_extractor": True,
-    }
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+    with playlist_pool().checkout() as ydl:
         playlist_dict = ydl.extract_info(playlist_url, download=False)
     return playlist_dict
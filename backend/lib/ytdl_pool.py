@@ -0,0 +1,129 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import yt_dlp
+
+from .db import DATA_DIR
+
+# --------------------
+# Pooled YoutubeDL instances
+# --------------------
+# Building a YoutubeDL loads extractors and its HTTP stack; the persistent cache
+# dir keeps deciphered player signature functions across restarts.
+YTDLP_CACHE_DIR = os.path.join(DATA_DIR, "yt-dlp-cache")
+os.makedirs(YTDLP_CACHE_DIR, exist_ok=True)
+
+# Extractors instantiated up front so the first request does not pay for it.
+WARM_EXTRACTORS = ("Youtube", "YoutubeTab")
+
+
+# Pooled instances are shared between tasks, so their hooks forward to whatever
+# listener the current checkout registered on this thread.
+_local = threading.local()
+
+
+def _progress_hook(d: dict):
+    listener = getattr(_local, "listener", None)
+    if listener:
+        listener("download", d)
+
+
+def _postprocessor_hook(d: dict):
+    listener = getattr(_local, "listener", None)
+    if listener:
+        listener("postprocess", d)
+
+
+def default_pool_size() -> int:
+    return max(1, min(8, int(os.environ.get("YTMP3_MAX_WORKERS", "4"))))
+
+
+class YoutubeDLPool:
+    """A fixed-size pool of YoutubeDL objects sharing one set of options.
+
+    YoutubeDL is not thread-safe, so each instance is checked out by one task at
+    a time. When the pool is empty an extra instance is created rather than
+    blocking, and discarded again if the pool is full on return.
+    """
+
+    def __init__(self, name: str, opts: dict, size: int):
+        self.name = name
+        self.opts = {
+            **opts,
+            "cachedir": YTDLP_CACHE_DIR,
+            "progress_hooks": [_progress_hook],
+            "postprocessor_hooks": [_postprocessor_hook],
+        }
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _create(self):
+        ydl = yt_dlp.YoutubeDL(dict(self.opts))
+        for ie_key in WARM_EXTRACTORS:
+            try:
+                ydl.get_info_extractor(ie_key)
+            except Exception as e:
+                print(f"[YDLPool] Could not preload extractor {ie_key}: {e}")
+        return ydl
+
+    def warm(self):
+        t_start = time.time()
+        created = 0
+        while not self._idle.full():
+            try:
+                self._idle.put_nowait(self._create())
+                created += 1
+            except queue.Full:
+                break
+        if created:
+            print(
+                f"[YDLPool] Warmed {created} '{self.name}' instance(s) in {time.time() - t_start:.1f}s"
+            )
+
+    @contextmanager
+    def checkout(self, listener=None):
+        """Borrow an instance. `listener(kind, d)` receives yt-dlp progress and
+        postprocessor hook dicts (kind is "download" or "postprocess")."""
+        try:
+            ydl = self._idle.get_nowait()
+        except queue.Empty:
+            ydl = self._create()
+        _local.listener = listener
+        try:
+            yield ydl
+        finally:
+            _local.listener = None
+            try:
+                self._idle.put_nowait(ydl)
+            except queue.Full:
+                ydl.close()
+
+
+_pools: dict[str, YoutubeDLPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(name: str, opts: dict, size: int = None) -> YoutubeDLPool:
+    """Return the process-wide pool registered under `name`, creating it on first use."""
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = YoutubeDLPool(name, opts, size or default_pool_size())
+            _pools[name] = pool
+        return pool
+
+
+def warm_pools_async(pools):
+    """Fill the given pools on a daemon thread so startup is not delayed."""
+
+    def worker():
+        for pool in pools:
+            try:
+                pool.warm()
+            except Exception as e:
+                print(f"[YDLPool] Warm-up failed for '{pool.name}': {e}")
+
+    threading.Thread(target=worker, daemon=True).start()
@@ -0,0 +1,360 @@
+import bisect
+import hashlib
+import itertools
+import os
+import struct
+import time
+import zlib
+
+from .db import writer
+
+# --------------------
+# Stored (uncompressed) ZIP archives
+# --------------------
+# MP3s do not compress, so archives store entries as-is. With the CRC32 of each
+# file cached in `audio_files`, every header is known before a byte is sent:
+# the archive has an exact size and any byte range of it can be produced
+# directly, which lets an interrupted download resume with a Range request.
+# Entries, offsets or sizes past the classic limits switch to ZIP64.
+READ_CHUNK_SIZE = 1024 * 1024
+ID_CHUNK_SIZE = 500
+
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+ZIP64_EXTRA_HEADER = struct.Struct("<HH")
+ZIP64_END = struct.Struct("<IQHHIIQQQQ")
+ZIP64_LOCATOR = struct.Struct("<IIQI")
+END = struct.Struct("<IHHHHIIH")
+
+ZIP32_LIMIT = 0xFFFFFFFF
+ZIP16_LIMIT = 0xFFFF
+UTF8_FLAG = 0x0800
+VERSION_STORED = 20
+VERSION_ZIP64 = 45
+# Made by: Unix, spec 4.5; regular file rw-r--r--
+MADE_BY = (3 << 8) | VERSION_ZIP64
+EXTERNAL_ATTR = 0o100644 << 16
+
+
+def file_crc32(path: str) -> int:
+    crc = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b""):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def _dos_datetime(mtime: float):
+    t = time.localtime(mtime)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1  # 1980-01-01 00:00
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+def _unique_names(names):
+    """Suffix repeated archive names (`a.mp3`, `a (2).mp3`) so none overwrite."""
+    seen: dict[str, int] = {}
+    unique = []
+    for name in names:
+        key = name.lower()
+        if key in seen:
+            seen[key] += 1
+            stem, ext = os.path.splitext(name)
+            name = f"{stem} ({seen[key]}){ext}"
+        else:
+            seen[key] = 1
+        unique.append(name)
+    return unique
+
+
+def archive_entries(conn, files) -> list:
+    """Turn [(path, arcname)] into entry dicts with size, mtime and CRC32.
+
+    Sizes and CRCs come from `audio_files`; missing CRCs are computed once and
+    cached. Files that are gone are skipped.
+    """
+    paths = list(dict.fromkeys(path for path, _name in files))
+    known = {}
+    for i in range(0, len(paths), ID_CHUNK_SIZE):
+        chunk = paths[i : i + ID_CHUNK_SIZE]
+        for row in conn.execute(
+            f"SELECT path, size, mtime, crc32 FROM audio_files WHERE path IN ({','.join('?' for _ in chunk)})",
+            chunk,
+        ):
+            known[row["path"]] = dict(row)
+
+    entries, computed = [], []
+    for path, name in files:
+        info = known.get(path)
+        if info is None or info["crc32"] is None or info["mtime"] is None:
+            try:
+                st = os.stat(path)
+                info = {
+                    "path": path,
+                    "size": st.st_size,
+                    "mtime": st.st_mtime,
+                    "crc32": file_crc32(path),
+                }
+            except OSError as e:
+                print(f"[Zip] Skipping {name}: {e}")
+                continue
+            known[path] = info
+            computed.append((info["crc32"], path))
+        entries.append({**info, "name": name})
+
+    if computed:
+        writer.run(
+            lambda wconn: wconn.executemany(
+                "UPDATE audio_files SET crc32 = ? WHERE path = ?", computed
+            )
+        )
+    for entry, name in zip(entries, _unique_names(e["name"] for e in entries)):
+        entry["name"] = name
+    return entries
+
+
+def _local_record(entry) -> bytes:
+    name = entry["name"].encode("utf-8")
+    size, crc = entry["size"], entry["crc32"] & 0xFFFFFFFF
+    dos_time, dos_date = _dos_datetime(entry["mtime"])
+    big = size >= ZIP32_LIMIT
+    extra = (
+        ZIP64_EXTRA_HEADER.pack(1, 16) + struct.pack("<QQ", size, size) if big else b""
+    )
+    return (
+        LOCAL_HEADER.pack(
+            0x04034B50,
+            VERSION_ZIP64 if big else VERSION_STORED,
+            UTF8_FLAG,
+            0,
+            dos_time,
+            dos_date,
+            crc,
+            ZIP32_LIMIT if big else size,
+            ZIP32_LIMIT if big else size,
+            len(name),
+            len(extra),
+        )
+        + name
+        + extra
+    )
+
+
+def _central_record(entry, header_offset: int) -> bytes:
+    name = entry["name"].encode("utf-8")
+    size, crc = entry["size"], entry["crc32"] & 0xFFFFFFFF
+    dos_time, dos_date = _dos_datetime(entry["mtime"])
+    big = size >= ZIP32_LIMIT
+    fields = []
+    if big:
+        fields += [size, size]
+    if header_offset >= ZIP32_LIMIT:
+        fields.append(header_offset)
+    extra = (
+        ZIP64_EXTRA_HEADER.pack(1, 8 * len(fields))
+        + struct.pack(f"<{len(fields)}Q", *fields)
+        if fields
+        else b""
+    )
+    return (
+        CENTRAL_HEADER.pack(
+            0x02014B50,
+            MADE_BY,
+            VERSION_ZIP64 if fields else VERSION_STORED,
+            UTF8_FLAG,
+            0,
+            dos_time,
+            dos_date,
+            crc,
+            ZIP32_LIMIT if big else size,
+            ZIP32_LIMIT if big else size,
+            len(name),
+            len(extra),
+            0,
+            0,
+            0,
+            EXTERNAL_ATTR,
+            min(header_offset, ZIP32_LIMIT),
+        )
+        + name
+        + extra
+    )
+
+
+def _end_records(count: int, cd_offset: int, cd_size: int) -> bytes:
+    tail = b""
+    if count >= ZIP16_LIMIT or cd_offset >= ZIP32_LIMIT or cd_size >= ZIP32_LIMIT:
+        tail += ZIP64_END.pack(
+            0x06064B50,
+            ZIP64_END.size - 12,
+            MADE_BY,
+            VERSION_ZIP64,
+            0,
+            0,
+            count,
+            count,
+            cd_size,
+            cd_offset,
+        )
+        tail += ZIP64_LOCATOR.pack(0x07064B50, 0, cd_offset + cd_size, 1)
+    return tail + END.pack(
+        0x06054B50,
+        0,
+        0,
+        min(count, ZIP16_LIMIT),
+        min(count, ZIP16_LIMIT),
+        min(cd_size, ZIP32_LIMIT),
+        min(cd_offset, ZIP32_LIMIT),
+        0,
+    )
+
+
+def _read_file(path: str, start: int, stop: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            chunk = f.read(min(READ_CHUNK_SIZE, remaining))
+            if not chunk:
+                raise IOError(f"{path} is shorter than recorded")
+            remaining -= len(chunk)
+            yield chunk
+
+
+def text_entry(name: str, text: str) -> dict:
+    """An in-memory entry (e.g. a manifest) for ZipStream.add."""
+    data = text.encode("utf-8")
+    return {
+        "name": name,
+        "data": data,
+        "size": len(data),
+        "crc32": zlib.crc32(data),
+        "mtime": time.time(),
+    }
+
+
+class StoredZip:
+    """A ZIP archive laid out in advance, readable at any byte range."""
+
+    def __init__(self, entries: list):
+        self.entries = entries
+        # (offset, length, bytes) for records, (offset, length, path) for files
+        self._segments = []
+        self._starts = []
+        offset = 0
+        central = []
+
+        def add(segment, length):
+            nonlocal offset
+            if length:
+                self._starts.append(offset)
+                self._segments.append((offset, length, segment))
+                offset += length
+
+        for entry in entries:
+            central.append(_central_record(entry, offset))
+            local = _local_record(entry)
+            add(local, len(local))
+            add(entry["path"], entry["size"])
+
+        cd = b"".join(central)
+        cd += _end_records(len(entries), offset, len(cd))
+        add(cd, len(cd))
+        self.size = offset
+
+    @property
+    def etag(self) -> str:
+        """Changes whenever any entry's name, size or content changes."""
+        digest = hashlib.sha1()
+        for entry in self.entries:
+            digest.update(
+                f"{entry['name']}\0{entry['size']}\0{entry['crc32']}\0".encode("utf-8")
+            )
+        return digest.hexdigest()
+
+    def iter_bytes(self, start: int = 0, stop: int = None):
+        """Yield the archive bytes in [start, stop)."""
+        stop = self.size if stop is None else min(stop, self.size)
+        i = max(0, bisect.bisect_right(self._starts, start) - 1)
+        pos = start
+        while pos < stop and i < len(self._segments):
+            seg_start, length, segment = self._segments[i]
+            lo = pos - seg_start
+            hi = min(length, stop - seg_start)
+            if isinstance(segment, bytes):
+                yield segment[lo:hi]
+            else:
+                yield from _read_file(segment, lo, hi)
+            pos = seg_start + hi
+            i += 1
+
+
+# Bytes of each written entry held back to trickle out while waiting.
+HOLD_BACK_BYTES = 4096
+
+
+class ZipStream:
+    """A stored ZIP written entry by entry, for when files arrive over time.
+
+    `add` yields an entry's bytes; `keepalive` returns a byte to send while
+    nothing is ready, so proxies do not drop an idle response. Keep-alive bytes
+    are never filler inside the archive: before the first entry they are
+    leading padding (allowed, as for self-extracting archives), afterwards
+    they are the held-back tail of the last entry written.
+    """
+
+    def __init__(self):
+        self.offset = 0
+        self.count = 0
+        self._central = []
+        self._names: dict[str, int] = {}
+        self._held = bytearray()
+
+    def _unique(self, name: str) -> str:
+        key = name.lower()
+        if key not in self._names:
+            self._names[key] = 1
+            return name
+        self._names[key] += 1
+        stem, ext = os.path.splitext(name)
+        return self._unique(f"{stem} ({self._names[key]}){ext}")
+
+    def add(self, entry: dict):
+        entry = {**entry, "name": self._unique(entry["name"])}
+        self._central.append(_central_record(entry, self.offset))
+        self.count += 1
+        if self._held:
+            yield bytes(self._held)
+            self._held.clear()
+
+        chunks = [_local_record(entry)]
+        if "data" in entry:
+            chunks.append(entry["data"])
+        else:
+            chunks = itertools.chain(
+                chunks, _read_file(entry["path"], 0, entry["size"])
+            )
+        for chunk in chunks:
+            self.offset += len(chunk)
+            self._held += chunk
+            if len(self._held) > HOLD_BACK_BYTES:
+                yield bytes(self._held[:-HOLD_BACK_BYTES])
+                del self._held[:-HOLD_BACK_BYTES]
+
+    def keepalive(self) -> bytes:
+        if not self.count:
+            self.offset += 1
+            return b"\0"
+        if len(self._held) > 1:
+            byte = bytes(self._held[:1])
+            del self._held[:1]
+            return byte
+        return b""
+
+    def close(self) -> bytes:
+        cd = b"".join(self._central)
+        tail = bytes(self._held) + cd + _end_records(self.count, self.offset, len(cd))
+        self._held.clear()
+        return tail
@@ -0,0 +1,13 @@
+import os
+import shutil
+import sys
+import tempfile
+
+# Importing lib.db creates its data directories; keep them out of the repo.
+DATA_DIR = tempfile.mkdtemp(prefix="ytmp3-tests-")
+os.environ.setdefault("APP_DATA_DIR", DATA_DIR)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
@@ -0,0 +1,41 @@
+import pytest
+
+from lib.file_serving import parse_ranges
+
+SIZE = 1000
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("bytes=0-499", [(0, 500)]),
+        ("bytes=500-", [(500, 1000)]),  # open-ended
+        ("bytes=-200", [(800, 1000)]),  # suffix
+        ("bytes=-5000", [(0, 1000)]),  # suffix longer than the file
+        ("bytes=900-5000", [(900, 1000)]),  # end clamped to the file
+        ("bytes=0-0,-1", [(0, 1), (999, 1000)]),
+        ("bytes=500-599, 0-99", [(0, 100), (500, 600)]),  # unordered
+        ("bytes=0-199,100-299,300-399", [(0, 400)]),  # overlapping and adjacent
+        ("BYTES = 0-9", [(0, 10)]),
+    ],
+)
+def test_satisfiable(header, expected):
+    assert parse_ranges(header, SIZE) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=2000-3000", "bytes=-0"])
+def test_unsatisfiable(header):
+    assert parse_ranges(header, SIZE) == []
+
+
+@pytest.mark.parametrize(
+    "header",
+    ["", None, "items=0-1", "bytes=abc", "bytes=5", "bytes=9-3", "bytes=1-x"],
+)
+def test_ignored(header):
+    assert parse_ranges(header, SIZE) is None
+
+
+def test_empty_file():
+    assert parse_ranges("bytes=0-", 0) == []
+    assert parse_ranges("bytes=-10", 0) == []
@@ -0,0 +1,38 @@
+import numpy as np
+
+from lib.keys import KEY_LABELS, MAJOR_PROFILE, MINOR_PROFILE, estimate_keys
+
+
+def baseline_key(chroma_mean):
+    """The per-track loop estimate_keys replaced: np.corrcoef per rotation."""
+
+    def best_key(profile):
+        scores = [
+            np.corrcoef(chroma_mean, np.roll(profile, i))[0, 1] for i in range(12)
+        ]
+        best_index = int(np.nanargmax(scores))
+        return best_index, float(scores[best_index])
+
+    maj_index, maj_score = best_key(np.array(MAJOR_PROFILE))
+    min_index, min_score = best_key(np.array(MINOR_PROFILE))
+    pitch = [label.split()[0] for label in KEY_LABELS[:12]]
+    if maj_score >= min_score:
+        return f"{pitch[maj_index]} major", maj_score
+    return f"{pitch[min_index]} minor", min_score
+
+
+def test_matches_baseline_on_random_chroma():
+    chroma = np.random.default_rng(0).random((2000, 12))
+    for row, result in zip(chroma, estimate_keys(chroma)):
+        key, score = baseline_key(row)
+        assert result["key"] == key
+        assert result["confidence"] == round(score, 3)
+
+
+def test_single_vector_and_flat_chroma():
+    chroma = np.roll(MINOR_PROFILE, 9)  # A minor
+    assert estimate_keys(chroma)[0]["key"] == "A minor"
+    assert estimate_keys(chroma)[0]["camelot"] == "8A"
+    assert estimate_keys(np.ones(12)) == [
+        {"key": "unknown", "camelot": None, "confidence": None}
+    ]
@@ -0,0 +1,84 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from lib.zip_archive import StoredZip, ZipStream, file_crc32, text_entry
+
+
+@pytest.fixture
+def entries(tmp_path):
+    result = []
+    for i, size in enumerate([0, 1, 5000, 300_000]):
+        path = tmp_path / f"track{i}.mp3"
+        path.write_bytes(os.urandom(size))
+        st = os.stat(path)
+        result.append(
+            {
+                "path": str(path),
+                "name": f"Track {i} – ü.mp3",
+                "size": st.st_size,
+                "mtime": st.st_mtime,
+                "crc32": file_crc32(str(path)),
+            }
+        )
+    return result
+
+
+def check_archive(data: bytes, entries):
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist()[: len(entries)] == [e["name"] for e in entries]
+        for entry in entries:
+            with open(entry["path"], "rb") as f:
+                assert archive.read(entry["name"]) == f.read()
+
+
+def test_stored_zip(entries):
+    archive = StoredZip(entries)
+    data = b"".join(archive.iter_bytes())
+    assert len(data) == archive.size
+    check_archive(data, entries)
+
+
+def test_stored_zip_ranges(entries):
+    archive = StoredZip(entries)
+    data = b"".join(archive.iter_bytes())
+    for start, stop in [(0, 1), (10, 5000), (5000, archive.size), (123, 124)]:
+        assert b"".join(archive.iter_bytes(start, stop)) == data[start:stop]
+
+
+def test_stored_zip_etag_follows_content(entries):
+    changed = [dict(entries[0], crc32=entries[0]["crc32"] ^ 1)] + entries[1:]
+    assert StoredZip(entries).etag == StoredZip(list(entries)).etag
+    assert StoredZip(entries).etag != StoredZip(changed).etag
+
+
+def test_zip_stream_with_padding_and_keepalives(entries):
+    stream = ZipStream()
+    # Leading padding before the first entry, then held-back bytes between them
+    data = b"".join(stream.keepalive() for _ in range(3))
+    for entry in entries:
+        data += b"".join(stream.add(entry))
+        data += b"".join(stream.keepalive() for _ in range(5))
+    manifest = text_entry("FAILED.txt", "Track 9: unavailable\n")
+    data += b"".join(stream.add(manifest))
+    data += stream.close()
+
+    check_archive(data, entries)
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.read("FAILED.txt") == manifest["data"]
+
+
+def test_zip_stream_renames_duplicates(entries):
+    stream = ZipStream()
+    duplicate = dict(entries[2])
+    data = b"".join(stream.add(entries[2])) + b"".join(stream.add(duplicate))
+    data += stream.close()
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == [
+            "Track 2 – ü.mp3",
+            "Track 2 – ü (2).mp3",
+        ]
@@ -1,5 +1,16 @@
 import type { NextConfig } from "next";
 
+// The audio routes go to the backend's async proxy (aiohttp, started with
+// Flask on YTMP3_ASYNC_PORT, 5329 by default), which holds no thread per
+// listener. YTMP3_ASYNC_PORT=0 disables it and sends them to Flask instead;
+// AUDIO_PROXY_URL overrides both.
+const ASYNC_PORT = process.env.YTMP3_ASYNC_PORT || "5329";
+const AUDIO_BASE =
+  process.env.AUDIO_PROXY_URL ||
+  (ASYNC_PORT === "0"
+    ? "http://127.0.0.1:5328"
+    : `http://127.0.0.1:${ASYNC_PORT}`);
+
 const nextConfig: NextConfig = {
   /* config options here */
   output: "standalone",
@@ -20,7 +31,7 @@ const nextConfig: NextConfig = {
         source: "/api/youtube/download",
         // Destination path: The URL of the Flask backend endpoint
         // NOTE: Ensure the port (5328) matches the port in backend/app.py
-        destination: "http://127.0.0.1:5328/download",
+        destination: `${AUDIO_BASE}/download`,
       },
       {
         source: "/api/youtube/batch-zip",
@@ -28,7 +39,31 @@ const nextConfig: NextConfig = {
       },
       {
         source: "/api/youtube/download-mp3",
-        destination: "http://127.0.0.1:5328/download-mp3",
+        destination: `${AUDIO_BASE}/download-mp3`,
+      },
+      {
+        source: "/api/youtube/jobs",
+        destination: "http://127.0.0.1:5328/jobs",
+      },
+      {
+        source: "/api/youtube/jobs/:path*",
+        destination: "http://127.0.0.1:5328/jobs/:path*",
+      },
+      {
+        source: "/api/youtube/peaks/:id",
+        destination: "http://127.0.0.1:5328/peaks/:id",
+      },
+      {
+        source: "/api/youtube/videos/query",
+        destination: "http://127.0.0.1:5328/videos/query",
+      },
+      {
+        source: "/api/youtube/videos/:id/cues",
+        destination: "http://127.0.0.1:5328/videos/:id/cues",
+      },
+      {
+        source: "/api/youtube/progress/:id",
+        destination: "http://127.0.0.1:5328/progress/:id",
       },
       // Add other rewrites here if needed
     ];
@@ -10,9 +10,18 @@ export async function POST(request: Request) {
   try {
     const body = await request.json();
 
+    // Forward byte-range headers so an interrupted archive can resume
+    const upstreamHeaders: Record<string, string> = {
+      "Content-Type": "application/json",
+    };
+    for (const h of ["range", "if-range"]) {
+      const v = request.headers.get(h);
+      if (v) upstreamHeaders[h] = v;
+    }
+
     const upstream = await fetch(`${FLASK_BASE}/batch-zip`, {
       method: "POST",
-      headers: { "Content-Type": "application/json" },
+      headers: upstreamHeaders,
       body: JSON.stringify(body),
       // Do not use cache for long-running streaming responses
       cache: "no-store",
@@ -31,6 +40,9 @@ export async function POST(request: Request) {
     const passthrough = [
       "content-type",
       "content-length",
+      "content-range",
+      "accept-ranges",
+      "etag",
       "content-disposition",
       "cache-control",
       "pragma",
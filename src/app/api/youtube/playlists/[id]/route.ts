@@ -8,15 +8,25 @@ const FLASK_BASE = process.env.FLASK_BASE_URL || "http://127.0.0.1:5328";
 
 // Next.js 15: params for dynamic API routes must be awaited
 export async function GET(
-  _req: Request,
+  req: Request,
   context: { params: Promise<{ id: string }> }
 ) {
   try {
     const { id } = await context.params;
+    // Forward paging/format params (?limit, ?cursor, ?format=ndjson)
+    const { search } = new URL(req.url);
     const upstream = await fetch(
-      `${FLASK_BASE}/playlists/${encodeURIComponent(id)}`,
+      `${FLASK_BASE}/playlists/${encodeURIComponent(id)}${search}`,
       { cache: "no-store" }
     );
+    const contentType = upstream.headers.get("content-type") || "";
+    if (contentType.includes("application/x-ndjson") && upstream.body) {
+      // Pass the stream through untouched so rows reach the client as read
+      return new Response(upstream.body, {
+        status: upstream.status,
+        headers: { "Content-Type": contentType, "Cache-Control": "no-store" },
+      });
+    }
     const text = await upstream.text();
     let data: any;
     try {
@@ -40,7 +40,9 @@ export interface Video {
       end: number;
       label: string;
     }[];
-    cue_points?: { time: number; label: string }[];
+    // Beat times live server-side; see GET /api/youtube/videos/:id/cues
+    beat_count?: number;
+    first_beat?: number | null;
   };
 }
 
@@ -74,7 +76,7 @@ export default function HomePage() {
   const { selectedVideos, toggleSelection, deselectAll, selectAll } =
     useVideoSelection(videos);
 
-  const { handleBatchConversion, isConverting, progressState } =
+  const { handleBatchConversion, isConverting, progressState, overallProgress } =
     useBatchConversion(selectedVideos);
 
   const { mutate: analyze, isPending: isAnalyzing } = useAnalysis();
@@ -256,7 +258,9 @@ export default function HomePage() {
                   className="grow"
                 >
                   {isConverting
-                    ? "Processing..."
+                    ? overallProgress !== null
+                      ? `Processing ${(overallProgress * 100).toFixed(0)}%`
+                      : "Processing..."
                     : selectedVideos.length > 0
                     ? `Download ${selectedVideos.length}`
                     : "Download"}
@@ -21,12 +21,12 @@ const DEFAULT_CUES = Object.freeze([null, null, null, null] as (
 
 interface CustomAudioPlayerProps {
   waveformZoom?: number;
-  waveformMaxResolution?: number;
+  waveformMinResolution?: number;
 }
 
 const CustomAudioPlayer = ({
   waveformZoom,
-  waveformMaxResolution = 4096,
+  waveformMinResolution = 1024,
 }: CustomAudioPlayerProps) => {
   const zoomSmallWaveform = usePlayersStore((s) => s.zoomSmallWaveform);
   const setZoomSmallWaveform = usePlayersStore((s) => s.setZoomSmallWaveform);
@@ -169,7 +169,7 @@ const CustomAudioPlayer = ({
       <div className="h-12 bg-zinc-800/50 rounded-md relative">
         <Waveform
           zoom={waveformZoom ?? zoomSmallWaveform}
-          maxResolution={waveformMaxResolution}
+          minResolution={waveformMinResolution}
         />
       </div>
       <div className="flex items-center gap-4">
@@ -23,7 +23,8 @@ const SingleDownloadButton = ({
     setStatus("fetching");
 
     try {
-      // Fetch the final MP3 stream from the server
+      // Fetch the final MP3 from the server. No stream=1 here: the finished
+      // file has a Content-Length, so progress and resuming work.
       const response = await fetch(
         `/api/youtube/download-mp3?videoId=${videoId}`
       );
@@ -56,11 +56,11 @@ const VideoCard = ({
   return (
     <PlayerProvider
       id={video.id}
-      mp3Url={`/api/youtube/download-mp3?videoId=${video.id}`}
+      // Playback only: an unconverted track starts playing while it is being
+      // transcoded (no Content-Length, so no seeking until it is stored).
+      // Downloads ask for the finished file instead.
+      mp3Url={`/api/youtube/download-mp3?videoId=${video.id}&stream=1`}
       segments={video.analysis?.segments}
-      beats={(video.analysis?.cue_points || [])
-        .filter((c) => c.label === "beat")
-        .map((c) => c.time)}
     >
       <div
         key={video.id}
@@ -3,6 +3,7 @@
 import { memo, useEffect, useRef, useState } from "react";
 import { usePlayerId } from "@/lib/providers/player-provider";
 import { getPlayerRefs, usePlayersStore } from "@/lib/stores/players-store";
+import { useTrackCues } from "@/lib/hooks/use-track-cues";
 
 const CUE_COLORS = [
   "rgba(250, 204, 21, 0.7)",
@@ -20,11 +21,27 @@ const DEFAULT_CUES = Object.freeze([null, null, null, null] as (
 interface WaveformProps {
   // Zoom multiplier for horizontal detail. 1 = default. Higher shows more detail.
   zoom?: number;
-  // Upper bound for preprocessing resolution (number of averaged samples computed once).
-  maxResolution?: number;
+  // Lower bound for the number of peaks fetched, whatever the canvas width.
+  minResolution?: number;
 }
 
-const Waveform = ({ zoom, maxResolution = 4096 }: WaveformProps) => {
+interface Peaks {
+  // Per-peak amplitude, (max - min) / 2 scaled to 0..1
+  levels: Float32Array;
+  secondsPerPeak: number;
+}
+
+// Round peak requests up to a power of two so zooming refetches at most once
+// per doubling (the backend serves the coarsest level with enough peaks).
+const nextPow2 = (n: number) => 2 ** Math.ceil(Math.log2(Math.max(1, n)));
+
+// The peaks route answers 404 until the track is converted, 202 while its
+// peaks are being built and 503 while a failed build waits to be retried; all
+// are retried, up to this many times in a row.
+const MAX_PEAKS_RETRIES = 30;
+const PEAKS_POLL_MS = 5000;
+
+const Waveform = ({ zoom, minResolution = 1024 }: WaveformProps) => {
   const id = usePlayerId();
   // Select narrowly to avoid re-renders from unrelated track field updates
   const track = usePlayersStore((s) => s.tracks[id]);
@@ -33,6 +50,7 @@ const Waveform = ({ zoom, maxResolution = 4096 }: WaveformProps) => {
   const duration = track?.duration || 0;
   const segments = track?.segments;
   const beats = track?.beats;
+  const isPlaying = track?.isPlaying || false;
   const cuePoints = track?.cuePoints ?? DEFAULT_CUES;
   const setCue = usePlayersStore((s) => s.setCue);
   const seek = usePlayersStore((s) => s.seek);
@@ -41,11 +59,9 @@ const Waveform = ({ zoom, maxResolution = 4096 }: WaveformProps) => {
   const [loading, setLoading] = useState(true);
   const [width, setWidth] = useState(0);
   const prevWidthRef = useRef(0);
-  // High-resolution data computed once per track
-  const [fullResData, setFullResData] = useState<number[]>([]);
-  // Keep raw decoded buffer and channel data for per-frame high-res viewport sampling
-  const audioBufferRef = useRef<AudioBuffer | null>(null);
-  const channelDataRef = useRef<Float32Array | null>(null);
+  // Precomputed min/max peaks from the backend, at the resolution last needed
+  const [peaks, setPeaks] = useState<Peaks | null>(null);
+  const [peaksRetry, setPeaksRetry] = useState(0);
   const [draggingCuePoint, setDraggingCuePoint] = useState<number | null>(null);
   const [isDraggingPlayhead, setIsDraggingPlayhead] = useState(false);
   const [isHoveringPlayhead, setIsHoveringPlayhead] = useState(false);
@@ -70,62 +86,91 @@ const Waveform = ({ zoom, maxResolution = 4096 }: WaveformProps) => {
     }
   }, []);
 
+  const zoomLevel = (zoom ?? globalZoom) || 1;
+  const wantedPeaks = nextPow2(Math.max(minResolution, width * zoomLevel));
+
+  // The beat grid is only drawn when zoomed in; load it then or once playing
+  useTrackCues(id, !!mp3Url && (isPlaying || zoomLevel > 1));
+
   useEffect(() => {
-    if (!mp3Url) return;
+    if (!mp3Url || width <= 0) return;
+    // A finer level already loaded serves lower zoom levels as well
+    if (peaks && peaks.levels.length >= wantedPeaks) return;
+
+    const controller = new AbortController();
+    let retryTimer: ReturnType<typeof setTimeout> | null = null;
+    let retryAudio: HTMLAudioElement | null = null;
+    const retry = () => setPeaksRetry((n) => n + 1);
+    const scheduleRetry = (delayMs: number, onAudioReady: boolean) => {
+      if (peaksRetry >= MAX_PEAKS_RETRIES) {
+        console.warn(`Giving up on waveform peaks for ${id}`);
+        return false;
+      }
+      retryTimer = setTimeout(retry, delayMs);
+      // Playing a track converts it, so its peaks exist once the audio loads
+      if (onAudioReady) {
+        retryAudio = getPlayerRefs(id)?.audioEl ?? null;
+        retryAudio?.addEventListener("canplaythrough", retry, { once: true });
+      }
+      return true;
+    };
 
-    const processAudio = async () => {
-      setLoading(true);
+    const loadPeaks = async () => {
+      if (!peaks) setLoading(true);
       try {
-        const audioContext = new (window.AudioContext ||
-          // eslint-disable-next-line @typescript-eslint/no-explicit-any
-          (window as any).webkitAudioContext)();
-        const response = await fetch(mp3Url);
-        const arrayBuffer = await response.arrayBuffer();
-        const audioBuffer = await audioContext.decodeAudioData(arrayBuffer);
-
-        const channelData = audioBuffer.getChannelData(0);
-        const targetSamples = Math.max(
-          512,
-          Math.min(maxResolution, channelData.length)
+        const response = await fetch(
+          `/api/youtube/peaks/${encodeURIComponent(id)}?pixels=${wantedPeaks}`,
+          { signal: controller.signal }
         );
-        const sampleSize = Math.max(
-          1,
-          Math.floor(channelData.length / targetSamples)
-        );
-        const data: number[] = [];
-        for (let i = 0; i < targetSamples; i++) {
-          const start = i * sampleSize;
-          let sum = 0;
-          let count = 0;
-          for (
-            let j = 0;
-            j < sampleSize && start + j < channelData.length;
-            j++
+        if ([202, 404, 503].includes(response.status)) {
+          const retryAfter = Number(response.headers.get("Retry-After")) || 0;
+          const converted = response.status !== 404;
+          if (
+            scheduleRetry(
+              converted ? Math.max(1, retryAfter) * 1000 : PEAKS_POLL_MS,
+              !converted
+            )
           ) {
-            sum += Math.abs(channelData[start + j]);
-            count++;
+            return;
           }
-          data.push(count > 0 ? sum / count : 0);
         }
-        setFullResData(data);
-        audioBufferRef.current = audioBuffer;
-        // Copy to ensure underlying buffer is retained and safe for GC
-        channelDataRef.current = new Float32Array(channelData);
+        if (!response.ok) {
+          throw new Error(`Peaks request failed with ${response.status}`);
+        }
+        const samplesPerPeak = Number(
+          response.headers.get("X-Peaks-Samples-Per-Peak")
+        );
+        const sampleRate = Number(response.headers.get("X-Peaks-Sample-Rate"));
+        const pairs = new Int8Array(await response.arrayBuffer());
+        const levels = new Float32Array(pairs.length / 2);
+        for (let i = 0; i < levels.length; i++) {
+          levels[i] = (pairs[2 * i + 1] - pairs[2 * i]) / 254;
+        }
+        setPeaks({ levels, secondsPerPeak: samplesPerPeak / sampleRate });
+        setPeaksRetry(0);
       } catch (error) {
-        console.error("Error processing audio for waveform:", error);
+        if (!controller.signal.aborted) {
+          console.error("Error loading waveform peaks:", error);
+        }
       } finally {
-        setLoading(false);
+        if (!controller.signal.aborted && !retryTimer) setLoading(false);
       }
     };
 
-    processAudio();
-  }, [mp3Url, maxResolution]);
+    loadPeaks();
+    return () => {
+      controller.abort();
+      if (retryTimer) clearTimeout(retryTimer);
+      retryAudio?.removeEventListener("canplaythrough", retry);
+    };
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [id, mp3Url, width > 0, wantedPeaks, peaksRetry]);
 
-  // No-op: drawing happens against fullResData with a viewport slice derived per frame
+  // No-op: drawing happens against the peaks with a viewport slice derived per frame
 
   useEffect(() => {
     const canvas = canvasRef.current;
-    if (!canvas || fullResData.length === 0) return;
+    if (!canvas || !peaks) return;
 
     const dpr = window.devicePixelRatio || 1;
     canvas.width = Math.max(1, Math.floor(width * dpr));
@@ -147,40 +192,35 @@ const Waveform = ({ zoom, maxResolution = 4096 }: WaveformProps) => {
       effectiveZoom: number
     ) => {
       context.fillStyle = "#A1A1AA"; // zinc-400
-      const raw = channelDataRef.current;
-      const buffer = audioBufferRef.current;
-      if (!raw || !buffer || duration <= 0 || width <= 0) return;
+      const data = peaks.levels;
+      if (duration <= 0 || width <= 0) return;
 
-      const samplesPerSecond = buffer.sampleRate;
-      const startSample = Math.max(
+      const startPeak = Math.max(
         0,
-        Math.floor(viewportStart * samplesPerSecond)
+        Math.floor(viewportStart / peaks.secondsPerPeak)
       );
-      const endSample = Math.min(
-        raw.length,
-        Math.ceil((viewportStart + viewportDuration) * samplesPerSecond)
+      const endPeak = Math.min(
+        data.length,
+        Math.ceil((viewportStart + viewportDuration) / peaks.secondsPerPeak)
       );
-      const visibleSamples = Math.max(0, endSample - startSample);
-      if (visibleSamples <= 0) return;
+      const visiblePeaks = Math.max(0, endPeak - startPeak);
+      if (visiblePeaks <= 0) return;
 
       // One vertical bar per CSS pixel
       const bars = Math.max(10, Math.floor(width));
-      const samplesPerBar = Math.max(1, Math.floor(visibleSamples / bars));
+      const peaksPerBar = visiblePeaks / bars;
 
-      // First pass: compute per-bar RMS levels (robust against spikes)
+      // First pass: average the peak amplitudes under each bar
       const levels: number[] = new Array(bars);
       for (let i = 0; i < bars; i++) {
-        const s0 = startSample + i * samplesPerBar;
-        const s1 = Math.min(endSample, s0 + samplesPerBar);
-        let sumSq = 0;
-        let count = 0;
-        for (let s = s0; s < s1; s++) {
-          const v = raw[s];
-          sumSq += v * v;
-          count++;
-        }
-        const rms = count > 0 ? Math.sqrt(sumSq / count) : 0;
-        levels[i] = rms;
+        const p0 = startPeak + Math.floor(i * peaksPerBar);
+        const p1 = Math.min(
+          endPeak,
+          Math.max(p0 + 1, startPeak + Math.floor((i + 1) * peaksPerBar))
+        );
+        let sum = 0;
+        for (let p = p0; p < p1; p++) sum += data[p];
+        levels[i] = p1 > p0 ? sum / (p1 - p0) : 0;
       }
 
       // Robust normalization: use the 98th percentile level
@@ -424,7 +464,7 @@ const Waveform = ({ zoom, maxResolution = 4096 }: WaveformProps) => {
       audioEl?.removeEventListener("seeked", onSeeked);
     };
   }, [
-    fullResData,
+    peaks,
     width,
     segments,
     beats,
@@ -41,6 +41,7 @@ export const useAnalysis = () => {
     mutationFn: analyzeVideos,
     onSuccess: (data) => {
       queryClient.invalidateQueries({ queryKey: ["playlist-videos"] });
+      queryClient.invalidateQueries({ queryKey: ["video-cues"] });
     },
   });
 };
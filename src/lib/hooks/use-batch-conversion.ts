@@ -2,9 +2,111 @@ import { Video } from "@/app/page";
 import { useCallback, useState } from "react";
 import { useProgressStore } from "../stores/progress-store";
 
+// Per-item events from the backend's /progress/<id> Server-Sent Events stream
+interface BatchProgressEvent {
+  id: string;
+  stage:
+    | "queued"
+    | "extracting"
+    | "downloading"
+    | "transcoding"
+    | "done"
+    | "failed";
+  bytes?: number;
+  total?: number;
+}
+
+// Sent once the job is over: status is "completed" or "failed"
+interface BatchEndEvent {
+  status: string;
+}
+
+// How often the job is polled while the progress stream is disconnected
+const JOB_POLL_MS = 5000;
+
+// The stream owns per-item status and progress. `onFinished` counts items that
+// are done or failed; the returned promise settles with the job's final status.
+const followJob = (jobId: string, onFinished: (count: number) => void) => {
+  const source = new EventSource(`/api/youtube/progress/${jobId}`);
+  const store = useProgressStore.getState();
+  const finished = new Set<string>();
+  let connected = false;
+  let pollTimer: ReturnType<typeof setInterval> | null = null;
+
+  const result = new Promise<string>((resolve, reject) => {
+    const settle = (status: string) => {
+      if (pollTimer) clearInterval(pollTimer);
+      source.close();
+      resolve(status);
+    };
+    source.addEventListener("open", () => {
+      connected = true;
+    });
+    source.addEventListener("error", () => {
+      connected = false;
+    });
+    source.addEventListener("item", (e) => {
+      const event = JSON.parse((e as MessageEvent).data) as BatchProgressEvent;
+      switch (event.stage) {
+        case "extracting":
+          store.setStatus(event.id, "fetching");
+          break;
+        case "downloading":
+          store.setStatus(event.id, "downloading");
+          if (event.total) {
+            store.setProgress(
+              event.id,
+              Math.min(0.99, (event.bytes || 0) / event.total)
+            );
+          }
+          break;
+        case "transcoding":
+          store.setStatus(event.id, "converting");
+          break;
+        case "done":
+          store.setProgress(event.id, 1);
+          store.setStatus(event.id, "completed");
+          break;
+        case "failed":
+          store.setStatus(event.id, "failed");
+          break;
+      }
+      if (event.stage === "done" || event.stage === "failed") {
+        finished.add(event.id);
+        onFinished(finished.size);
+      }
+    });
+    source.addEventListener("end", (e) => {
+      const event = JSON.parse((e as MessageEvent).data) as BatchEndEvent;
+      settle(event.status);
+    });
+
+    // Events are lost while the stream is down; the job record is not
+    pollTimer = setInterval(async () => {
+      if (connected) return;
+      try {
+        const response = await fetch(`/api/youtube/jobs/${jobId}`);
+        if (!response.ok) return;
+        const { job } = await response.json();
+        if (job.status === "completed" || job.status === "failed") {
+          settle(job.status);
+        }
+      } catch (error) {
+        if (pollTimer) clearInterval(pollTimer);
+        source.close();
+        reject(error);
+      }
+    }, JOB_POLL_MS);
+  });
+
+  return result;
+};
+
 const useBatchConversion = (videos: Video[]) => {
   const [downloadUrl, setDownloadUrl] = useState<string | null>(null);
   const [isConverting, setIsConverting] = useState(false);
+  // Share of the items converted or failed (0 to 1), null before the job starts
+  const [overallProgress, setOverallProgress] = useState<number | null>(null);
   const progressState = useProgressStore((state) => state.progress);
 
   const handleBatchConversion = useCallback(async () => {
@@ -13,6 +115,7 @@ const useBatchConversion = (videos: Video[]) => {
     }
 
     setIsConverting(true);
+    setOverallProgress(null);
 
     try {
       // Initialize progress per video
@@ -29,7 +132,10 @@ const useBatchConversion = (videos: Video[]) => {
       const suggestedWorkers = Math.max(1, Math.floor(hw / 2));
       const maxWorkers = Math.min(8, suggestedWorkers, videos.length);
 
-      const response = await fetch(`/api/youtube/batch-zip`, {
+      // Convert as a background job, then let the browser download the stored
+      // archive with a plain GET: it has a Content-Length and supports ranges,
+      // so the browser shows real progress and can resume it.
+      const response = await fetch(`/api/youtube/jobs`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({
@@ -43,49 +149,32 @@ const useBatchConversion = (videos: Video[]) => {
         throw new Error(msg || "Batch request failed");
       }
 
-      const total = Number(response.headers.get("Content-Length") || 0);
-      const chunks: Uint8Array[] = [];
-      let downloaded = 0;
-
-      videos.forEach((v) =>
-        useProgressStore.getState().setStatus(v.id, "downloading")
+      const { id: jobId } = await response.json();
+      setOverallProgress(0);
+      const status = await followJob(jobId, (count) =>
+        setOverallProgress(count / videos.length)
       );
-
-      if (response.body) {
-        const reader = response.body.getReader();
-        while (true) {
-          const { value, done } = await reader.read();
-          if (done) break;
-          if (value) {
-            chunks.push(value);
-            downloaded += value.length;
-            const ratio = total > 0 ? downloaded / total : 0;
-            videos.forEach((v) =>
-              useProgressStore
-                .getState()
-                .setProgress(v.id, Math.min(0.99, ratio))
-            );
-          }
-        }
-      } else {
-        const blob = await response.blob();
-        chunks.push(new Uint8Array(await blob.arrayBuffer()));
+      if (status !== "completed") {
+        throw new Error("No items could be converted");
       }
 
-      const zipBlob = new Blob(chunks as BlobPart[], {
-        type: "application/zip",
-      });
-      const zipUrl = URL.createObjectURL(zipBlob);
-      setDownloadUrl(zipUrl);
+      const archiveUrl = `/api/youtube/jobs/${jobId}/archive`;
+      setDownloadUrl(archiveUrl);
 
       const link = document.createElement("a");
-      link.href = zipUrl;
-      link.download = "playlist.zip";
+      link.href = archiveUrl;
+      // Empty attribute: keep the file name from Content-Disposition
+      link.download = "";
       document.body.appendChild(link);
       link.click();
       document.body.removeChild(link);
 
+      setOverallProgress(1);
       videos.forEach((v) => {
+        // Items the stream reported as failed are missing from the ZIP
+        if (useProgressStore.getState().progress[v.id]?.status === "failed") {
+          return;
+        }
         useProgressStore.getState().setProgress(v.id, 1);
         useProgressStore.getState().setStatus(v.id, "completed");
       });
@@ -97,7 +186,13 @@ const useBatchConversion = (videos: Video[]) => {
     }
   }, [videos]);
 
-  return { handleBatchConversion, isConverting, downloadUrl, progressState };
+  return {
+    handleBatchConversion,
+    isConverting,
+    downloadUrl,
+    progressState,
+    overallProgress,
+  };
 };
 
 export default useBatchConversion;
@@ -1,4 +1,4 @@
-import { useQuery } from "@tanstack/react-query";
+import { useQuery, useQueryClient } from "@tanstack/react-query";
 import { Video } from "@/app/page";
 
 export interface PlaylistData {
@@ -15,16 +15,58 @@ export interface PlaylistData {
   videos: Video[];
 }
 
+// Minimum time between partial updates while the playlist streams in
+const PUBLISH_INTERVAL_MS = 150;
+
 export const useGetPlaylistVideos = (playlistId: string | null) => {
+  const queryClient = useQueryClient();
+  const queryKey = ["playlist-videos", playlistId];
+
   return useQuery<PlaylistData>({
-    queryKey: ["playlist-videos", playlistId],
+    queryKey,
     queryFn: async () => {
       if (!playlistId) return null;
-      const response = await fetch(`/api/youtube/playlists/${playlistId}`);
-      if (!response.ok) {
+      // NDJSON: a playlist line, then one line per video as the backend reads it
+      const response = await fetch(
+        `/api/youtube/playlists/${playlistId}?format=ndjson`
+      );
+      if (!response.ok || !response.body) {
         throw new Error("Network response was not ok");
       }
-      return response.json();
+
+      const reader = response.body
+        .pipeThrough(new TextDecoderStream())
+        .getReader();
+      let buffered = "";
+      let playlist: PlaylistData["playlist"] | null = null;
+      const videos: Video[] = [];
+      let lastPublish = 0;
+      for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffered += value;
+        const lines = buffered.split("\n");
+        buffered = lines.pop() ?? "";
+        for (const line of lines) {
+          if (!line.trim()) continue;
+          const row = JSON.parse(line);
+          if (row.playlist) playlist = row.playlist;
+          else if (row.video) videos.push(row.video);
+        }
+        // Show the first rows while the rest are still arriving
+        const now = Date.now();
+        if (playlist && now - lastPublish >= PUBLISH_INTERVAL_MS) {
+          lastPublish = now;
+          queryClient.setQueryData<PlaylistData>(queryKey, {
+            playlist,
+            videos: [...videos],
+          });
+        }
+      }
+      if (!playlist) {
+        throw new Error("Playlist response was empty");
+      }
+      return { playlist, videos };
     },
     enabled: !!playlistId,
     refetchOnWindowFocus: false,
@@ -0,0 +1,37 @@
+import { useEffect } from "react";
+import { useQuery } from "@tanstack/react-query";
+import { usePlayersStore } from "@/lib/stores/players-store";
+
+export interface VideoCues {
+  video_id: string;
+  beats: number[];
+  markers: { time: number; label: string }[];
+}
+
+// Beat grids are not part of the playlist payload; a player fetches its own
+// once it needs them and hands the beats to the players store.
+export const useTrackCues = (videoId: string, enabled: boolean) => {
+  const setTrackMeta = usePlayersStore((s) => s.setTrackMeta);
+  const query = useQuery<VideoCues>({
+    queryKey: ["video-cues", videoId],
+    queryFn: async () => {
+      const response = await fetch(
+        `/api/youtube/videos/${encodeURIComponent(videoId)}/cues`
+      );
+      if (!response.ok) {
+        throw new Error("Network response was not ok");
+      }
+      return response.json();
+    },
+    enabled,
+    staleTime: Infinity,
+    refetchOnWindowFocus: false,
+    refetchOnReconnect: false,
+  });
+
+  useEffect(() => {
+    if (query.data) setTrackMeta(videoId, { beats: query.data.beats });
+  }, [videoId, query.data, setTrackMeta]);
+
+  return query;
+};
@@ -2,7 +2,13 @@ import { create } from "zustand";
 
 interface VideoProgress {
   title: string;
-  status: "init" | "fetching" | "downloading" | "converting" | "completed";
+  status:
+    | "init"
+    | "fetching"
+    | "downloading"
+    | "converting"
+    | "completed"
+    | "failed";
   progress: number; // Progress percentage (0 to 1)
 }
 